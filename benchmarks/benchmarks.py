@@ -0,0 +1,225 @@
+"""Benchmarks for upt-macports.
+
+Benchmarks are written in the style of asv (https://asv.readthedocs.io/):
+classes whose time_* methods are timed, after calling setup() with each
+combination of PARAMS. They can be run without asv using run.py, which
+lives in the same directory.
+
+All inputs are synthetic and fixed, so that results can be compared across
+commits. No network access nor MacPorts installation is required.
+"""
+import io
+import os
+import shutil
+import tempfile
+
+import upt
+
+from corpus import Corpus
+from upt_macports import cpan
+from upt_macports import upt_macports
+from upt_macports.portfile_updater import PortfileUpdater
+from upt_macports.upt_macports import (MacPortsBackend, MacPortsPerlPackage,
+                                       MacPortsPythonPackage,
+                                       MacPortsRubyPackage)
+
+
+PKG_CLASSES = {
+    'pypi': MacPortsPythonPackage,
+    'cpan': MacPortsPerlPackage,
+    'rubygems': MacPortsRubyPackage,
+}
+ARCHIVES = {
+    'pypi': 'https://files.pythonhosted.org/packages/foo-bar-{version}.tar.gz',
+    'cpan': 'https://cpan.metacpan.org/authors/id/F/FO/FOO/Foo-Bar-{version}.tar.gz',  # noqa
+    'rubygems': 'https://rubygems.org/downloads/foo-bar-{version}.gem',
+}
+LICENSES = [
+    upt.licenses.BSDThreeClauseLicense(),
+    upt.licenses.MITLicense(),
+    upt.licenses.ApacheLicenseTwoDotZero(),
+    upt.licenses.GNUGeneralPublicLicenseThreePlus(),
+    upt.licenses.UnknownLicense(),
+]
+
+
+def make_package(frontend, version='1.0', n_requirements=20):
+    name = 'Foo::Bar' if frontend == 'cpan' else 'foo-bar'
+    upt_pkg = upt.Package(name, version, homepage='https://example.com/foo',
+                          summary='Frobnicate the bars',
+                          description='A package that frobnicates bars.\n'
+                                      'It is fast, and it is correct.')
+    upt_pkg.frontend = frontend
+    upt_pkg.licenses = LICENSES[:2]
+    upt_pkg.archives = [
+        upt.Archive(ARCHIVES[frontend].format(version=version),
+                    size=123456, rmd160='0' * 40, sha256='1' * 64),
+    ]
+    upt_pkg.requirements = {
+        phase: [upt.PackageRequirement(f'Dep::{phase}{i}', f'>={i}.0')
+                for i in range(n_requirements)]
+        for phase in ('build', 'run', 'test')
+    }
+    return upt_pkg
+
+
+def make_portfile(n_requirements, n_filler_lines):
+    """Return a Python Portfile, padded with N_FILLER_LINES comments."""
+    depends = ' \\\n'.join(
+        f'                    port:py${{python.version}}-dep::run{i}'
+        for i in range(n_requirements))
+    filler = ''.join(f'# Filler line {i}\n' for i in range(n_filler_lines))
+    return f'''\
+PortSystem          1.0
+PortGroup           python 1.0
+
+name                py-foo-bar
+version             1.0
+revision            3
+
+license             BSD
+description         Frobnicate the bars
+homepage            https://example.com/foo
+
+checksums           rmd160  {'2' * 40} \\
+                    sha256  {'3' * 64} \\
+                    size    1234
+
+{filler}
+python.versions     312
+
+if {{${{name}} ne ${{subport}}}} {{
+    depends_lib-append \\
+{depends}
+
+    livecheck.type      none
+}}
+'''
+
+
+class TimeRender:
+    params = sorted(PKG_CLASSES)
+    param_names = ['frontend']
+
+    def setup(self, frontend):
+        # The location of CPAN dist files is read from a local index.
+        fd, self.packages_path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('Line-Count: 1\n\n'
+                    'Foo::Bar 1.0 F/FO/FOO/Foo-Bar-1.0.tar.gz\n')
+        self.environ = os.environ.get('UPT_MACPORTS_CPAN_PACKAGES')
+        os.environ['UPT_MACPORTS_CPAN_PACKAGES'] = self.packages_path
+        self.pkg = PKG_CLASSES[frontend]()
+        self.pkg.upt_pkg = make_package(frontend)
+        self.pkg._render_makefile_template()  # Warm up the template cache
+
+    def teardown(self, frontend):
+        if self.environ is None:
+            del os.environ['UPT_MACPORTS_CPAN_PACKAGES']
+        else:
+            os.environ['UPT_MACPORTS_CPAN_PACKAGES'] = self.environ
+        cpan._load_packages_index.cache_clear()
+        os.unlink(self.packages_path)
+
+    def time_render(self, frontend):
+        self.pkg._render_makefile_template()
+
+
+class TimePortfileUpdater:
+    params = ['small', 'large']
+    param_names = ['portfile']
+
+    def setup(self, size):
+        if size == 'small':
+            self.portfile = make_portfile(5, 0)
+        else:
+            self.portfile = make_portfile(500, 20000)
+        old = make_package('pypi', '1.0', 0)
+        old.requirements = {
+            'run': [upt.PackageRequirement(f'Dep::run{i}')
+                    for i in range(500)],
+        }
+        new = make_package('pypi', '2.0', 0)
+        new.requirements = {
+            'run': [upt.PackageRequirement(f'Dep::run{i}')
+                    for i in range(1, 501)],
+        }
+        self.pdiff = upt.PackageDiff(old, new)
+
+    def time_update(self, size):
+        updater = PortfileUpdater(io.StringIO(self.portfile), self.pdiff,
+                                  MacPortsPythonPackage)
+        updater.update()
+
+
+class TimeStandardizeCPANVersion:
+    """The normalization of CPAN versions, which is memoized.
+
+    The cache is cleared before each call, and all the versions are
+    distinct, so that the normalization itself is measured rather than cache
+    hits.
+    """
+    versions = [f'{prefix}{major}{fraction}'
+                for major in range(100)
+                for prefix, fraction in [('', '.2'), ('v', '.2.3'),
+                                         ('', '.001002'), ('', '.2301'),
+                                         ('', ''), ('', '.0401'),
+                                         ('', '.1234567')]]
+
+    def setup(self):
+        upt_macports._standardize_CPAN_version.cache_clear()
+
+    def time_standardize_CPAN_version(self):
+        upt_macports._standardize_CPAN_version.cache_clear()
+        for version in self.versions:
+            MacPortsBackend.standardize_CPAN_version(version)
+
+    def time_standardize_CPAN_versions(self):
+        upt_macports._standardize_CPAN_version.cache_clear()
+        MacPortsBackend.standardize_CPAN_versions(self.versions)
+
+
+class TimeLicenses:
+    def setup(self):
+        self.pkg = MacPortsPythonPackage()
+        self.pkg.upt_pkg = make_package('pypi')
+        self.pkg.upt_pkg.licenses = LICENSES * 20
+        self.pkg.logger.disabled = True
+
+    def teardown(self):
+        self.pkg.logger.disabled = False
+
+    def time_licenses(self):
+        self.pkg.licenses
+
+
+class TimeCorpus:
+    """Batch operations on a synthetic corpus, see corpus.py."""
+    params = [500]
+    param_names = ['packages']
+
+    def setup(self, n_packages):
+        self.tmpdir = tempfile.mkdtemp()
+        self.corpus = Corpus(n_packages)
+        self.corpus.write(self.tmpdir, max_workers=1)
+        self.ports_tree = os.path.join(self.tmpdir, 'ports')
+        self.portindex = os.path.join(self.tmpdir, 'PortIndex')
+        self.names = [upt_pkg.name for upt_pkg in self.corpus.packages]
+        self.pdiffs = self.corpus.pdiffs()
+
+    def teardown(self, n_packages):
+        shutil.rmtree(self.tmpdir)
+
+    def time_package_versions_many(self, n_packages):
+        backend = MacPortsBackend()
+        backend.portindex_path = self.portindex
+        backend.frontend = 'pypi'
+        backend.logger.disabled = True
+        try:
+            backend.package_versions_many(self.names)
+        finally:
+            backend.logger.disabled = False
+
+    def time_update_packages_dry_run(self, n_packages):
+        backend = MacPortsBackend()
+        backend.update_packages(self.pdiffs, self.ports_tree, dry_run=True)
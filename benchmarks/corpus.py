@@ -0,0 +1,298 @@
+"""Generate a synthetic corpus of packages, for scale testing.
+
+    python benchmarks/corpus.py --packages 10000 --frontend pypi OUTPUT_DIR
+
+A corpus is made of N upt.Package objects, with realistic requirement
+fan-out and license mixes. Most of them are "already packaged": an older
+version of each of them is part of a fake ports tree, which is written to
+OUTPUT_DIR along with:
+    - a PortIndex of the ports tree;
+    - a fake "port" executable answering "port info" from that PortIndex;
+    - a 02packages.details.txt index of the CPAN packages.
+Nothing requires network access nor a MacPorts installation. The corpus
+only depends on its parameters (including the random SEED), so it can be
+generated again on another machine.
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import random
+import stat
+import sys
+
+import upt
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(_HERE))
+
+from upt_macports.upt_macports import MacPortsBackend  # noqa: E402
+
+
+# Licenses, along with their relative frequency
+LICENSE_MIX = [
+    (upt.licenses.MITLicense, 35),
+    (upt.licenses.BSDThreeClauseLicense, 20),
+    (upt.licenses.ApacheLicenseTwoDotZero, 15),
+    (upt.licenses.GNUGeneralPublicLicenseThreePlus, 8),
+    (upt.licenses.PerlLicense, 6),
+    (upt.licenses.ISCLicense, 4),
+    (upt.licenses.BSDTwoClauseLicense, 4),
+    (upt.licenses.RubyLicense, 3),
+    (upt.licenses.UnknownLicense, 5),
+]
+ARCHIVES = {
+    'pypi': ('https://files.pythonhosted.org/packages/source/{name}-{version}.tar.gz',  # noqa
+             upt.ArchiveType.SOURCE_TARGZ),
+    'cpan': ('https://cpan.metacpan.org/authors/id/S/SY/SYNTH/{name}-{version}.tar.gz',  # noqa
+             upt.ArchiveType.SOURCE_TARGZ),
+    'rubygems': ('https://rubygems.org/downloads/{name}-{version}.gem',
+                 upt.ArchiveType.RUBYGEM),
+}
+# Average number of requirements for each phase
+FAN_OUT = {'build': 1.5, 'run': 4, 'test': 2}
+
+FAKE_PORT = '''\
+#!{python}
+"""A fake "port" executable, only supporting "port -p info --name --version".
+"""
+import sys
+
+sys.path.insert(0, {package_dir!r})
+from upt_macports.portindex import PortIndex
+
+index = PortIndex({portindex!r})
+names = [arg for arg in sys.argv[1:] if not arg.startswith('-')][1:]
+for i, name in enumerate(names):
+    if i:
+        print('--')
+    version = index.version(name)
+    if version is None:
+        print(f'Error: Port {{name}} not found')
+    else:
+        print(f'name: {{name}}')
+        print(f'version: {{version}}')
+'''
+
+
+def _module_name(frontend, i):
+    if frontend == 'cpan':
+        return f'Synth::Module{i:06d}'
+    elif frontend == 'rubygems':
+        return f'synth_gem{i:06d}'
+    return f'synth-pkg{i:06d}'
+
+
+def _hexdigest(algorithm, *parts):
+    return hashlib.new(algorithm, '-'.join(parts).encode()).hexdigest()
+
+
+class Corpus:
+    """A synthetic corpus of N_PACKAGES packages of FRONTEND.
+
+    PACKAGED_RATIO of the packages have a port, whose version is older than
+    that of the package. The requirements of a package are picked among the
+    packages that come before it, so that the dependency graph has no cycles,
+    popular packages being more likely to be picked, so that the graph looks
+    like that of a real package archive.
+    """
+    def __init__(self, n_packages, frontend='pypi', seed=0,
+                 packaged_ratio=0.9):
+        self.frontend = frontend
+        self.pkg_class = MacPortsBackend.pkg_classes[frontend]
+        rng = random.Random(seed)
+        names = [_module_name(frontend, i) for i in range(n_packages)]
+        # A Zipf-like popularity: package #i is picked with a weight of
+        # 1/(i+1). Cumulative weights are computed once, and only the first
+        # i of them are used to pick the requirements of package #i.
+        cum_weights = list(itertools.accumulate(
+            1 / (i + 1) for i in range(n_packages)))
+        licenses, license_weights = zip(*LICENSE_MIX)
+        license_cum_weights = list(itertools.accumulate(license_weights))
+
+        self.packages = []
+        self.old_packages = {}
+        for i, name in enumerate(names):
+            major, minor = rng.randrange(10), rng.randrange(30)
+            upt_pkg = self._make_package(name, f'{major}.{minor}.1')
+            upt_pkg.licenses = [
+                license_cls()
+                for license_cls in rng.choices(
+                    licenses, cum_weights=license_cum_weights,
+                    k=1 + (rng.random() < 0.1))
+            ]
+            upt_pkg.requirements = {}
+            for phase, fan_out in FAN_OUT.items():
+                n = min(int(rng.expovariate(1 / fan_out)), i)
+                # Like rng.choices(names[:i], cum_weights=cum_weights[:i]),
+                # without copying these lists for each package.
+                deps = {
+                    names[bisect.bisect(cum_weights,
+                                        rng.random() * cum_weights[i - 1],
+                                        0, i - 1)]
+                    for _ in range(n)
+                }
+                if deps:
+                    upt_pkg.requirements[phase] = [
+                        upt.PackageRequirement(
+                            dep, f'>={rng.randrange(3)}.0'
+                            if rng.random() < 0.3 else '')
+                        for dep in sorted(deps)
+                    ]
+            self.packages.append(upt_pkg)
+
+            if rng.random() < packaged_ratio:
+                old_pkg = self._make_package(name, f'{major}.{minor}.0')
+                old_pkg.licenses = upt_pkg.licenses
+                old_pkg.requirements = {
+                    phase: requirements[:-1]
+                    for phase, requirements in upt_pkg.requirements.items()
+                }
+                self.old_packages[name] = old_pkg
+
+    def _make_package(self, name, version):
+        upt_pkg = upt.Package(name, version,
+                              homepage=f'https://example.com/{name}',
+                              summary=f'Synthetic package {name}',
+                              description=f'{name} was generated for scale '
+                                          'testing.\nIt does nothing.')
+        upt_pkg.frontend = self.frontend
+        url, archive_type = ARCHIVES[self.frontend]
+        dist_name = name.replace('::', '-')
+        upt_pkg.archives = [
+            upt.Archive(url.format(name=dist_name, version=version),
+                        archive_type,
+                        size=len(name) * 1000 + len(version),
+                        rmd160=_hexdigest('sha1', name, version),
+                        sha256=_hexdigest('sha256', name, version)),
+        ]
+        return upt_pkg
+
+    def folder(self, name):
+        return self.pkg_class._normalized_macports_folder(name)
+
+    def pdiffs(self):
+        """Return a PackageDiff for each package that has a port."""
+        return [upt.PackageDiff(self.old_packages[upt_pkg.name], upt_pkg)
+                for upt_pkg in self.packages
+                if upt_pkg.name in self.old_packages]
+
+    def write_cpan_packages(self, path):
+        """Write an index of the CPAN dists of the corpus at PATH."""
+        with open(path, 'w') as f:
+            f.write(f'Line-Count: {len(self.packages)}\n\n')
+            for upt_pkg in self.packages:
+                for pkg in (upt_pkg, self.old_packages.get(upt_pkg.name)):
+                    if pkg is None:
+                        continue
+                    archive_name = pkg.archives[0].url.split('/')[-1]
+                    f.write(f'{pkg.name} {pkg.version} '
+                            f'S/SY/SYNTH/{archive_name}\n')
+
+    def write_ports_tree(self, root, max_workers=None):
+        """Write the Portfiles of the packaged packages in ROOT.
+
+        Portfiles are rendered by the backend itself, so this takes a while
+        for large corpora. The warnings of the backend (about unknown
+        licenses, for instance) are silenced. Return the BatchResult of the
+        backend.
+        """
+        environ = os.environ.get('UPT_MACPORTS_CPAN_PACKAGES')
+        if self.frontend == 'cpan':
+            # Only while rendering: the environment is restored afterwards.
+            cpan_packages = os.path.join(os.path.dirname(root) or '.',
+                                         '02packages.details.txt')
+            self.write_cpan_packages(cpan_packages)
+            os.environ['UPT_MACPORTS_CPAN_PACKAGES'] = cpan_packages
+        logger = logging.getLogger('upt')
+        disabled, logger.disabled = logger.disabled, True
+        try:
+            return MacPortsBackend().create_packages(
+                self.old_packages.values(), root, max_workers)
+        finally:
+            logger.disabled = disabled
+            if environ is None:
+                os.environ.pop('UPT_MACPORTS_CPAN_PACKAGES', None)
+            else:
+                os.environ['UPT_MACPORTS_CPAN_PACKAGES'] = environ
+
+    def write_portindex(self, path):
+        """Write a PortIndex of the packaged packages at PATH."""
+        with open(path, 'wb') as f:
+            for old_pkg in self.old_packages.values():
+                folder = self.folder(old_pkg.name)
+                depends = {
+                    phase: ' '.join(
+                        f'port:{self.folder(req.name)}'
+                        for req in old_pkg.requirements.get(upt_phase, []))
+                    for phase, upt_phase in [('build', 'build'),
+                                             ('lib', 'run'),
+                                             ('test', 'test')]
+                }
+                # Like the real PortIndex, records contain non-ASCII
+                # characters, and their length is counted in characters.
+                record = (f'name {folder} '
+                          f'portdir {self.pkg_class.category}/{folder} '
+                          f'version {old_pkg.version} '
+                          f'description {{Port synthétique — {folder}}} '
+                          f'depends_build {{{depends["build"]}}} '
+                          f'depends_lib {{{depends["lib"]}}} '
+                          f'depends_test {{{depends["test"]}}}\n')
+                f.write(f'{folder} {len(record)}\n{record}'.encode('utf-8'))
+
+    def write_port_executable(self, path, portindex_path):
+        """Write a fake "port" executable, reading PORTINDEX_PATH, at PATH."""
+        import upt_macports
+        package_dir = os.path.dirname(os.path.dirname(
+            os.path.abspath(upt_macports.__file__)))
+        portindex_path = os.path.abspath(portindex_path)
+        with open(path, 'w') as f:
+            f.write(FAKE_PORT.format(python=sys.executable,
+                                     package_dir=package_dir,
+                                     portindex=portindex_path))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP |
+                 stat.S_IXOTH)
+
+    def write(self, output_dir, max_workers=None):
+        """Write the ports tree, the PortIndex and "port" in OUTPUT_DIR."""
+        ports = os.path.join(output_dir, 'ports')
+        portindex = os.path.join(output_dir, 'PortIndex')
+        bin_dir = os.path.join(output_dir, 'bin')
+        os.makedirs(ports, exist_ok=True)
+        os.makedirs(bin_dir, exist_ok=True)
+        result = self.write_ports_tree(ports, max_workers)
+        self.write_portindex(portindex)
+        self.write_port_executable(os.path.join(bin_dir, 'port'), portindex)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--packages', type=int, default=10000)
+    parser.add_argument('--frontend', default='pypi',
+                        choices=sorted(MacPortsBackend.pkg_classes))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--packaged-ratio', type=float, default=0.9)
+    parser.add_argument('--max-workers', type=int)
+    args = parser.parse_args()
+
+    corpus = Corpus(args.packages, args.frontend, args.seed,
+                    args.packaged_ratio)
+    result = corpus.write(args.output_dir, args.max_workers)
+    output_dir = os.path.abspath(args.output_dir)
+    print(f'Ports tree: {result.summary()}')
+    print('To use the corpus:')
+    print(f'  export PATH={output_dir}/bin:$PATH')
+    print(f'  export UPT_MACPORTS_PORTINDEX={output_dir}/PortIndex')
+    print(f'  export UPT_MACPORTS_PORTS_TREE={output_dir}/ports')
+    if args.frontend == 'cpan':
+        print('  export UPT_MACPORTS_CPAN_PACKAGES='
+              f'{output_dir}/02packages.details.txt')
+
+
+if __name__ == '__main__':
+    main()
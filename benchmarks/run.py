@@ -0,0 +1,126 @@
+"""Run the benchmarks of benchmarks.py, and save the results.
+
+    python benchmarks/run.py [-k PATTERN] [--compare RESULTS.json]
+
+Results are saved as JSON in .benchmarks/, one file per run, named after
+the current commit. When --compare is given, the benchmarks that got slower
+than THRESHOLD times the previous results are reported, and the exit status
+is 1.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+# Benchmark the checkout this script is part of.
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [_HERE, os.path.dirname(_HERE)]
+
+import benchmarks  # noqa: E402
+
+
+def _suites():
+    for name, suite in sorted(vars(benchmarks).items()):
+        if isinstance(suite, type) and name.startswith('Time'):
+            yield name, suite
+
+
+def _params(suite):
+    params = getattr(suite, 'params', [])
+    if params and not isinstance(params[0], list):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def run_benchmark(suite, method, params, repeat):
+    """Return the best time of one call to METHOD, in seconds."""
+    instance = suite()
+    if hasattr(instance, 'setup'):
+        instance.setup(*params)
+    try:
+        timer = timeit.Timer(lambda: getattr(instance, method)(*params))
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat, number)) / number
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*params)
+
+
+def run(pattern=None, repeat=5):
+    results = {}
+    for suite_name, suite in _suites():
+        methods = sorted(m for m in dir(suite) if m.startswith('time_'))
+        for method, params in itertools.product(methods, _params(suite)):
+            name = f'{suite_name}.{method}'
+            if params:
+                name += f'({", ".join(map(str, params))})'
+            if pattern and pattern not in name:
+                continue
+            results[name] = run_benchmark(suite, method, params, repeat)
+            print(f'{name:60} {results[name] * 1e6:12.1f} us')
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=_HERE, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, previous, threshold):
+    """Print the benchmarks that got slower, and return how many did."""
+    regressions = 0
+    for name, seconds in sorted(results.items()):
+        if name not in previous['results']:
+            continue
+        ratio = seconds / previous['results'][name]
+        if ratio > threshold:
+            regressions += 1
+            print(f'SLOWER {name}: {ratio:.2f}x ({previous["commit"]} -> '
+                  f'{_commit()})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run the benchmarks matching PATTERN')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output-dir', default='.benchmarks')
+    parser.add_argument('--compare', metavar='RESULTS.json',
+                        help='compare with previously saved results')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    results = run(args.pattern, args.repeat)
+    commit = _commit()
+    os.makedirs(args.output_dir, exist_ok=True)
+    date = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    path = os.path.join(args.output_dir, f'{date}-{commit}.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'date': date,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print(f'Results saved in {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,32 @@
+import os
+import shutil
+import sys
+
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class BuildPy(build_py):
+    """Also compile the Portfile templates into Python modules.
+
+    This saves upt the parsing and compilation of the templates every time it
+    is run. When the compiled templates are missing, as in a development
+    checkout, or stale, the templates themselves are used instead.
+    """
+    def run(self):
+        super().run()
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        try:
+            from upt_macports import templating
+        except ImportError as e:
+            self.warn(f'not compiling the Portfile templates: {e}')
+            return
+        target = os.path.join(self.build_lib, 'upt_macports',
+                              'compiled_templates')
+        self.announce(f'compiling the Portfile templates to {target}', 2)
+        if not self.dry_run:
+            shutil.rmtree(target, ignore_errors=True)
+            templating.compile_templates(target)
+
 
-setup()
+setup(cmdclass={'build_py': BuildPy})
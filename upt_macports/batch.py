@@ -0,0 +1,263 @@
+import collections
+import concurrent.futures
+import functools
+import logging
+import os
+
+from upt_macports import cpan
+from upt_macports.portfile_updater import PortfileUpdater
+
+
+class BatchResult:
+    '''The outcome of an operation performed on many packages.
+
+    SUCCEEDED maps packages to the path of their Portfile (None if it was
+    printed), and FAILED maps packages to an error message. Packages are
+    identified by their name, or by a (frontend, name) tuple when packages of
+    several frontends may be involved.
+    '''
+    def __init__(self):
+        self.succeeded = {}
+        self.failed = {}
+
+    def __len__(self):
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def summary(self):
+        return f'{len(self.succeeded)} succeeded, {len(self.failed)} failed'
+
+    def __str__(self):
+        lines = [self.summary()]
+        for key, error in sorted(self.failed.items()):
+            lines.append(f'  {_format_key(key)}: {error}')
+        return '\n'.join(lines)
+
+
+class UpdateReport(BatchResult):
+    '''The outcome of updating many Portfiles.
+
+    SUCCEEDED (also available as CHANGED) and UNCHANGED map packages,
+    identified by (frontend, name) tuples, to the path of their Portfile. In
+    dry-run mode, DIFFS maps the packages whose Portfile would change to a
+    unified diff of the changes.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.unchanged = {}
+        self.diffs = {}
+
+    @property
+    def changed(self):
+        return self.succeeded
+
+    def __len__(self):
+        return super().__len__() + len(self.unchanged)
+
+    def summary(self):
+        return (f'{len(self.changed)} changed, '
+                f'{len(self.unchanged)} unchanged, '
+                f'{len(self.failed)} failed')
+
+
+def _format_key(key):
+    if isinstance(key, tuple):
+        frontend, name = key
+        return f'{name} ({frontend})'
+    return key
+
+
+def _error_message(exc):
+    if isinstance(exc, SystemExit):
+        return str(exc.code)
+    return f'{type(exc).__name__}: {exc}'
+
+
+def _create_package(pkg_cls, upt_pkg, output, known_dists=None):
+    '''Create the Portfile of UPT_PKG in OUTPUT, and return its path.
+
+    If OUTPUT is None, the Portfile is printed and None is returned.
+    KNOWN_DISTS are the results of cpan.probe_dists() that are relevant to
+    UPT_PKG. This runs in a worker, possibly in another process.
+    '''
+    if known_dists:
+        cpan.remember_dists(known_dists)
+    packager = pkg_cls()
+    packager.create_package(upt_pkg, output)
+    if output is None:
+        return None
+    return os.path.join(packager.output_dir, 'Portfile')
+
+
+def _executor(use_processes, max_workers):
+    if use_processes:
+        return concurrent.futures.ProcessPoolExecutor(max_workers)
+    return concurrent.futures.ThreadPoolExecutor(max_workers)
+
+
+def create_packages(jobs, output, max_workers=None, use_processes=True):
+    '''Create many Portfiles in parallel.
+
+    JOBS is an iterable of (pkg_cls, upt_pkg, known_dists) tuples, see
+    _create_package(). Results are keyed by (frontend, name) tuples.
+    Failures are isolated: an error while creating a package is recorded in
+    the returned BatchResult and does not prevent other packages from being
+    created.
+    '''
+    result = BatchResult()
+    with _executor(use_processes, max_workers) as executor:
+        futures = {
+            executor.submit(_create_package, pkg_cls, upt_pkg, output,
+                            known_dists):
+            (upt_pkg.frontend, upt_pkg.name)
+            for pkg_cls, upt_pkg, known_dists in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                result.succeeded[key] = future.result()
+            except (Exception, SystemExit) as e:
+                result.failed[key] = _error_message(e)
+    return result
+
+
+def _update_portfile(pkg_cls, pdiff, portfile_path):
+    '''Update the Portfile at PORTFILE_PATH.
+
+    Return True if the Portfile was modified, False if it was already up to
+    date.
+    '''
+    with open(portfile_path, encoding='utf-8') as f:
+        return PortfileUpdater(f, pdiff, pkg_cls).update()
+
+
+def _diff_portfile(pkg_cls, pdiff, portfile_path, root='.'):
+    '''Return a unified diff of the update of the Portfile at PORTFILE_PATH.
+
+    The Portfile is not modified. The path in the headers of the diff is
+    relative to ROOT.
+    '''
+    with open(portfile_path, encoding='utf-8') as f:
+        updater = PortfileUpdater(f, pdiff, pkg_cls)
+        return updater.diff(os.path.relpath(portfile_path, root))
+
+
+def update_portfiles(jobs, max_workers=None, report=None, dry_run=False,
+                     root='.'):
+    '''Update many Portfiles concurrently.
+
+    JOBS is an iterable of (pkg_cls, pdiff, portfile_path) tuples. Updating a
+    Portfile is mostly I/O, so this uses a pool of at most MAX_WORKERS
+    threads. If DRY_RUN is True, Portfiles are not modified, and the changes
+    are stored in the DIFFS attribute of the report instead, as diffs
+    relative to ROOT. Results are keyed by (frontend, name) tuples, and added
+    to REPORT (a new UpdateReport by default), which is returned.
+    '''
+    if report is None:
+        report = UpdateReport()
+    if dry_run:
+        update = functools.partial(_diff_portfile, root=root)
+    else:
+        update = _update_portfile
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(update, pkg_cls, pdiff, path):
+            ((pdiff.new.frontend, pdiff.new.name), path)
+            for pkg_cls, pdiff, path in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            key, path = futures[future]
+            try:
+                result = future.result()
+                if result:
+                    report.changed[key] = path
+                    if dry_run:
+                        report.diffs[key] = result
+                else:
+                    report.unchanged[key] = path
+            except (Exception, SystemExit) as e:
+                report.failed[key] = _error_message(e)
+    return report
+
+
+def update_portfiles_in_order(jobs, dependencies, max_workers=None,
+                              report=None):
+    '''Update many Portfiles concurrently, dependencies first.
+
+    JOBS is as in update_portfiles(). DEPENDENCIES maps packages, identified
+    by (frontend, name) tuples, to the packages they depend on; only
+    dependencies that are part of JOBS are taken into account. A Portfile is
+    updated as soon as the Portfiles of all its dependencies have been, using
+    a pool of at most MAX_WORKERS threads. If updating a Portfile fails, the
+    Portfiles of the packages that depend on it, directly or not, are not
+    updated at all. Results are added to REPORT (a new UpdateReport by
+    default), which is returned.
+    '''
+    logger = logging.getLogger('upt')
+    if report is None:
+        report = UpdateReport()
+    jobs = {(pdiff.new.frontend, pdiff.new.name): (pkg_cls, pdiff, path)
+            for pkg_cls, pdiff, path in jobs}
+    # For each package that has not been submitted yet, the dependencies
+    # that have not been updated yet.
+    waiting = {key: set(dependencies.get(key, ())) & jobs.keys() - {key}
+               for key in jobs}
+    dependents = collections.defaultdict(set)
+    for key, deps in waiting.items():
+        for dep in deps:
+            dependents[dep].add(key)
+
+    def skip_dependents(key):
+        queue = [key]
+        while queue:
+            dep = queue.pop()
+            for dependent in sorted(dependents[dep]):
+                if dependent in waiting:
+                    del waiting[dependent]
+                    report.failed[dependent] = (
+                        f'Not updated: {_format_key(key)} could not be '
+                        'updated')
+                    queue.append(dependent)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        running = {}
+        ready = sorted(key for key, deps in waiting.items() if not deps)
+        while True:
+            for key in ready:
+                del waiting[key]
+                future = executor.submit(_update_portfile, *jobs[key])
+                running[future] = key
+            if not running:
+                if not waiting:
+                    break
+                # Only packages that are part of a dependency cycle are left.
+                ready = [min(waiting)]
+                logger.warning('Dependency cycle involving '
+                               f'{_format_key(ready[0])}')
+                continue
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            ready = []
+            for future in done:
+                key = running.pop(future)
+                path = jobs[key][2]
+                try:
+                    if future.result():
+                        report.changed[key] = path
+                    else:
+                        report.unchanged[key] = path
+                except (Exception, SystemExit) as e:
+                    report.failed[key] = _error_message(e)
+                    skip_dependents(key)
+                    continue
+                for dependent in sorted(dependents[key]):
+                    deps = waiting.get(dependent)
+                    if deps is not None:
+                        deps.discard(key)
+                        if not deps:
+                            ready.append(dependent)
+    return report
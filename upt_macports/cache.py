@@ -0,0 +1,178 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from upt_macports.files import write_file
+from upt_macports.instrumentation import stats
+
+
+def user_cache_dir(*parts):
+    '''Return the path to the upt-macports cache directory.
+
+    The directory is located in $XDG_CACHE_HOME (or ~/.cache). PARTS are
+    appended to the path. The directory is not created.
+    '''
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'upt-macports', *parts)
+
+
+def file_fingerprint(path):
+    '''Return a string that changes whenever the file at PATH changes.
+
+    Return None if the file does not exist.
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f'{st.st_mtime_ns}-{st.st_size}'
+
+
+class VersionCache:
+    '''A persistent cache of port versions, stored in an SQLite database.
+
+    Entries are only valid for TTL seconds, and only as long as the
+    FINGERPRINT (usually the fingerprint of the PortIndex the versions were
+    read from) stays the same.
+    '''
+    DEFAULT_TTL = 24 * 60 * 60
+
+    def __init__(self, path, fingerprint=None, ttl=DEFAULT_TTL):
+        self.path = path
+        self.fingerprint = fingerprint or ''
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS versions ('
+                             'port TEXT PRIMARY KEY, '
+                             'versions TEXT NOT NULL, '
+                             'fingerprint TEXT NOT NULL, '
+                             'timestamp REAL NOT NULL)')
+
+    def get_many(self, port_names):
+        '''Return a dict mapping the cached PORT_NAMES to their versions.
+
+        Ports that are not in the cache, or whose entry is no longer valid,
+        are not included.
+        '''
+        port_names = list(port_names)
+        min_timestamp = time.time() - self.ttl
+        versions = {}
+        with self._lock:
+            # SQLite limits the number of parameters of a query.
+            for i in range(0, len(port_names), 500):
+                chunk = port_names[i:i+500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = self._db.execute(
+                    'SELECT port, versions FROM versions '
+                    f'WHERE port IN ({placeholders}) '
+                    'AND fingerprint = ? AND timestamp >= ?',
+                    chunk + [self.fingerprint, min_timestamp])
+                for port_name, port_versions in rows:
+                    versions[port_name] = json.loads(port_versions)
+            self.hits += len(versions)
+            self.misses += len(port_names) - len(versions)
+        return versions
+
+    def set_many(self, versions):
+        '''Store VERSIONS, a dict mapping port names to their versions.'''
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?)',
+                [(port_name, json.dumps(port_versions), self.fingerprint, now)
+                 for port_name, port_versions in versions.items()])
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self._db.close()
+
+
+class RenderCache:
+    '''A persistent cache of rendered Portfiles, stored in a directory.
+
+    Portfiles are content-addressed: each of them is stored in a file named
+    after a hash of everything its rendering depends on (see key()), so
+    entries never have to be invalidated: when an input changes, so does the
+    key, and the old entry is simply no longer used.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(inputs):
+        '''Return the key of a Portfile rendered from INPUTS.
+
+        INPUTS must be serializable as JSON.
+        '''
+        data = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        '''Return the Portfile stored under KEY, or None.'''
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                portfile = f.read()
+        except (OSError, UnicodeDecodeError):
+            portfile = None
+        with self._lock:
+            if portfile is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        stats.count('render_cache.misses' if portfile is None
+                    else 'render_cache.hits')
+        return portfile
+
+    def __contains__(self, key):
+        '''Return whether a Portfile is stored under KEY.
+
+        Unlike get(), this does not count as a hit or a miss.
+        '''
+        return os.path.exists(self._path(key))
+
+    def set(self, key, portfile):
+        '''Store PORTFILE under KEY.
+
+        Entries are written atomically, so that the cache can be shared by
+        concurrent processes.
+        '''
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, portfile)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_render_cache(directory):
+    return RenderCache(directory)
+
+
+def render_cache():
+    '''Return the RenderCache, or None if it is disabled.
+
+    The render cache is opt-in: it is enabled by setting the
+    UPT_MACPORTS_RENDER_CACHE environment variable, and stored in
+    $XDG_CACHE_HOME/upt-macports/renders/.
+    '''
+    if not os.environ.get('UPT_MACPORTS_RENDER_CACHE'):
+        return None
+    return _load_render_cache(user_cache_dir('renders'))
@@ -0,0 +1,176 @@
+import concurrent.futures
+import functools
+import gzip
+import os
+import threading
+
+from upt_macports.instrumentation import stats
+
+
+CPAN_MIRROR = 'https://cpan.metacpan.org'
+# (connect, read) timeouts, in seconds
+TIMEOUT = (5, 30)
+MAX_WORKERS = 8
+
+_session_lock = threading.Lock()
+_session = None
+# Results of probe_dists() obtained by another process, see remember_dists()
+_known_dists = {}
+
+
+def _get_session():
+    '''Return a requests.Session shared by the whole process.
+
+    Keeping connections alive saves us a TCP/TLS handshake for each request.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is slow to import, and most runs never reach the CPAN
+            # mirror.
+            import requests
+            import requests.adapters
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_WORKERS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+@functools.lru_cache(maxsize=4096)
+def _head_ok(url):
+    stats.count('cpan.requests')
+    return _get_session().head(url, timeout=TIMEOUT).status_code == 200
+
+
+def usual_location_url(part_name, archive_name):
+    return f'{CPAN_MIRROR}/modules/by-module/{part_name}/{archive_name}'
+
+
+def dist_at_usual_location(part_name, archive_name):
+    '''Check whether ARCHIVE_NAME is available at the usual location.
+
+    The usual location is modules/by-module/PART_NAME/ARCHIVE_NAME on the
+    CPAN mirror. Results are memoized. Network errors are not caught.
+    '''
+    try:
+        return _known_dists[(part_name, archive_name)]
+    except KeyError:
+        return _head_ok(usual_location_url(part_name, archive_name))
+
+
+def probe_dists(dists, max_workers=MAX_WORKERS):
+    '''Check the usual location of many distributions concurrently.
+
+    DISTS is an iterable of (part_name, archive_name) tuples. Return a dict
+    mapping each of them to True/False, or to None if we could not reach the
+    mirror. The results are memoized, so that subsequent calls to
+    dist_at_usual_location() do not perform any network I/O.
+    '''
+    import requests
+
+    dists = set(dists)
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(dist_at_usual_location, *dist): dist
+            for dist in dists
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except requests.RequestException:
+                results[futures[future]] = None
+    return results
+
+
+def remember_dists(dists):
+    '''Remember DISTS, results of probe_dists() obtained by another process.
+
+    dist_at_usual_location() then answers for these distributions without
+    any network I/O. Distributions whose location is unknown (None) are
+    ignored.
+    '''
+    _known_dists.update((dist, found) for dist, found in dists.items()
+                        if found is not None)
+
+
+def clear_cache():
+    _head_ok.cache_clear()
+    _known_dists.clear()
+
+
+class PackagesIndex:
+    '''An index of the distributions listed in 02packages.details.txt.
+
+    This file, found in the modules/ directory of CPAN mirrors, lists all
+    packages along with the path of the distribution providing them:
+
+        Foo::Bar       1.0  F/FO/FOOBAR/Foo-Bar-1.0.tar.gz
+
+    For each distribution, we only keep the author path ("F/FO/FOOBAR") and
+    the top-level namespaces of the packages it provides ("Foo"), which are
+    the directories of modules/by-module/ in which the distribution can be
+    found.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._dists = {}
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            self._parse(f)
+
+    def _parse(self, lines):
+        lines = iter(lines)
+        # Skip the headers, which end with an empty line
+        for line in lines:
+            if not line.strip():
+                break
+
+        namespaces = {}
+        for line in lines:
+            fields = line.split()
+            if len(fields) != 3:
+                continue
+            package, _, dist_path = fields
+            author_path, _, archive_name = dist_path.rpartition('/')
+            if archive_name not in self._dists:
+                self._dists[archive_name] = author_path
+                namespaces[archive_name] = set()
+            namespaces[archive_name].add(package.split('::')[0])
+        self._namespaces = {
+            archive_name: frozenset(top_levels)
+            for archive_name, top_levels in namespaces.items()
+        }
+
+    def __contains__(self, archive_name):
+        return archive_name in self._dists
+
+    def __len__(self):
+        return len(self._dists)
+
+    def author_path(self, archive_name):
+        '''Return the path of ARCHIVE_NAME in authors/id/, or None.'''
+        return self._dists.get(archive_name)
+
+    def at_usual_location(self, part_name, archive_name):
+        '''Check whether ARCHIVE_NAME is in modules/by-module/PART_NAME/.'''
+        return part_name in self._namespaces.get(archive_name, ())
+
+
+@functools.lru_cache(maxsize=None)
+def _load_packages_index(path):
+    return PackagesIndex(path)
+
+
+def packages_index():
+    '''Return the local PackagesIndex, or None if there is none.
+
+    The path to 02packages.details.txt (or 02packages.details.txt.gz) is read
+    from the UPT_MACPORTS_CPAN_PACKAGES environment variable. The file is only
+    parsed once per process.
+    '''
+    path = os.environ.get('UPT_MACPORTS_CPAN_PACKAGES')
+    if not path:
+        return None
+    return _load_packages_index(path)
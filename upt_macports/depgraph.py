@@ -0,0 +1,140 @@
+import collections
+import functools
+import os
+import re
+
+from upt_macports.portfile import DEPENDENCY_PHASES
+
+
+# Dependencies on Python, Perl and Ruby modules are written using a variable
+# in Portfiles ("port:py${python.version}-foo"), and using the name of a
+# subport in PortIndex files ("port:py312-foo"). Both refer to the port
+# folder py-foo.
+_MODULE_DEPENDENCY_RE = re.compile(
+    r'^(?:(?P<prefix>py|rb)(?:\$\{[^}]+\}|\d+)|'
+    r'(?P<perl>p)(?:\$\{[^}]+\}|5\.\d+))-(?P<name>.+)$')
+_MODULE_FOLDER_PREFIXES = {'py': 'py-', 'p': 'p5-', 'rb': 'rb-'}
+
+
+# The same dependencies show up in many ports.
+@functools.lru_cache(maxsize=65536)
+def dependency_port(dependency):
+    '''Return the port folder DEPENDENCY refers to.
+
+    DEPENDENCY is written as in a Portfile, for instance "port:foo",
+    "bin:foo:foo-port" or "port:py${python.version}-foo". The port folder is
+    lowercase.
+    '''
+    port = dependency.rsplit(':', 1)[-1].lower()
+    m = _MODULE_DEPENDENCY_RE.match(port)
+    if m:
+        prefix = m.group('prefix') or m.group('perl')
+        port = _MODULE_FOLDER_PREFIXES[prefix] + m.group('name')
+    return port
+
+
+class DependencyGraph:
+    '''The dependencies between the ports of a ports tree.
+
+    Ports are identified by their (lowercase) folder name, just like in
+    MacPortsBackend. For each phase of DEPENDENCY_PHASES, the graph stores
+    both the dependencies and the dependents of every port, so that "is FOO
+    packaged?", "what does FOO depend on?" and "what depends on FOO?" are all
+    answered in constant time.
+    '''
+    def __init__(self):
+        self._ports = set()
+        self._forward = {phase: collections.defaultdict(set)
+                         for phase in DEPENDENCY_PHASES}
+        self._reverse = {phase: collections.defaultdict(set)
+                         for phase in DEPENDENCY_PHASES}
+
+    @classmethod
+    def from_ports_tree_index(cls, index):
+        '''Build a graph from a ports_tree.PortsTreeIndex.'''
+        graph = cls()
+        for folder in index:
+            graph.add_port(folder, index.get(folder)['depends'])
+        return graph
+
+    @classmethod
+    def from_portindex(cls, portindex):
+        '''Build a graph from a portindex.PortIndex.'''
+        graph = cls()
+        graph.add_portindex(portindex)
+        return graph
+
+    def add_portindex(self, portindex):
+        '''Add the ports of a portindex.PortIndex that are not in the graph.
+
+        The PortIndex has a record for each subport; all the subports of a
+        port are merged into a single node named after the port folder. Ports
+        that were already in the graph are left as they are.
+        '''
+        keys = ('portdir',) + tuple(f'depends_{phase}'
+                                    for phase in DEPENDENCY_PHASES)
+        known = set(self._ports)
+        for name in portindex:
+            record = portindex.get(name, keys)
+            folder = os.path.basename(record.get('portdir', name)).lower()
+            if folder in known:
+                continue
+            self.add_port(folder, {
+                phase: record.get(f'depends_{phase}', '').split()
+                for phase in DEPENDENCY_PHASES
+            })
+
+    def add_port(self, port, depends):
+        '''Add PORT to the graph.
+
+        DEPENDS maps phases to lists of dependencies written as in a Portfile.
+        Adding the same port twice merges its dependencies.
+        '''
+        port = port.lower()
+        self._ports.add(port)
+        for phase in DEPENDENCY_PHASES:
+            for dependency in depends.get(phase, ()):
+                dep_port = dependency_port(dependency)
+                if dep_port == port:
+                    continue  # A subport depending on another subport
+                self._forward[phase][port].add(dep_port)
+                self._reverse[phase][dep_port].add(port)
+
+    def __contains__(self, port):
+        return port.lower() in self._ports
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __iter__(self):
+        return iter(self._ports)
+
+    @staticmethod
+    def _collect(edges, port, phases):
+        port = port.lower()
+        result = set()
+        for phase in phases or DEPENDENCY_PHASES:
+            result |= edges[phase].get(port, set())
+        return result
+
+    def dependencies(self, port, phases=None):
+        '''Return the set of ports PORT depends on, in any of PHASES.
+
+        PHASES defaults to all the phases of DEPENDENCY_PHASES.
+        '''
+        return self._collect(self._forward, port, phases)
+
+    def dependents(self, port, phases=None):
+        '''Return the set of ports that depend on PORT, in any of PHASES.'''
+        return self._collect(self._reverse, port, phases)
+
+    def all_dependents(self, port, phases=None):
+        '''Return the set of ports that depend on PORT, even indirectly.'''
+        result = set()
+        queue = [port.lower()]
+        while queue:
+            for dependent in self.dependents(queue.pop(), phases):
+                if dependent not in result:
+                    result.add(dependent)
+                    queue.append(dependent)
+        return result
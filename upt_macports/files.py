@@ -0,0 +1,108 @@
+import errno
+import os
+
+from upt_macports.instrumentation import stats
+
+
+# Errors raised by os.link() on filesystems that do not support hard links
+_NO_LINK_ERRNOS = {errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EOPNOTSUPP,
+                   errno.ENOSYS, errno.EXDEV, errno.EMLINK}
+
+
+def _read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _create_temporary_file(path):
+    '''Create a new temporary file next to PATH, and return (fd, its path).
+
+    Unlike tempfile.mkstemp(), which uses mode 0600, the file is created with
+    mode 0666, so that the kernel applies the current umask: the file gets
+    the permissions open() would have given PATH.
+    '''
+    directory, name = os.path.split(path)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_path = os.path.join(directory or '.',
+                                f'.{name}.{os.urandom(6).hex()}.tmp')
+        try:
+            return os.open(tmp_path, flags, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _create_exclusively(path, data):
+    '''Write DATA to PATH, which must not exist yet.
+
+    This is used on filesystems without hard links: PATH may be seen
+    partially written, but an existing file is never overwritten.
+    '''
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                 getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+
+def write_file(path, content, overwrite=True, encoding='utf-8'):
+    '''Write CONTENT, a string, to PATH, unless it is already there.
+
+    Nothing is written if the file already has the exact same content.
+    Otherwise, CONTENT is written to a temporary file in the same directory,
+    which is then moved to PATH, so that PATH never contains a partial
+    Portfile, even if the process dies. If OVERWRITE is False and PATH already
+    exists with a different content, FileExistsError is raised.
+
+    Return True if the file was written, False if it was already up to date.
+    '''
+    with stats.timer('write'):
+        return _write_file(path, content.encode(encoding), overwrite)
+
+
+def _write_file(path, data, overwrite):
+    old_data = _read_bytes(path)
+    if old_data == data:
+        stats.count('write.unchanged')
+        return False
+    if old_data is not None and not overwrite:
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+
+    fd, tmp_path = _create_temporary_file(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if old_data is not None:
+            # Keep the permissions of the file we replace.
+            try:
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+        if overwrite:
+            os.replace(tmp_path, path)
+        else:
+            # Unlike os.replace(), this fails if PATH has been created in the
+            # meantime.
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                raise
+            except OSError as e:
+                if e.errno not in _NO_LINK_ERRNOS:
+                    raise
+                _create_exclusively(path, data)
+            os.unlink(tmp_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    stats.count('write.written')
+    return True
@@ -0,0 +1,122 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Stats:
+    '''Timers and counters for the stages of a run.
+
+    Stages are timed using the timer() context manager, and events are
+    counted using count(). When the stats are disabled, which is the default,
+    both only check a boolean. Only the stats of the current process are
+    recorded: those of the worker processes of a process pool are not.
+
+    Timers record exclusive time: when a stage runs within another one (such
+    as "licenses" within "render"), its time is only counted for the inner
+    stage. The totals of the stages therefore add up to the time spent in
+    all of them.
+    '''
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # The running timers of each thread, innermost last: for each of
+        # them, the time spent in the timers nested in it.
+        self._local = threading.local()
+        self._reports = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+    @contextlib.contextmanager
+    def _timer(self, stage):
+        running = self._local.__dict__.setdefault('running', [])
+        nested = [0.0]
+        running.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            running.pop()
+            if running:
+                running[-1][0] += elapsed
+            elapsed -= nested[0]
+            with self._lock:
+                timer = self._timers.setdefault(
+                    stage, {'calls': 0, 'total': 0.0, 'max': 0.0})
+                timer['calls'] += 1
+                timer['total'] += elapsed
+                timer['max'] = max(timer['max'], elapsed)
+
+    def timer(self, stage):
+        '''Return a context manager measuring the time spent in STAGE.
+
+        The time spent in the stages nested in STAGE is not included.
+        '''
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(stage)
+
+    def count(self, name, n=1):
+        '''Add N to the counter NAME.'''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def add_report(self, name, func):
+        '''Include the result of FUNC() under NAME in the exported stats.
+
+        This is meant for components that keep statistics of their own, such
+        as caches.
+        '''
+        self._reports[name] = func
+
+    def to_dict(self):
+        '''Return the stats as a dict.
+
+        Times are in seconds, and exclusive of nested stages. The dict looks
+        like this:
+
+            {
+                "timers": {
+                    "render": {"calls": 2, "total": 0.004, "max": 0.003}
+                },
+                "counters": {"port_info.ports": 12}
+            }
+        '''
+        with self._lock:
+            data = {
+                'timers': {stage: dict(timer)
+                           for stage, timer in self._timers.items()},
+                'counters': dict(self._counters),
+            }
+        for name, func in self._reports.items():
+            data[name] = func()
+        return data
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def dump(self, path):
+        '''Write the stats to PATH, as JSON.'''
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+            f.write('\n')
+
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# The stats of the current process, enabled by setting UPT_MACPORTS_STATS to
+# the path of the JSON file they are written to at the end of the run.
+stats = Stats()
+_stats_path = os.environ.get('UPT_MACPORTS_STATS')
+if _stats_path:
+    stats.enabled = True
+    atexit.register(stats.dump, _stats_path)
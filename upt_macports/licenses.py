@@ -0,0 +1,98 @@
+import functools
+import hashlib
+import importlib.resources
+import json
+import types
+
+
+def _read_license_file():
+    if not hasattr(importlib.resources, 'files'):  # Python < 3.9
+        return importlib.resources.read_binary(__package__,
+                                               'spdx2macports.json')
+    resource = importlib.resources.files(__package__) / 'spdx2macports.json'
+    return resource.read_bytes()
+
+
+@functools.lru_cache(maxsize=None)
+def _license_table():
+    '''Return the SPDX -> MacPorts license table.
+
+    The table is read from spdx2macports.json the first time it is needed, and
+    then shared by the whole process. Its keys are lowercase SPDX identifiers,
+    so that lookups are case-insensitive.
+    '''
+    spdx2macports = json.loads(_read_license_file())
+    return types.MappingProxyType({
+        spdx_identifier.lower(): port_license
+        for spdx_identifier, port_license in spdx2macports.items()
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def table_digest():
+    '''Return a hash of spdx2macports.json.
+
+    It identifies the version of the license table, and changes whenever the
+    table is modified.
+    '''
+    return hashlib.sha256(_read_license_file()).hexdigest()
+
+
+# Suffixes of the SPDX identifiers that are not deprecated
+_SPDX_SUFFIXES = ('-only', '-or-later')
+
+
+def _spdx_aliases(spdx_identifier):
+    '''Yield the SPDX identifiers that may be used for SPDX_IDENTIFIER.
+
+    Some SPDX identifiers have been deprecated over time:
+        - "GPL-2.0" and "GPL-2.0+" were replaced by "GPL-2.0-only" and
+          "GPL-2.0-or-later";
+        - "GPL-2.0-with-GCC-exception" was replaced by an exception that is
+          applied to "GPL-2.0-only".
+    The old and new forms are mapped to the same MacPorts license. Suffixes
+    are only added to identifiers that do not already have one.
+    '''
+    spdx_identifier = spdx_identifier.lower()
+    yield spdx_identifier
+    if spdx_identifier.endswith('+'):
+        base = spdx_identifier[:-1]
+        if not base.endswith(_SPDX_SUFFIXES):
+            yield base + '-or-later'
+    else:
+        base, sep, _ = spdx_identifier.partition('-with-')
+        if sep:
+            yield base
+        if not base.endswith(_SPDX_SUFFIXES):
+            yield base + '-only'
+
+
+def spdx2macports(spdx_identifier):
+    '''Return the MacPorts license matching SPDX_IDENTIFIER.
+
+    Raise KeyError if there is no such license.
+    '''
+    table = _license_table()
+    for alias in _spdx_aliases(spdx_identifier):
+        try:
+            return table[alias]
+        except KeyError:
+            pass
+    raise KeyError(spdx_identifier)
+
+
+def map_licenses(spdx_identifiers):
+    '''Map SPDX_IDENTIFIERS to MacPorts licenses.
+
+    Return a dict mapping each of the given SPDX identifiers to a MacPorts
+    license, or to None if there is no such license.
+    '''
+    port_licenses = {}
+    for spdx_identifier in spdx_identifiers:
+        if spdx_identifier in port_licenses:
+            continue
+        try:
+            port_licenses[spdx_identifier] = spdx2macports(spdx_identifier)
+        except KeyError:
+            port_licenses[spdx_identifier] = None
+    return port_licenses
@@ -0,0 +1,50 @@
+import functools
+
+from upt_macports.instrumentation import stats
+
+
+# Number of names remembered by each translation function
+MAXSIZE = 16384
+
+_translations = []
+
+
+def cached_translation(func):
+    '''Memoize FUNC, which translates an upstream name into a MacPorts name.
+
+    The same dependencies show up in many packages, and are translated both
+    when rendering and when updating Portfiles: each translation function
+    (for instance MacPortsPythonPackage._normalized_macports_folder) gets its
+    own bounded cache, whose statistics are returned by cache_stats().
+    '''
+    cached = functools.lru_cache(maxsize=MAXSIZE)(func)
+    _translations.append(cached)
+    return cached
+
+
+def cache_stats():
+    '''Return the statistics of the translation caches.
+
+    The result maps the qualified name of each translation function to a dict
+    with the following keys: "hits", "misses", "size" and "hit_rate" (None
+    if the function was never called).
+    '''
+    result = {}
+    for func in _translations:
+        info = func.cache_info()
+        calls = info.hits + info.misses
+        result[func.__qualname__] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': info.hits / calls if calls else None,
+        }
+    return result
+
+
+def clear_caches():
+    for func in _translations:
+        func.cache_clear()
+
+
+stats.add_report('name_translations', cache_stats)
@@ -0,0 +1,138 @@
+import re
+
+
+DEPENDENCY_PHASES = ('build', 'lib', 'test')
+VERSION_KEYWORDS = ('version', 'github.setup', 'bitbucket.setup',
+                    'ruby.setup', 'perl5.setup')
+
+_REVISION_RE = re.compile(r'revision(\s+)\d+')
+# The first line of a "depends_<phase>-append" block, for each phase
+DEPENDS_PATTERNS = {
+    phase: re.compile(fr'(\s*)depends_{phase}-append(\s+)(.*)')
+    for phase in DEPENDENCY_PHASES
+}
+
+
+def _block_end(content, keyword_end):
+    '''Return the end of the block whose keyword ends at KEYWORD_END.
+
+    A block ends with the first newline that is not escaped by a backslash,
+    and that is not right after the keyword: the newline is included in the
+    block. Return None if there is no such newline.
+    '''
+    end = content.find('\n', keyword_end + 1)
+    while end != -1 and content[end-1] == '\\':
+        end = content.find('\n', end + 1)
+    return None if end == -1 else end + 1
+
+
+class PortfileTokens:
+    '''The location of the statements of a Portfile that upt can update.
+
+    All locations are (start, end) offsets in CONTENT:
+        - version_lines: every line that contains one of VERSION_KEYWORDS;
+        - revision: the first "revision N" statement (None if there is none),
+          where only "N" is included in the span;
+        - checksums: every "checksums" block;
+        - depends: for each phase in DEPENDENCY_PHASES, every
+          "depends_<phase>-append" block.
+    A block starts at the beginning of the line containing its keyword and
+    ends at the end of the last line of the statement, including
+    continuation lines.
+    '''
+    def __init__(self, content):
+        self.content = content
+        self.version_lines = []
+        self.revision = None
+        self.checksums = []
+        self.depends = {phase: [] for phase in DEPENDENCY_PHASES}
+
+    def text(self, span):
+        return self.content[span[0]:span[1]]
+
+    def first_block(self, blocks):
+        '''Return the text of the first of BLOCKS, or "".'''
+        return self.text(blocks[0]) if blocks else ''
+
+
+def tokenize(content):
+    '''Tokenize CONTENT, in a single pass, and return a PortfileTokens.'''
+    tokens = PortfileTokens(content)
+    block_keywords = [('checksums', tokens.checksums)]
+    block_keywords += [(f'depends_{phase}-append', tokens.depends[phase])
+                       for phase in DEPENDENCY_PHASES]
+    # For each kind of block, the offset before which we must not look for a
+    # new block, since we are still in the previous one.
+    next_block = {keyword: 0 for keyword, _ in block_keywords}
+
+    start = 0
+    length = len(content)
+    while start < length:
+        end = content.find('\n', start)
+        end = length if end == -1 else end
+        line = content[start:end]
+
+        if 'version' in line or '.setup' in line:
+            if any(keyword in line for keyword in VERSION_KEYWORDS):
+                tokens.version_lines.append((start, end))
+
+        if tokens.revision is None and 'revision' in line:
+            m = _REVISION_RE.search(content, start, end)
+            if m:
+                tokens.revision = (m.end(1), m.end(0))
+
+        for keyword, blocks in block_keywords:
+            if start < next_block[keyword] or keyword not in line:
+                continue
+            keyword_end = start + line.rindex(keyword) + len(keyword)
+            block_end = _block_end(content, keyword_end)
+            if block_end is not None:
+                blocks.append((start, block_end))
+                next_block[keyword] = block_end
+
+        start = end + 1
+    return tokens
+
+
+def parse_dependencies(depends_block, phase):
+    '''Return the list of dependencies found in DEPENDS_BLOCK.
+
+    DEPENDS_BLOCK is a "depends_<PHASE>-append" block, as found by tokenize().
+    The dependencies are returned just like they are written in the Portfile,
+    for instance:
+
+        ['port:py${python.version}-six', 'port:py${python.version}-xlrd']
+    '''
+    deps = []
+    if not depends_block:
+        return deps
+    for line in depends_block.split('\n'):
+        m = DEPENDS_PATTERNS[phase].match(line)
+        if m:
+            line = m.group(3)
+        if line.endswith('\\'):
+            line = line[:-1]
+        line = line.strip()
+        deps.extend(line.split())
+    return deps
+
+
+def splice(content, edits):
+    '''Apply EDITS to CONTENT, and return the result.
+
+    EDITS is an iterable of (start, end, text) tuples, meaning that
+    CONTENT[start:end] must be replaced with TEXT. Edits are applied in a
+    single pass; an edit overlapping a previous one is ignored. Several edits
+    may insert text at the same offset (for instance at the end of CONTENT),
+    in which case the texts are inserted in order.
+    '''
+    pieces = []
+    position = 0
+    for start, end, text in sorted(edits, key=lambda edit: edit[0]):
+        if start < position:
+            continue
+        pieces.append(content[position:start])
+        pieces.append(text)
+        position = end
+    pieces.append(content[position:])
+    return ''.join(pieces)
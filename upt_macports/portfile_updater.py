@@ -1,11 +1,47 @@
 # Copyright 2021      Cyril Roelandt
 #
 # Licensed under the 3-clause BSD license. See the LICENSE file.
+import difflib
 import logging
+import os
 import re
 
 import upt
 
+from upt_macports.files import write_file
+from upt_macports.instrumentation import stats
+from upt_macports.portfile import (DEPENDENCY_PHASES, DEPENDS_PATTERNS,
+                                   VERSION_KEYWORDS, parse_dependencies,
+                                   splice, tokenize)
+
+
+# All the regular expressions used by PortfileUpdater are compiled once, and
+# shared by all instances. Versions are never part of a pattern: they are
+# looked for as literal strings.
+_PATTERNS = {
+    'checksums': re.compile(r'(\s*)checksums(\s+)[^\s]+'),
+    'version_keyword': re.compile(
+        '|'.join(re.escape(keyword) for keyword in VERSION_KEYWORDS)),
+    'indent': re.compile(r'(\s+)'),
+}
+
+
+def unified_diff(old_content, new_content, path='Portfile'):
+    '''Return the changes from OLD_CONTENT to NEW_CONTENT as a unified diff.
+
+    PATH is the name of the file in the headers of the diff. The result can be
+    applied using "patch -p1", and is empty if there are no changes.
+    '''
+    lines = difflib.unified_diff(old_content.splitlines(keepends=True),
+                                 new_content.splitlines(keepends=True),
+                                 f'a/{path}', f'b/{path}')
+    diff = []
+    for line in lines:
+        diff.append(line)
+        if not line.endswith('\n'):
+            diff.append('\n\\ No newline at end of file\n')
+    return ''.join(diff)
+
 
 class PortfileUpdater:
     def __init__(self, portfile_fp, pdiff, pkg_class):
@@ -15,27 +51,62 @@ class PortfileUpdater:
         self.macports_pkg = pkg_class()
 
     def update(self):
-        new_portfile_content = self._update_portfile_content()
+        '''Update the Portfile.
+
+        Return True if the Portfile was modified, False if it was already up
+        to date, in which case it is not written at all. A Portfile that lives
+        on the filesystem is replaced atomically, using write_file(), which
+        only requires PORTFILE_FP to be open for reading.
+        '''
+        old_portfile_content = self.portfile_fp.read()
+        self.portfile_fp.seek(0)
+        with stats.timer('update'):
+            new_portfile_content = self._update_portfile_content()
+        if new_portfile_content == old_portfile_content:
+            return False
+
+        path = getattr(self.portfile_fp, 'name', None)
+        if isinstance(path, str) and os.path.isfile(path):
+            encoding = getattr(self.portfile_fp, 'encoding', None) or 'utf-8'
+            return write_file(path, new_portfile_content, encoding=encoding)
+
         self.portfile_fp.seek(0)
         self.portfile_fp.write(new_portfile_content)
         self.portfile_fp.truncate()
+        return True
+
+    def diff(self, path='Portfile'):
+        '''Return the changes update() would make, as a unified diff.
+
+        The Portfile is only read. PATH is the name of the Portfile in the
+        headers of the diff. Return an empty string if the Portfile is already
+        up to date.
+        '''
+        old_portfile_content = self.portfile_fp.read()
+        self.portfile_fp.seek(0)
+        with stats.timer('update'):
+            new_portfile_content = self._update_portfile_content()
+        return unified_diff(old_portfile_content, new_portfile_content, path)
 
     def _update_portfile_content(self):
         content = self.portfile_fp.read()
-        content = self._update_version(content,
-                                       self.pdiff.old_version,
-                                       self.pdiff.new_version)
-        content = self._update_revision(content)
+        # The Portfile is tokenized once, and all the changes are then applied
+        # in a single pass.
+        tokens = tokenize(content)
+        edits = self._version_edits(tokens,
+                                    self.pdiff.old_version,
+                                    self.pdiff.new_version)
+        edits += self._revision_edits(tokens)
         try:
             archive_format = self.macports_pkg.archive_format
             new_archive = self.pdiff.new.get_archive(archive_format)
-            content = self._update_checksums(content, new_archive)
+            edits += self._checksums_edits(tokens, new_archive)
         except upt.ArchiveUnavailable:
             self.logger.info('We could not get archives for this package. '
                              'The checksums/size will be wrong.')
-        content = self._update_dependencies(content, self.pdiff,
-                                            self.macports_pkg.jinja2_reqformat)
-        return content
+        edits += self._dependencies_edits(tokens, self.pdiff,
+                                          self.macports_pkg.jinja2_reqformat)
+        return splice(content, edits)
 
     @staticmethod
     def _update_checksums(content, new_archive):
@@ -43,17 +114,27 @@ class PortfileUpdater:
 
         Return CONTENT after replacing the checksums (and size) with updated
         checksums (and size) for NEW_ARCHIVE.
+        '''
+        edits = PortfileUpdater._checksums_edits(tokenize(content),
+                                                 new_archive)
+        return splice(content, edits)
+
+    @staticmethod
+    def _checksums_edits(tokens, new_archive):
+        '''Return the edits needed to update the checksums block.
+
+        The checksums (and size) are replaced with updated checksums (and
+        size) for NEW_ARCHIVE.
 
         In the process, completely removes md5 checksum, which are no longer
         required in MacPorts.
         '''
-        m = re.search(r"[^\n]*checksums.*?[^\\]\n", content, re.DOTALL)
-        if not m:  # This Portfile had no checksums, let's not change anything
-            return content
+        if not tokens.checksums:
+            # This Portfile had no checksums, let's not change anything
+            return []
 
-        old_archive_block = m.group(0)
-        m = re.match(r'(\s*)checksums(\s+)[^\s]+',
-                     old_archive_block.split('\n')[0])
+        old_archive_block = tokens.first_block(tokens.checksums)
+        m = _PATTERNS['checksums'].match(old_archive_block.split('\n')[0])
         space_before = m.group(1)
         space_after = m.group(2)
         indent = ' ' * len(space_before + 'checksums' + space_after)
@@ -61,35 +142,64 @@ class PortfileUpdater:
         new_archive_block += f'rmd160  {new_archive.rmd160} \\\n'
         new_archive_block += f'{indent}sha256  {new_archive.sha256} \\\n'
         new_archive_block += f'{indent}size    {new_archive.size}\n'
-        return content.replace(old_archive_block, new_archive_block)
+        return [(start, end, new_archive_block)
+                for start, end in tokens.checksums
+                if tokens.text((start, end)) == old_archive_block]
 
     @staticmethod
     def _update_version(content, old_version, new_version):
         '''Update the version of the package being updated.
 
         Return CONTENT after replacing the OLD_VERSION with the NEW_VERSION.
-        This works for the "version" keyword, and a variety of "*.setup"
-        keywords.
         '''
-        keywords = '|'.join([
-            'version', 'github.setup', 'bitbucket.setup',
-            'ruby.setup', 'perl5.setup',
-        ])
-        return re.sub(fr'({keywords})(.*){old_version}',
-                      fr'\g<1>\g<2>{new_version}',
-                      content, count=1)
+        edits = PortfileUpdater._version_edits(tokenize(content),
+                                               old_version, new_version)
+        return splice(content, edits)
+
+    @staticmethod
+    def _version_edits(tokens, old_version, new_version):
+        '''Return the edits needed to update the version of the package.
+
+        The first OLD_VERSION found after the "version" keyword, or after one
+        of a variety of "*.setup" keywords, is replaced with NEW_VERSION.
+        '''
+        for start, end in tokens.version_lines:
+            line = tokens.text((start, end))
+            m = _PATTERNS['version_keyword'].search(line)
+            if not m:
+                continue
+            # Replace the last occurrence of OLD_VERSION after the keyword.
+            index = line.rfind(old_version, m.end())
+            if index != -1:
+                return [(start + index, start + index + len(old_version),
+                         new_version)]
+        return []
 
     @staticmethod
     def _update_revision(content):
         '''Update the first revision entry in the Portfile.'''
-        return re.sub(r'revision(\s+)\d+', r'revision\g<1>0', content,
-                      count=1)
+        edits = PortfileUpdater._revision_edits(tokenize(content))
+        return splice(content, edits)
+
+    @staticmethod
+    def _revision_edits(tokens):
+        '''Return the edits needed to reset the first revision entry.'''
+        if tokens.revision is None:
+            return []
+        start, end = tokens.revision
+        return [(start, end, '0')]
 
     def _update_dependencies(self, content, pdiff, reqformat_fn):
-        for phase in ['build', 'lib', 'test']:
-            content = self._update_dependency_phase(content, pdiff,
-                                                    reqformat_fn, phase)
-        return content
+        edits = self._dependencies_edits(tokenize(content), pdiff,
+                                         reqformat_fn)
+        return splice(content, edits)
+
+    def _dependencies_edits(self, tokens, pdiff, reqformat_fn):
+        edits = []
+        for phase in DEPENDENCY_PHASES:
+            edits += self._dependency_phase_edits(tokens, pdiff, reqformat_fn,
+                                                  phase)
+        return edits
 
     @staticmethod
     def _get_current_dependencies(content, phase):
@@ -101,22 +211,9 @@ class PortfileUpdater:
 
             ['port:py${python.version}-six', 'port:py${python.version}-xlrd']
         '''
-        mmm = re.search(fr"[^\n]*depends_{phase}-append.*?[^\\]\n",
-                        content, re.DOTALL)
-        deps = []
-        if mmm:
-            old_depends_block = mmm.group(0)
-            for line in old_depends_block.split('\n'):
-                m = re.match(fr'(\s*)depends_{phase}-append(\s+)(.*)', line)
-                if m:
-                    line = m.group(3)
-                if line.endswith('\\'):
-                    line = line[:-1]
-                line = line.strip()
-                deps.extend(line.split())
-        else:
-            old_depends_block = ''
-
+        tokens = tokenize(content)
+        old_depends_block = tokens.first_block(tokens.depends[phase])
+        deps = parse_dependencies(old_depends_block, phase)
         return old_depends_block, deps
 
     @staticmethod
@@ -181,7 +278,7 @@ class PortfileUpdater:
                 current_deps.append(new_dependency)
         return current_deps
 
-    def _update_dependency_phase(self, content, pdiff, reqformat_fn, phase):
+    def _dependency_phase_edits(self, tokens, pdiff, reqformat_fn, phase):
         phases = {
             'build': 'build',
             'lib': 'run',
@@ -189,8 +286,8 @@ class PortfileUpdater:
         }
         # Let's extract the dependencies currently specified in the Portfile
         # for this phase.
-        old_depends_block, deps = self._get_current_dependencies(content,
-                                                                 phase)
+        old_depends_block = tokens.first_block(tokens.depends[phase])
+        deps = parse_dependencies(old_depends_block, phase)
 
         # Start by removing the deleted dependencies.
         deleted_dependencies = [
@@ -209,14 +306,16 @@ class PortfileUpdater:
         # Finally, format the new depends block properly.
         new_depends_block = self._format_like(deps, old_depends_block, phase)
         if old_depends_block:
-            content = content.replace(old_depends_block, new_depends_block)
-        else:
+            return [(start, end, new_depends_block)
+                    for start, end in tokens.depends[phase]
+                    if tokens.text((start, end)) == old_depends_block]
+        elif new_depends_block:
             # This phase had no dependencies, let's add it at the bottom of the
             # Portfile and let the maintainer move it wherever they want.
-            if new_depends_block:
-                content += '# TODO: Move this\n'
-                content += new_depends_block
-        return content
+            end = len(tokens.content)
+            return [(end, end, '# TODO: Move this\n' + new_depends_block)]
+        else:
+            return []
 
     @staticmethod
     def _format_like(deps, old_depends_block, phase):
@@ -232,8 +331,7 @@ class PortfileUpdater:
         # Read
         old_depends_block_lines = old_depends_block.split('\n')
         block_name = f'depends_{phase}-append'
-        m = re.match(fr'(\s*)depends_{phase}-append(\s+)(.*)',
-                     old_depends_block_lines[0])
+        m = DEPENDS_PATTERNS[phase].match(old_depends_block_lines[0])
         if m:
             first_line_indent = m.group(1)
             space = m.group(2)
@@ -251,7 +349,7 @@ class PortfileUpdater:
 
         next_lines_indent = ''
         if len(old_depends_block_lines) > 1:
-            m = re.match(r'(\s+)', old_depends_block_lines[1])
+            m = _PATTERNS['indent'].match(old_depends_block_lines[1])
             if m:
                 next_lines_indent = m.group(1)
 
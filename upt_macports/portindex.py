@@ -0,0 +1,253 @@
+import mmap
+import os
+import re
+
+
+# The bytes that continue a UTF-8 sequence, as opposed to the bytes that start
+# a character.
+_UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xc0))
+
+
+# Most words of a PortIndex are either made of "plain" characters, or
+# enclosed in braces: these are split using regular expressions, and only the
+# other words are parsed one character at a time.
+_TCL_SPACE_RE = re.compile(r'\s*')
+_TCL_PLAIN_WORD_RE = re.compile(r'[^\s\\"{][^\s\\]*(?=\s|\Z)')
+_TCL_BRACES_RE = re.compile(r'\\.|[{}]', re.DOTALL)
+
+
+def _tcl_word(string, i):
+    '''Return the word of the Tcl list STRING starting at I, and its end.'''
+    length = len(string)
+    if string[i] == '{':
+        depth = 1
+        end = length
+        for m in _TCL_BRACES_RE.finditer(string, i + 1):
+            if m.group() == '{':
+                depth += 1
+            elif m.group() == '}':
+                depth -= 1
+                if not depth:
+                    end = m.start()
+                    break
+        return string[i+1:end], min(end + 1, length)
+
+    m = _TCL_PLAIN_WORD_RE.match(string, i)
+    if m:
+        return m.group(), m.end()
+
+    quoted = string[i] == '"'
+    if quoted:
+        i += 1
+    word = []
+    while i < length:
+        c = string[i]
+        if quoted and c == '"':
+            i += 1
+            break
+        if not quoted and c.isspace():
+            break
+        if c == '\\' and i + 1 < length:
+            i += 1
+            c = string[i]
+        word.append(c)
+        i += 1
+    return ''.join(word), i
+
+
+def parse_tcl_list(string):
+    '''Split STRING, a Tcl list, into a list of words.
+
+    Words may be enclosed in braces (which may be nested) or in double quotes.
+    Backslash escapes are only interpreted outside of braces, just like Tcl
+    does.
+    '''
+    words = []
+    i = 0
+    length = len(string)
+    while True:
+        i = _TCL_SPACE_RE.match(string, i).end()
+        if i == length:
+            return words
+        word, i = _tcl_word(string, i)
+        words.append(word)
+
+
+def _tcl_fields(string, keys):
+    '''Return the values of KEYS in STRING, a Tcl list of keys and values.
+
+    This is much faster than parsing the whole list, but only works if the
+    braces of STRING can be counted to know whether a key is inside a value.
+    Return None if STRING contains backslashes, which may escape braces.
+    '''
+    if '\\' in string:
+        return None
+    fields = {}
+    for key in keys:
+        start = string.find(key)
+        while start != -1:
+            end = start + len(key)
+            if ((start == 0 or string[start-1].isspace()) and
+                    end < len(string) and string[end].isspace() and
+                    string.count('{', 0, start) ==
+                    string.count('}', 0, start)):
+                i = _TCL_SPACE_RE.match(string, end).end()
+                if i < len(string):
+                    fields[key] = _tcl_word(string, i)[0]
+                break
+            start = string.find(key, end)
+    return fields
+
+
+# Port sources that are snapshots of the ports tree, as opposed to ports trees
+_SNAPSHOT_SOURCE_RE = re.compile(
+    r'^(?:https?|ftp|rsync)://.+/.+\.(?:tar\.gz|tar\.bz2|tar)$')
+
+
+def _conf_lines(path):
+    '''Yield the words of each line of the MacPorts configuration file PATH.'''
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            words = line.split()
+            if words and not words[0].startswith('#'):
+                yield words
+
+
+def source_portindexes(prefix):
+    '''Return the paths of the PortIndex files of the port sources.
+
+    The sources are those of the MacPorts installation in PREFIX, listed in
+    its sources.conf. Their paths are computed the way MacPorts computes them
+    (see macports::getsourcepath). Return an empty list if the configuration
+    of MacPorts cannot be read.
+    '''
+    conf_dir = os.path.join(prefix, 'etc', 'macports')
+    portdbpath = os.path.join(prefix, 'var', 'macports')
+    try:
+        for words in _conf_lines(os.path.join(conf_dir, 'macports.conf')):
+            if words[0] == 'portdbpath' and len(words) > 1:
+                portdbpath = words[1]
+    except (OSError, UnicodeDecodeError):
+        pass  # Use the default
+    try:
+        sources = list(_conf_lines(os.path.join(conf_dir, 'sources.conf')))
+    except (OSError, UnicodeDecodeError):
+        return []
+
+    paths = []
+    for words in sources:
+        url = words[0]
+        if url.startswith('file://'):
+            directory = url[len('file://'):]
+        else:
+            parts = re.split('[:/]', url)
+            if _SNAPSHOT_SOURCE_RE.match(url):
+                parts = parts[3:-1] + ['ports']
+            else:
+                parts = parts[3:6]
+            directory = os.path.join(portdbpath, 'sources',
+                                     *[part for part in parts if part])
+        paths.append(os.path.join(directory, 'PortIndex'))
+    return paths
+
+
+class PortIndex:
+    '''Read-only access to a MacPorts PortIndex file.
+
+    A PortIndex is made of one record per port:
+
+        py-foo 123
+        name py-foo portdir python/py-foo version 1.2.3 ...
+
+    The first line contains the name of the port and the length of the second
+    line, which is a Tcl list of keys and values. The length is counted in
+    characters, the second line being encoded in UTF-8. The file is scanned
+    once to find where each record is; records are only parsed when they are
+    looked up.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._offsets = {}
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                self._mmap = b''
+        self._build_index()
+
+    def _build_index(self):
+        data = self._mmap
+        size = len(data)
+        offset = 0
+        while offset < size:
+            eol = data.find(b'\n', offset)
+            if eol == -1:
+                break
+            header = data[offset:eol].split()
+            if len(header) != 2:
+                raise ValueError(f'{self.path}: invalid record at offset '
+                                 f'{offset}')
+            name, length = header[0].decode('utf-8'), int(header[1])
+            end = self._record_end(eol + 1, length)
+            self._offsets[name.lower()] = (eol + 1, end)
+            offset = end
+
+    def _record_end(self, start, length):
+        '''Return the offset of the end of the record starting at START.
+
+        LENGTH is the number of characters of the record, which is also its
+        number of bytes unless it contains non-ASCII characters.
+        '''
+        data = self._mmap
+        end = start
+        missing = length
+        while missing > 0 and end < len(data):
+            # Each byte is at most one character.
+            chunk = data[end:end+missing]
+            end += len(chunk)
+            missing -= len(chunk.translate(None, _UTF8_CONTINUATION_BYTES))
+        # Include the end of the last character.
+        while end < len(data) and data[end] in _UTF8_CONTINUATION_BYTES:
+            end += 1
+        return end
+
+    def __contains__(self, name):
+        return name.lower() in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def get(self, name, keys=None):
+        '''Return the record of port NAME, as a dict, or None.
+
+        If KEYS (a tuple) is given, only these keys are read from the record,
+        which is much faster than parsing all of it.
+        '''
+        try:
+            start, end = self._offsets[name.lower()]
+        except KeyError:
+            return None
+        record = self._mmap[start:end].decode('utf-8')
+        if keys is not None:
+            fields = _tcl_fields(record, keys)
+            if fields is not None:
+                return fields
+        words = parse_tcl_list(record)
+        fields = dict(zip(words[::2], words[1::2]))
+        if keys is not None:
+            fields = {key: fields[key] for key in keys if key in fields}
+        return fields
+
+    def version(self, name):
+        '''Return the version of port NAME, or None.'''
+        record = self.get(name)
+        if record is None:
+            return None
+        return record.get('version')
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
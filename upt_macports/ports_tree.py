@@ -0,0 +1,210 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from upt_macports.cache import user_cache_dir
+from upt_macports.portfile import (DEPENDENCY_PHASES, parse_dependencies,
+                                   tokenize)
+
+
+# Position of the version in the arguments of each keyword
+_VERSION_ARGUMENT = {
+    'version': 0,
+    'perl5.setup': 1,
+    'ruby.setup': 1,
+    'github.setup': 2,
+    'bitbucket.setup': 2,
+}
+
+
+def parse_portfile(content):
+    '''Extract the metadata upt cares about from CONTENT, a Portfile.
+
+    Return a dict with the following keys: "version" (None if it could not be
+    found), "revision", "checksums" (a dict such as {'sha256': ..., 'size':
+    ...}) and "depends" (a dict mapping each phase of DEPENDENCY_PHASES to a
+    list of dependencies, such as 'port:py${python.version}-six'). Values are
+    returned as written in the Portfile: variables are not expanded.
+    '''
+    tokens = tokenize(content)
+    metadata = {
+        'version': None,
+        'revision': 0,
+        'checksums': {},
+        'depends': {},
+    }
+
+    for span in tokens.version_lines:
+        words = tokens.text(span).split()
+        position = _VERSION_ARGUMENT.get(words[0] if words else None)
+        if position is not None and len(words) > position + 1:
+            metadata['version'] = words[position+1]
+            break
+
+    if tokens.revision is not None:
+        metadata['revision'] = int(tokens.text(tokens.revision))
+
+    checksums_block = tokens.first_block(tokens.checksums)
+    words = checksums_block.replace('\\\n', ' ').split()[1:]
+    metadata['checksums'] = dict(zip(words[::2], words[1::2]))
+
+    for phase in DEPENDENCY_PHASES:
+        deps = []
+        for span in tokens.depends[phase]:
+            for dep in parse_dependencies(tokens.text(span), phase):
+                if dep not in deps:
+                    deps.append(dep)
+        metadata['depends'][phase] = deps
+
+    return metadata
+
+
+def _iter_portfiles(root):
+    '''Yield (port folder, relative path, os.stat_result) for each Portfile.'''
+    for category in sorted(os.scandir(root), key=lambda e: e.name):
+        if not category.is_dir() or category.name.startswith('.'):
+            continue
+        for port in sorted(os.scandir(category.path), key=lambda e: e.name):
+            if not port.is_dir():
+                continue
+            relpath = os.path.join(category.name, port.name, 'Portfile')
+            try:
+                st = os.stat(os.path.join(root, relpath))
+            except OSError:
+                continue
+            yield port.name, relpath, st
+
+
+class PortsTree:
+    '''A checkout of the MacPorts ports tree.
+
+    Ports live in ROOT/<category>/<port>/Portfile.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._folders = None
+
+    def _scan_folders(self):
+        '''Return a dict mapping port folders to the path of their Portfile.'''
+        folders = {}
+        for folder, relpath, _ in _iter_portfiles(self.root):
+            folders.setdefault(folder, os.path.join(self.root, relpath))
+        return folders
+
+    def portfile_path(self, category, folder):
+        '''Return the path to the Portfile of FOLDER, or None.
+
+        The port is first looked for in CATEGORY, then in all the categories
+        of the tree.
+        '''
+        portfile = os.path.join(self.root, category, folder, 'Portfile')
+        if os.path.isfile(portfile):
+            return portfile
+        with self._lock:
+            if self._folders is None:
+                self._folders = self._scan_folders()
+        return self._folders.get(folder)
+
+
+class PortsTreeIndex:
+    '''An index of the metadata of all the Portfiles of a ports tree.
+
+    For each port (identified by its folder name), the index stores the
+    metadata returned by parse_portfile(), along with the path, mtime and size
+    of the Portfile. The index is saved as gzipped JSON, by default in the
+    cache directory, and refresh() only parses the Portfiles that were added
+    or modified since the last refresh.
+    '''
+    FORMAT_VERSION = 1
+
+    def __init__(self, root, path=None):
+        self.root = os.path.abspath(root)
+        if path is None:
+            digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()
+            path = user_cache_dir('ports-tree', f'{digest}.json.gz')
+        self.path = path
+        self.ports = {}
+        self.load()
+
+    def load(self):
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (data.get('format') == self.FORMAT_VERSION and
+                data.get('root') == self.root):
+            self.ports = data['ports']
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            'format': self.FORMAT_VERSION,
+            'root': self.root,
+            'ports': self.ports,
+        }
+        # Concurrent runs each write their own temporary file.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path),
+            prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, \
+                    gzip.open(raw, 'wt', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def refresh(self):
+        '''Update the index so that it matches the ports tree.
+
+        Return the number of Portfiles that had to be parsed.
+        '''
+        ports = {}
+        parsed = 0
+        for folder, relpath, st in _iter_portfiles(self.root):
+            if folder in ports:
+                continue
+            entry = self.ports.get(folder)
+            if (entry is None or entry['path'] != relpath or
+                    entry['mtime_ns'] != st.st_mtime_ns or
+                    entry['size'] != st.st_size):
+                with open(os.path.join(self.root, relpath),
+                          encoding='utf-8', errors='replace') as f:
+                    entry = parse_portfile(f.read())
+                entry.update(path=relpath, mtime_ns=st.st_mtime_ns,
+                             size=st.st_size)
+                parsed += 1
+            ports[folder] = entry
+        self.ports = ports
+        return parsed
+
+    def __contains__(self, folder):
+        return folder in self.ports
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __iter__(self):
+        return iter(self.ports)
+
+    def get(self, folder):
+        return self.ports.get(folder)
+
+    def version(self, folder):
+        entry = self.ports.get(folder)
+        return None if entry is None else entry['version']
+
+    def portfile_path(self, folder):
+        entry = self.ports.get(folder)
+        if entry is None:
+            return None
+        return os.path.join(self.root, entry['path'])
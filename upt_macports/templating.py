@@ -0,0 +1,78 @@
+import functools
+import hashlib
+import os
+
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+# Where the templates are compiled to when the package is built (see
+# setup.py).
+COMPILED_TEMPLATES_DIR = os.path.join(os.path.dirname(__file__),
+                                      'compiled_templates')
+# The file of a directory of compiled templates that holds their
+# _compiled_digest().
+_DIGEST_FILE = 'DIGEST'
+
+# Compiled templates are only valid for environments using the same options.
+ENVIRONMENT_OPTIONS = {
+    'trim_blocks': True,
+    'lstrip_blocks': True,
+    'keep_trailing_newline': True,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def templates_digest(directory=TEMPLATES_DIR):
+    '''Return a hash of the source of all the templates of DIRECTORY.'''
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            content = f.read()
+        digest.update(f'{name}\0{len(content)}\0'.encode('utf-8'))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def _compiled_digest(templates_dir=TEMPLATES_DIR):
+    '''Return what templates compiled from TEMPLATES_DIR are valid for.
+
+    The code generated by a Jinja2 release may not work with another one, so
+    this includes the version of Jinja2 along with the digest of the
+    templates.
+    '''
+    import jinja2
+
+    return f'{templates_digest(templates_dir)} jinja2-{jinja2.__version__}'
+
+
+def compile_templates(target, templates_dir=TEMPLATES_DIR):
+    '''Compile the templates of TEMPLATES_DIR into Python modules in TARGET.
+
+    These modules can then be loaded by precompiled_loader(TARGET), which
+    saves the parsing and compilation of the templates.
+    '''
+    import jinja2
+
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates_dir),
+                             **ENVIRONMENT_OPTIONS)
+    os.makedirs(target, exist_ok=True)
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    with open(os.path.join(target, _DIGEST_FILE), 'w') as f:
+        f.write(_compiled_digest(templates_dir))
+
+
+def precompiled_loader(directory=COMPILED_TEMPLATES_DIR):
+    '''Return a loader for the templates compiled in DIRECTORY, or None.
+
+    None is returned if there are no compiled templates, which is the case in
+    a development checkout, or if they were compiled from templates that
+    have been modified since, or by another version of Jinja2.
+    '''
+    try:
+        with open(os.path.join(directory, _DIGEST_FILE)) as f:
+            digest = f.read().strip()
+    except OSError:
+        return None
+    if digest != _compiled_digest():
+        return None
+    import jinja2
+    return jinja2.ModuleLoader(directory)
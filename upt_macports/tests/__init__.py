@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from upt_macports import upt_macports
+
+
+_user_cache = None
+
+
+def isolate_user_cache():
+    '''Point $XDG_CACHE_HOME at a temporary directory.
+
+    Rendering Portfiles stores Jinja2 bytecode in the user cache directory:
+    the modules that render Portfiles call this from setUpModule(), and
+    restore_user_cache() from tearDownModule(), so that running the tests does
+    not write to the home directory of the developer.
+    '''
+    global _user_cache
+    directory = tempfile.mkdtemp()
+    environ = mock.patch.dict('os.environ', {'XDG_CACHE_HOME': directory})
+    environ.start()
+    _user_cache = (directory, environ)
+    # The shared Jinja2 environment keeps using the bytecode cache it was
+    # created with: create it now, so that it does not end up using the
+    # directory of a test that changes $XDG_CACHE_HOME.
+    _reset_jinja2_environment()
+    upt_macports._get_template('base.Portfile')
+
+
+def restore_user_cache():
+    global _user_cache
+    directory, environ = _user_cache
+    _user_cache = None
+    environ.stop()
+    _reset_jinja2_environment()
+    shutil.rmtree(directory)
+
+
+def _reset_jinja2_environment():
+    upt_macports._jinja2_env = None
+    upt_macports._jinja2_templates.clear()
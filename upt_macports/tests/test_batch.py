@@ -0,0 +1,367 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import upt
+
+from upt_macports.batch import (BatchResult, UpdateReport,
+                                update_portfiles_in_order)
+from upt_macports.upt_macports import MacPortsBackend, MacPortsPerlPackage
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
+
+
+def make_package(name, frontend):
+    upt_pkg = upt.Package(name, '1.0', homepage='https://example.com',
+                          summary='Summary', description='Description')
+    upt_pkg.frontend = frontend
+    upt_pkg.requirements = {'run': [upt.PackageRequirement('dep')]}
+    return upt_pkg
+
+
+class TestBatchResult(unittest.TestCase):
+    def test_summary(self):
+        result = BatchResult()
+        result.succeeded['foo'] = '/ports/python/py-foo/Portfile'
+        self.assertTrue(result.ok)
+        result.failed['bar'] = 'oops'
+        self.assertFalse(result.ok)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(str(result), '1 succeeded, 1 failed\n  bar: oops')
+
+
+class TestCreatePackages(unittest.TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.macports_backend = MacPortsBackend()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def _check_create_packages(self, use_processes):
+        os.makedirs(os.path.join(self.output, 'python', 'py-exists'))
+        with open(os.path.join(self.output, 'python', 'py-exists',
+                               'Portfile'), 'w'):
+            pass
+        upt_pkgs = [
+            make_package('foo', 'pypi'),
+            make_package('foo', 'rubygems'),
+            make_package('exists', 'pypi'),
+            make_package('baz', 'invalid frontend'),
+        ]
+        result = self.macports_backend.create_packages(
+            upt_pkgs, self.output, max_workers=2,
+            use_processes=use_processes)
+
+        self.assertEqual(result.succeeded, {
+            ('pypi', 'foo'): os.path.join(self.output,
+                                          'python/py-foo/Portfile'),
+            ('rubygems', 'foo'): os.path.join(self.output,
+                                              'ruby/rb-foo/Portfile'),
+        })
+        self.assertEqual(sorted(result.failed),
+                         [('invalid frontend', 'baz'), ('pypi', 'exists')])
+        self.assertIn('already exists', result.failed[('pypi', 'exists')])
+        self.assertIn('  baz (invalid frontend): ', str(result))
+        with open(result.succeeded[('pypi', 'foo')]) as f:
+            self.assertIn('name                py-foo\n', f.read())
+        self.assertEqual(self.macports_backend._pending_lookups,
+                         {'pypi': {'dep'}, 'rubygems': {'dep'}})
+
+    def test_create_packages_processes(self):
+        self._check_create_packages(use_processes=True)
+
+    def test_create_packages_threads(self):
+        self._check_create_packages(use_processes=False)
+
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    def test_create_packages_printed(self, m_stdout):
+        result = self.macports_backend.create_packages(
+            [make_package('foo', 'pypi')], None, use_processes=False)
+        self.assertEqual(result.succeeded, {('pypi', 'foo'): None})
+        self.assertFalse(result.failed)
+        self.assertIn('name                py-foo\n', m_stdout.getvalue())
+
+    def test_create_packages_cpan_dists(self):
+        upt_pkg = make_package('Foo::Bar', 'cpan')
+        upt_pkg.archives = [upt.Archive(
+            'https://cpan.metacpan.org/authors/id/F/FO/FOO/Foo-Bar-1.0.tar.gz',
+            size=1, rmd160='0' * 40, sha256='1' * 64)]
+        dist = ('Foo', 'Foo-Bar-1.0.tar.gz')
+        with mock.patch('upt_macports.cpan.packages_index',
+                        return_value=None), \
+                mock.patch('upt_macports.cpan.probe_dists',
+                           return_value={dist: True}) as m_probe, \
+                mock.patch('upt_macports.batch.create_packages',
+                           return_value=BatchResult()) as m_create:
+            self.macports_backend.create_packages([upt_pkg], self.output)
+        self.assertEqual(list(m_probe.call_args[0][0]), [dist])
+        jobs = m_create.call_args[0][0]
+        self.assertEqual(jobs[0][2], {dist: True})
+
+    def test_create_packages_missing_cpan_index(self):
+        upt_pkg = make_package('Foo::Bar', 'cpan')
+        upt_pkg.archives = [upt.Archive(
+            'https://cpan.metacpan.org/authors/id/F/FO/FOO/Foo-Bar-1.0.tar.gz',
+            size=1, rmd160='0' * 40, sha256='1' * 64)]
+        missing = os.path.join(self.output, 'missing.txt.gz')
+        with mock.patch.dict('os.environ',
+                             {'UPT_MACPORTS_CPAN_PACKAGES': missing}), \
+                mock.patch('upt_macports.cpan.probe_dists') as m_probe:
+            result = self.macports_backend.create_packages(
+                [upt_pkg, make_package('foo', 'pypi')], self.output,
+                use_processes=False)
+        m_probe.assert_not_called()
+        self.assertEqual(list(result.succeeded), [('pypi', 'foo')])
+        self.assertIn('Could not read the index of CPAN packages',
+                      result.failed[('cpan', 'Foo::Bar')])
+
+    def test_create_packages_cpan_render_cache(self):
+        upt_pkg = make_package('Foo::Bar', 'cpan')
+        upt_pkg.archives = [upt.Archive(
+            'https://cpan.metacpan.org/authors/id/F/FO/FOO/Foo-Bar-1.0.tar.gz',
+            size=1, rmd160='0' * 40, sha256='1' * 64)]
+        with mock.patch('upt_macports.upt_macports.MacPortsPerlPackage.'
+                        'in_render_cache', return_value=True), \
+                mock.patch('upt_macports.cpan.packages_index',
+                           return_value=None), \
+                mock.patch('upt_macports.cpan.probe_dists',
+                           return_value={}) as m_probe, \
+                mock.patch('upt_macports.batch.create_packages',
+                           return_value=BatchResult()):
+            self.macports_backend.create_packages([upt_pkg], self.output)
+            self.assertEqual(list(m_probe.call_args[0][0]), [])
+
+
+def make_pdiff(name, old_version, new_version, frontend='pypi'):
+    old = upt.Package(name, old_version)
+    old.frontend = frontend
+    new = upt.Package(name, new_version)
+    new.frontend = frontend
+    return upt.PackageDiff(old, new)
+
+
+class TestUpdatePackages(unittest.TestCase):
+    def setUp(self):
+        self.tree = tempfile.mkdtemp()
+        self.macports_backend = MacPortsBackend()
+        for category, folder in [('python', 'py-foo'), ('devel', 'py-bar'),
+                                 ('python', 'py-same')]:
+            self._write_portfile(category, folder, 'version 1.0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tree)
+
+    def _write_portfile(self, category, folder, content):
+        os.makedirs(os.path.join(self.tree, category, folder))
+        with open(os.path.join(self.tree, category, folder, 'Portfile'),
+                  'w') as f:
+            f.write(content)
+
+    def _read_portfile(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_update_packages(self):
+        pdiffs = [
+            make_pdiff('foo', '1.0', '2.0'),
+            make_pdiff('bar', '1.0', '3.0'),
+            make_pdiff('same', '1.0', '1.0'),
+            make_pdiff('missing', '1.0', '2.0'),
+            make_pdiff('baz', '1.0', '2.0', 'invalid frontend'),
+        ]
+        report = self.macports_backend.update_packages(pdiffs, self.tree,
+                                                       max_workers=2)
+        self.assertIsInstance(report, UpdateReport)
+        self.assertEqual(report.summary(), '2 changed, 1 unchanged, 2 failed')
+        self.assertEqual(sorted(report.changed),
+                         [('pypi', 'bar'), ('pypi', 'foo')])
+        self.assertEqual(
+            report.changed['pypi', 'bar'],
+            os.path.join(self.tree, 'devel', 'py-bar', 'Portfile'))
+        self.assertEqual(self._read_portfile(report.changed['pypi', 'bar']),
+                         'version 3.0\n')
+        self.assertEqual(self._read_portfile(report.changed['pypi', 'foo']),
+                         'version 2.0\n')
+        self.assertEqual(list(report.unchanged), [('pypi', 'same')])
+        self.assertEqual(report.failed['pypi', 'missing'],
+                         'No Portfile found for py-missing')
+        self.assertEqual(sorted(report.failed),
+                         [('invalid frontend', 'baz'), ('pypi', 'missing')])
+
+    def test_update_packages_dry_run(self):
+        pdiffs = [
+            make_pdiff('foo', '1.0', '2.0'),
+            make_pdiff('same', '1.0', '1.0'),
+        ]
+        report = self.macports_backend.update_packages(pdiffs, self.tree,
+                                                       dry_run=True)
+        self.assertEqual(report.summary(), '1 changed, 1 unchanged, 0 failed')
+        self.assertEqual(report.diffs, {
+            ('pypi', 'foo'): ('--- a/python/py-foo/Portfile\n'
+                              '+++ b/python/py-foo/Portfile\n'
+                              '@@ -1 +1 @@\n'
+                              '-version 1.0\n'
+                              '+version 2.0\n'),
+        })
+        self.assertEqual(self._read_portfile(report.changed['pypi', 'foo']),
+                         'version 1.0\n')
+
+    def test_update_package_dry_run(self):
+        self.macports_backend.frontend = 'pypi'
+        path = os.path.join(self.tree, 'python', 'py-foo', 'Portfile')
+        pdiff = make_pdiff('foo', '1.0', '2.0')
+        diff = self.macports_backend.update_package(pdiff, path, dry_run=True)
+        self.assertIn('-version 1.0\n+version 2.0\n', diff)
+        self.assertEqual(self._read_portfile(path), 'version 1.0\n')
+        self.assertTrue(self.macports_backend.update_package(pdiff, path))
+        self.assertEqual(self._read_portfile(path), 'version 2.0\n')
+        self.assertFalse(self.macports_backend.update_package(pdiff, path))
+        self.assertEqual(
+            self.macports_backend.update_package(pdiff, path, dry_run=True),
+            '')
+
+    def test_update_packages_ordered(self):
+        self._write_portfile('python', 'py-broken', 'version 1.0\n')
+        self._write_portfile('python', 'py-app', 'version 1.0\n')
+        pdiffs = [
+            make_pdiff('app', '1.0', '2.0'),
+            make_pdiff('foo', '1.0', '2.0'),
+            make_pdiff('broken', '1.0', '2.0'),
+        ]
+        pdiffs[0].new.requirements = {
+            'run': [upt.PackageRequirement('foo')],
+            'build': [upt.PackageRequirement('broken')],
+        }
+        with open(os.path.join(self.tree, 'python/py-broken/Portfile'),
+                  'wb') as f:
+            f.write(b'version \xff\n')  # Not valid UTF-8
+        report = self.macports_backend.update_packages(pdiffs, self.tree,
+                                                       ordered=True)
+        self.assertEqual(list(report.changed), [('pypi', 'foo')])
+        self.assertEqual(sorted(report.failed),
+                         [('pypi', 'app'), ('pypi', 'broken')])
+        self.assertEqual(report.failed['pypi', 'app'],
+                         'Not updated: broken (pypi) could not be updated')
+
+    def test_update_packages_ordered_frontends(self):
+        # A Python and a Ruby package with the same name do not clash.
+        self._write_portfile('ruby', 'rb-foo', 'version 1.0\n')
+        self._write_portfile('ruby', 'rb-app', 'version 1.0\n')
+        pdiffs = [
+            make_pdiff('app', '1.0', '2.0', 'rubygems'),
+            make_pdiff('foo', '1.0', '2.0', 'rubygems'),
+            make_pdiff('foo', '1.0', '3.0'),
+        ]
+        pdiffs[0].new.requirements = {
+            'run': [upt.PackageRequirement('foo')],
+        }
+        with mock.patch('upt_macports.batch.update_portfiles_in_order',
+                        wraps=update_portfiles_in_order) as m_update:
+            report = self.macports_backend.update_packages(pdiffs, self.tree,
+                                                           ordered=True)
+        self.assertEqual(m_update.call_args[0][1], {
+            ('rubygems', 'app'): {('rubygems', 'foo')},
+            ('rubygems', 'foo'): set(),
+            ('pypi', 'foo'): set(),
+        })
+        self.assertEqual(report.summary(), '3 changed, 0 unchanged, 0 failed')
+        self.assertEqual(
+            self._read_portfile(report.changed['rubygems', 'foo']),
+            'version 2.0\n')
+        self.assertEqual(self._read_portfile(report.changed['pypi', 'foo']),
+                         'version 3.0\n')
+
+    def test_update_packages_ordered_perl_config(self):
+        pdiffs = [
+            make_pdiff('Foo', '1.0', '2.0', 'cpan'),
+            make_pdiff('Bar', '1.0', '2.0', 'cpan'),
+        ]
+        pdiffs[0].new.requirements = {
+            'config': [upt.PackageRequirement('Bar')],
+        }
+        jobs = [(MacPortsPerlPackage, pdiff, None) for pdiff in pdiffs]
+        self.assertEqual(self.macports_backend._batch_dependencies(jobs), {
+            ('cpan', 'Foo'): {('cpan', 'Bar')},
+            ('cpan', 'Bar'): set(),
+        })
+
+
+class TestUpdatePortfilesInOrder(unittest.TestCase):
+    def _update(self, dependencies, failing=(), max_workers=4):
+        order = []
+        lock = threading.Lock()
+
+        def update_portfile(pkg_cls, pdiff, path):
+            with lock:
+                order.append(pdiff.new.name)
+            if pdiff.new.name in failing:
+                raise ValueError('oops')
+            return True
+
+        jobs = [(None, make_pdiff(name, '1.0', '2.0'), f'/{name}/Portfile')
+                for name in sorted(dependencies)]
+        dependencies = {('pypi', name): {('pypi', dep) for dep in deps}
+                        for name, deps in dependencies.items()}
+        with mock.patch('upt_macports.batch._update_portfile',
+                        side_effect=update_portfile):
+            report = update_portfiles_in_order(jobs, dependencies,
+                                               max_workers)
+        return order, report
+
+    def test_order(self):
+        dependencies = {
+            'app': {'lib', 'tool'},
+            'lib': {'base', 'not-in-batch'},
+            'tool': {'base'},
+            'base': set(),
+            'other': set(),
+        }
+        order, report = self._update(dependencies)
+        self.assertEqual(sorted(order), sorted(dependencies))
+        for name, deps in dependencies.items():
+            for dep in deps & set(order):
+                self.assertLess(order.index(dep), order.index(name))
+        self.assertEqual(report.summary(), '5 changed, 0 unchanged, 0 failed')
+        self.assertEqual(report.changed['pypi', 'app'], '/app/Portfile')
+
+    def test_failure(self):
+        dependencies = {
+            'app': {'lib'},
+            'lib': {'base'},
+            'base': set(),
+            'other': set(),
+        }
+        order, report = self._update(dependencies, failing={'base'})
+        self.assertEqual(sorted(order), ['base', 'other'])
+        self.assertEqual(list(report.changed), [('pypi', 'other')])
+        self.assertEqual(report.failed, {
+            ('pypi', 'base'): 'ValueError: oops',
+            ('pypi', 'lib'): 'Not updated: base (pypi) could not be updated',
+            ('pypi', 'app'): 'Not updated: base (pypi) could not be updated',
+        })
+
+    def test_cycle(self):
+        dependencies = {
+            'a': {'b'},
+            'b': {'a'},
+            'c': {'a'},
+        }
+        order, report = self._update(dependencies, max_workers=1)
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertTrue(report.ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from upt_macports.cache import (RenderCache, VersionCache, file_fingerprint,
+                                render_cache, user_cache_dir)
+from upt_macports.upt_macports import MacPortsBackend
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
+
+
+class TestCacheHelpers(unittest.TestCase):
+    def test_user_cache_dir(self):
+        with mock.patch.dict('os.environ', {'XDG_CACHE_HOME': '/cache'}):
+            self.assertEqual(user_cache_dir('foo'), '/cache/upt-macports/foo')
+
+    def test_file_fingerprint(self):
+        self.assertIsNone(file_fingerprint('/does/not/exist'))
+        with tempfile.NamedTemporaryFile() as f:
+            before = file_fingerprint(f.name)
+            f.write(b'foo')
+            f.flush()
+            self.assertNotEqual(file_fingerprint(f.name), before)
+
+
+class TestVersionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'versions.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hits_and_misses(self):
+        cache = VersionCache(self.path, 'fingerprint')
+        cache.set_many({'py-foo': ['1.2'], 'py-bar': []})
+        out = cache.get_many(['py-foo', 'py-bar', 'py-baz'])
+        self.assertEqual(out, {'py-foo': ['1.2'], 'py-bar': []})
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1})
+        cache.close()
+
+        # The cache is persistent
+        cache = VersionCache(self.path, 'fingerprint')
+        self.assertEqual(cache.get_many(['py-foo']), {'py-foo': ['1.2']})
+        cache.close()
+
+    def test_fingerprint_changed(self):
+        cache = VersionCache(self.path, 'old')
+        cache.set_many({'py-foo': ['1.2']})
+        cache.close()
+        cache = VersionCache(self.path, 'new')
+        self.assertEqual(cache.get_many(['py-foo']), {})
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1})
+
+    def test_ttl_expired(self):
+        cache = VersionCache(self.path, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache.set_many({'py-foo': ['1.2']})
+        with mock.patch('time.time', return_value=1059):
+            self.assertEqual(cache.get_many(['py-foo']), {'py-foo': ['1.2']})
+        with mock.patch('time.time', return_value=1061):
+            self.assertEqual(cache.get_many(['py-foo']), {})
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = RenderCache(os.path.join(self.tmpdir, 'renders'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        key = RenderCache.key({'name': 'foo', 'version': '1.0'})
+        self.assertEqual(RenderCache.key({'version': '1.0', 'name': 'foo'}),
+                         key)
+        self.assertNotEqual(RenderCache.key({'name': 'foo',
+                                             'version': '1.1'}),
+                            key)
+
+    def test_hits_and_misses(self):
+        key = RenderCache.key({'name': 'foo'})
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, 'PortSystem 1.0\n')
+        self.assertEqual(self.cache.get(key), 'PortSystem 1.0\n')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1})
+
+        # The cache is persistent
+        cache = RenderCache(os.path.join(self.tmpdir, 'renders'))
+        self.assertEqual(cache.get(key), 'PortSystem 1.0\n')
+
+    def test_render_cache(self):
+        with mock.patch.dict('os.environ', {'XDG_CACHE_HOME': self.tmpdir,
+                                            'UPT_MACPORTS_RENDER_CACHE': ''}):
+            self.assertIsNone(render_cache())
+            os.environ['UPT_MACPORTS_RENDER_CACHE'] = '1'
+            cache = render_cache()
+            self.assertIs(render_cache(), cache)
+        self.assertEqual(cache.directory,
+                         os.path.join(self.tmpdir, 'upt-macports', 'renders'))
+
+
+class TestMacPortsBackendVersionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = {
+            'XDG_CACHE_HOME': self.tmpdir,
+            'UPT_MACPORTS_VERSION_CACHE': '1',
+        }
+
+        # The PortIndex of the port sources of MacPorts
+        self.portindex = os.path.join(self.tmpdir, 'PortIndex')
+        with open(self.portindex, 'w'):
+            pass
+        patcher = mock.patch('upt_macports.upt_macports.source_portindexes',
+                             return_value=[self.portindex])
+        self.m_sources = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _backend(self):
+        backend = MacPortsBackend()
+        backend.frontend = 'pypi'
+        return backend
+
+    @mock.patch('subprocess.getoutput', return_value='version: 1.2')
+    def test_versions_cached_across_runs(self, mock_sub):
+        with mock.patch.dict('os.environ', self.env):
+            self.assertEqual(self._backend().package_versions('foo'), ['1.2'])
+            backend = self._backend()
+            self.assertEqual(backend.package_versions('foo'), ['1.2'])
+        mock_sub.assert_called_once()
+        self.assertEqual(backend.version_cache.stats(),
+                         {'hits': 1, 'misses': 0})
+
+    @mock.patch('subprocess.getoutput', return_value='version: 1.2')
+    def test_port_sync(self, mock_sub):
+        with mock.patch.dict('os.environ', self.env):
+            self._backend().package_versions('foo')
+            with open(self.portindex, 'w') as f:
+                f.write('py-foo 32\nname py-foo version 1.3 ...\n')
+            self._backend().package_versions('foo')
+        self.assertEqual(mock_sub.call_count, 2)
+
+    @mock.patch('subprocess.getoutput', return_value='version: 1.2')
+    def test_no_portindex(self, mock_sub):
+        os.unlink(self.portindex)
+        with mock.patch.dict('os.environ', self.env), \
+                self.assertLogs('upt', 'WARNING'):
+            backend = self._backend()
+            backend.package_versions('foo')
+            self.assertIsNone(backend.version_cache)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmpdir, 'upt-macports', 'versions.sqlite')))
+
+    @mock.patch('shutil.which', return_value='/prefix/bin/port')
+    def test_macports_prefix(self, m_which):
+        with mock.patch.dict('os.environ', self.env):
+            self._backend().version_cache
+        self.m_sources.assert_called_once_with('/prefix')
+
+    @mock.patch('upt_macports.upt_macports.file_fingerprint',
+                return_value='fingerprint')
+    @mock.patch('upt_macports.upt_macports.MacPortsBackend._portindex_versions')  # noqa
+    def test_portindex_part_of_fingerprint(self, m_versions, m_fingerprint):
+        m_versions.side_effect = lambda port_names: {
+            port_name: [backend.portindex_path] for port_name in port_names}
+        with mock.patch.dict('os.environ', self.env):
+            for portindex in ('/a/PortIndex', '/b/PortIndex'):
+                backend = self._backend()
+                backend.portindex_path = portindex
+                self.assertEqual(backend.package_versions('foo'), [portindex])
+        self.assertEqual(m_versions.call_count, 2)
+
+    def test_ttl(self):
+        self.env['UPT_MACPORTS_VERSION_CACHE_TTL'] = '60'
+        with mock.patch.dict('os.environ', self.env):
+            self.assertEqual(self._backend().version_cache_ttl, 60)
+
+    def test_invalid_ttl(self):
+        self.env['UPT_MACPORTS_VERSION_CACHE_TTL'] = 'one day'
+        with mock.patch.dict('os.environ', self.env), \
+                self.assertLogs('upt', 'WARNING'):
+            backend = self._backend()
+        self.assertEqual(backend.version_cache_ttl, VersionCache.DEFAULT_TTL)
+
+    @mock.patch('subprocess.getoutput', return_value='version: 1.2')
+    def test_cache_disabled_by_default(self, mock_sub):
+        self.env.pop('UPT_MACPORTS_VERSION_CACHE')
+        with mock.patch.dict('os.environ', self.env):
+            self._backend().package_versions('foo')
+            backend = self._backend()
+            backend.package_versions('foo')
+        self.assertEqual(mock_sub.call_count, 2)
+        self.assertIsNone(backend.version_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from upt_macports.portindex import PortIndex
+
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                              'benchmarks')
+
+
+def setUpModule():
+    if not os.path.isdir(BENCHMARKS_DIR):
+        raise unittest.SkipTest('The benchmarks are not available')
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+
+def tearDownModule():
+    sys.path.remove(BENCHMARKS_DIR)
+
+
+def describe(corpus):
+    '''Return the packages of CORPUS as plain data, to compare corpora.'''
+    return [
+        (upt_pkg.name, upt_pkg.version,
+         [type(license).__name__ for license in upt_pkg.licenses],
+         {phase: [(req.name, req.specifier) for req in requirements]
+          for phase, requirements in upt_pkg.requirements.items()},
+         upt_pkg.name in corpus.old_packages)
+        for upt_pkg in corpus.packages
+    ]
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        from corpus import Corpus
+        self.Corpus = Corpus
+        self.corpus = Corpus(20, seed=42)
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def test_deterministic(self):
+        self.assertEqual(len(self.corpus.packages), 20)
+        self.assertEqual(describe(self.corpus),
+                         describe(self.Corpus(20, seed=42)))
+        self.assertNotEqual(describe(self.corpus),
+                            describe(self.Corpus(20, seed=43)))
+
+    def test_acyclic(self):
+        positions = {upt_pkg.name: i
+                     for i, upt_pkg in enumerate(self.corpus.packages)}
+        for i, upt_pkg in enumerate(self.corpus.packages):
+            for requirements in upt_pkg.requirements.values():
+                for req in requirements:
+                    self.assertLess(positions[req.name], i)
+
+    def test_write_portindex(self):
+        path = os.path.join(self.output, 'PortIndex')
+        self.corpus.write_portindex(path)
+        index = PortIndex(path)
+        try:
+            self.assertEqual(len(index), len(self.corpus.old_packages))
+            for name, old_pkg in self.corpus.old_packages.items():
+                folder = self.corpus.folder(name)
+                record = index.get(folder)
+                self.assertEqual(record['name'], folder)
+                self.assertEqual(record['portdir'], f'python/{folder}')
+                self.assertEqual(record['version'], old_pkg.version)
+        finally:
+            index.close()
+
+    def test_write_port_executable(self):
+        portindex = os.path.join(self.output, 'PortIndex')
+        port = os.path.join(self.output, 'port')
+        self.corpus.write_portindex(portindex)
+        self.corpus.write_port_executable(port, portindex)
+        expected = {self.corpus.folder(upt_pkg.name):
+                    self.corpus.old_packages.get(upt_pkg.name)
+                    for upt_pkg in self.corpus.packages}
+        self.assertIn(None, expected.values())  # Some ports are missing
+
+        output = subprocess.run(
+            [port, '-p', 'info', '--name', '--version', *expected],
+            stdout=subprocess.PIPE, universal_newlines=True,
+            check=True).stdout
+        versions = {}
+        for record in output.split('--\n'):
+            lines = record.splitlines()
+            if lines[0].startswith('Error: Port '):
+                versions[lines[0].split()[2]] = None
+            else:
+                versions[lines[0][len('name: '):]] = \
+                    lines[1][len('version: '):]
+        self.assertEqual(versions, {
+            folder: old_pkg and old_pkg.version
+            for folder, old_pkg in expected.items()
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import gzip
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import requests_mock
+import upt
+
+from upt_macports import cpan
+from upt_macports.upt_macports import MacPortsPerlPackage
+
+
+class FakeCPANHandler(http.server.BaseHTTPRequestHandler):
+    available = {
+        '/modules/by-module/Foo/Foo-Bar-1.0.tar.gz',
+        '/modules/by-module/Baz/Baz-2.0.tar.gz',
+    }
+
+    def do_HEAD(self):
+        self.server.requests.append(self.path)
+        self.send_response(200 if self.path in self.available else 404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCPANProbing(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      FakeCPANHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.01,))
+        thread.daemon = True
+        thread.start()
+        host, port = self.server.server_address
+        patcher = mock.patch.object(cpan, 'CPAN_MIRROR',
+                                    f'http://{host}:{port}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cpan.clear_cache()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_dist_at_usual_location(self):
+        self.assertTrue(cpan.dist_at_usual_location('Foo',
+                                                    'Foo-Bar-1.0.tar.gz'))
+        self.assertFalse(cpan.dist_at_usual_location('Qux',
+                                                     'Qux-1.0.tar.gz'))
+
+    def test_memoized(self):
+        for _ in range(3):
+            cpan.dist_at_usual_location('Foo', 'Foo-Bar-1.0.tar.gz')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_remember_dists(self):
+        cpan.remember_dists({('Qux', 'Qux-1.0.tar.gz'): True,
+                             ('Foo', 'Foo-Bar-1.0.tar.gz'): None})
+        self.assertTrue(cpan.dist_at_usual_location('Qux',
+                                                    'Qux-1.0.tar.gz'))
+        self.assertEqual(self.server.requests, [])
+        # Unknown locations are looked for again
+        self.assertTrue(cpan.dist_at_usual_location('Foo',
+                                                    'Foo-Bar-1.0.tar.gz'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_probe_dists(self):
+        dists = [
+            ('Foo', 'Foo-Bar-1.0.tar.gz'),
+            ('Baz', 'Baz-2.0.tar.gz'),
+            ('Qux', 'Qux-1.0.tar.gz'),
+            ('Foo', 'Foo-Bar-1.0.tar.gz'),
+        ]
+        expected = {
+            ('Foo', 'Foo-Bar-1.0.tar.gz'): True,
+            ('Baz', 'Baz-2.0.tar.gz'): True,
+            ('Qux', 'Qux-1.0.tar.gz'): False,
+        }
+        self.assertEqual(cpan.probe_dists(dists, max_workers=2), expected)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_probe_dists_unreachable(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertEqual(cpan.probe_dists([('Foo', 'Foo-Bar-1.0.tar.gz')]),
+                         {('Foo', 'Foo-Bar-1.0.tar.gz'): None})
+
+    def test_probe_cpandirs(self):
+        upt_pkgs = []
+        for name in ('Foo::Bar', 'Qux'):
+            upt_pkg = upt.Package(name, '1.0')
+            upt_pkg.archives = [upt.Archive(
+                f'https://cpan/authors/id/F/FO/FOO/{name.replace("::", "-")}-1.0.tar.gz')]  # noqa
+            upt_pkgs.append(upt_pkg)
+        upt_pkgs.append(upt.Package('NoArchive', '1.0'))
+        MacPortsPerlPackage.probe_cpandirs(upt_pkgs)
+        self.assertEqual(len(self.server.requests), 2)
+
+        package = MacPortsPerlPackage()
+        package.upt_pkg = upt_pkgs[0]
+        self.assertEqual(package._cpandir(), '')
+        package.upt_pkg = upt_pkgs[1]
+        self.assertEqual(package._cpandir(), ' ../../authors/id/F/FO/FOO/')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+PACKAGES_DETAILS = """\
+File:         02packages.details.txt
+URL:          http://www.perl.com/CPAN/modules/02packages.details.txt
+Line-Count:   4
+
+Foo::Bar                  1.0  F/FO/FOOBAR/Foo-Bar-1.0.tar.gz
+Foo::Bar::Baz           undef  F/FO/FOOBAR/Foo-Bar-1.0.tar.gz
+Qux::Quux                 2.0  Q/QU/QUX/Qux-2.0.tar.gz
+Other::Quux               2.0  Q/QU/QUX/Quux-2.0.tar.gz
+"""
+
+
+class TestPackagesIndex(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.gz')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(PACKAGES_DETAILS.encode('utf-8')))
+        patcher = mock.patch.dict('os.environ',
+                                  {'UPT_MACPORTS_CPAN_PACKAGES': self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_index(self):
+        index = cpan.PackagesIndex(self.path)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.author_path('Foo-Bar-1.0.tar.gz'),
+                         'F/FO/FOOBAR')
+        self.assertIsNone(index.author_path('Foo-Bar-0.9.tar.gz'))
+        self.assertTrue(index.at_usual_location('Foo', 'Foo-Bar-1.0.tar.gz'))
+        self.assertTrue(index.at_usual_location('Qux', 'Qux-2.0.tar.gz'))
+        self.assertFalse(index.at_usual_location('Foo', 'Qux-2.0.tar.gz'))
+        self.assertFalse(index.at_usual_location('Foo', 'Foo-0.9.tar.gz'))
+
+    def test_packages_index_loaded_once(self):
+        index = cpan.packages_index()
+        self.assertIs(cpan.packages_index(), index)
+        with mock.patch.dict('os.environ', {'UPT_MACPORTS_CPAN_PACKAGES': ''}):
+            self.assertIsNone(cpan.packages_index())
+
+    @requests_mock.mock()
+    def test_cpandir_offline(self, requests):
+        test_cases = {
+            ('Foo::Bar', 'https://cpan/authors/id/F/FO/FOOBAR/Foo-Bar-1.0.tar.gz'): '',  # noqa
+            ('Qux', 'https://cpan/authors/id/Q/QU/QUX/Qux-2.0.tar.gz'): '',
+            ('Quux', 'https://cpan/authors/id/X/XX/XXX/Quux-2.0.tar.gz'):
+                ' ../../authors/id/Q/QU/QUX/',
+            ('Unknown', 'https://cpan/authors/id/U/UN/UNK/Unknown-1.tar.gz'):
+                ' ../../authors/id/U/UN/UNK/',
+        }
+        package = MacPortsPerlPackage()
+        for (name, url), expected in test_cases.items():
+            package.upt_pkg = upt.Package(name, '1.0')
+            package.upt_pkg.archives = [upt.Archive(url)]
+            self.assertEqual(package._cpandir(), expected)
+        self.assertFalse(requests.called)
+        self.assertEqual(MacPortsPerlPackage.probe_cpandirs([]), {})
+
+    def test_cpandir_missing_index(self):
+        package = MacPortsPerlPackage()
+        package.upt_pkg = upt.Package('Foo', '1.0')
+        package.upt_pkg.archives = [upt.Archive('https://cpan/authors/id/F/FO/FOO/Foo-1.0.tar.gz')]  # noqa
+        with mock.patch.dict('os.environ',
+                             {'UPT_MACPORTS_CPAN_PACKAGES': '/not/found'}):
+            with self.assertRaises(SystemExit):
+                package._cpandir()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import upt
+
+from upt_macports.depgraph import DependencyGraph, dependency_port
+from upt_macports.portindex import PortIndex
+from upt_macports.ports_tree import PortsTreeIndex
+from upt_macports.tests.test_portindex import make_portindex
+from upt_macports.upt_macports import MacPortsBackend
+
+
+PORTINDEX = make_portindex([
+    ('py-foo', 'name py-foo portdir python/py-foo version 1.0 '
+               'depends_lib port:python312'),
+    ('py312-foo', 'name py312-foo portdir python/py-foo version 1.0 '
+                  'depends_build port:py312-setuptools '
+                  'depends_lib {port:python312 port:py312-bar}'),
+    ('py-bar', 'name py-bar portdir python/py-bar version 2.0'),
+    ('py312-bar', 'name py312-bar portdir python/py-bar version 2.0 '
+                  'depends_test port:py312-pytest'),
+])
+
+
+class TestDependencyPort(unittest.TestCase):
+    def test_dependency_port(self):
+        test_cases = {
+            'port:foo': 'foo',
+            'port:Foo': 'foo',
+            'bin:git:git': 'git',
+            'path:lib/libz.dylib:zlib': 'zlib',
+            'port:py${python.version}-six': 'py-six',
+            'port:py312-six': 'py-six',
+            'port:py-six': 'py-six',
+            'port:p${perl5.major}-foo-bar': 'p5-foo-bar',
+            'port:p5.34-foo-bar': 'p5-foo-bar',
+            'port:p11-kit': 'p11-kit',
+            'port:rb${ruby.suffix}-foo': 'rb-foo',
+            'port:rb33-foo': 'rb-foo',
+        }
+        for dependency, port in test_cases.items():
+            self.assertEqual(dependency_port(dependency), port)
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = DependencyGraph()
+        self.graph.add_port('py-foo', {
+            'build': ['port:py${python.version}-setuptools'],
+            'lib': ['port:py${python.version}-bar'],
+        })
+        self.graph.add_port('py-bar', {
+            'lib': ['port:py${python.version}-baz'],
+            'test': ['port:py${python.version}-pytest'],
+        })
+        self.graph.add_port('py-qux', {'lib': ['port:py312-bar']})
+
+    def test_ports(self):
+        self.assertIn('py-foo', self.graph)
+        self.assertIn('PY-FOO', self.graph)
+        self.assertNotIn('py-baz', self.graph)
+        self.assertEqual(len(self.graph), 3)
+        self.assertEqual(set(self.graph), {'py-foo', 'py-bar', 'py-qux'})
+
+    def test_dependencies(self):
+        self.assertEqual(self.graph.dependencies('py-foo'),
+                         {'py-setuptools', 'py-bar'})
+        self.assertEqual(self.graph.dependencies('py-foo', ['lib']),
+                         {'py-bar'})
+        self.assertEqual(self.graph.dependencies('py-unknown'), set())
+
+    def test_dependents(self):
+        self.assertEqual(self.graph.dependents('py-bar'),
+                         {'py-foo', 'py-qux'})
+        self.assertEqual(self.graph.dependents('py-bar', ['build']), set())
+        self.assertEqual(self.graph.dependents('py-pytest'), {'py-bar'})
+        self.assertEqual(self.graph.all_dependents('py-baz'),
+                         {'py-bar', 'py-foo', 'py-qux'})
+        self.assertEqual(self.graph.all_dependents('py-pytest', ['lib']),
+                         set())
+
+    def test_from_portindex(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(PORTINDEX)
+            f.flush()
+            graph = DependencyGraph.from_portindex(PortIndex(f.name))
+        self.assertEqual(set(graph), {'py-foo', 'py-bar'})
+        self.assertEqual(graph.dependencies('py-foo'),
+                         {'python312', 'py-setuptools', 'py-bar'})
+        self.assertEqual(graph.dependents('py-pytest', ['test']), {'py-bar'})
+
+    def test_from_portindex_nested_keys(self):
+        # Keys that appear in values are not taken for keys.
+        portindex = make_portindex([
+            ('py-foo', 'name py-foo long_description {Set portdir and '
+                       'depends_lib {in the Portfile}} portdir python/py-foo '
+                       'depends_lib port:py312-bar'),
+            ('py-baz', r'name py-baz description {a \} b} '
+                       'portdir python/py-baz depends_lib port:py312-foo'),
+        ])
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(portindex)
+            f.flush()
+            graph = DependencyGraph.from_portindex(PortIndex(f.name))
+        self.assertEqual(graph.dependencies('py-foo'), {'py-bar'})
+        self.assertEqual(graph.dependencies('py-baz'), {'py-foo'})
+
+    def test_from_ports_tree_index(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        os.makedirs(os.path.join(tmpdir, 'python', 'py-foo'))
+        with open(os.path.join(tmpdir, 'python/py-foo/Portfile'), 'w') as f:
+            f.write('version 1.0\n'
+                    'depends_lib-append port:py${python.version}-bar\n')
+        index = PortsTreeIndex(tmpdir, os.path.join(tmpdir, 'index.json.gz'))
+        index.refresh()
+        graph = DependencyGraph.from_ports_tree_index(index)
+        self.assertEqual(set(graph), {'py-foo'})
+        self.assertEqual(graph.dependents('py-bar'), {'py-foo'})
+
+
+class TestMacPortsBackendDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        self.portindex = tempfile.NamedTemporaryFile()
+        self.portindex.write(PORTINDEX)
+        self.portindex.flush()
+        self.addCleanup(self.portindex.close)
+        env = {'UPT_MACPORTS_PORTINDEX': self.portindex.name}
+        with mock.patch.dict('os.environ', env):
+            self.macports_backend = MacPortsBackend()
+        self.macports_backend.frontend = 'pypi'
+
+    @mock.patch('upt_macports.upt_macports.source_portindexes',
+                return_value=['/does/not/exist'])
+    def test_no_graph(self, m_sources):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            backend = MacPortsBackend()
+        self.assertIsNone(backend.dependency_graph)
+
+    @mock.patch('shutil.which', return_value='/prefix/bin/port')
+    def test_source_portindexes(self, m_which):
+        other = tempfile.NamedTemporaryFile()
+        self.addCleanup(other.close)
+        other.write(make_portindex([
+            ('py-foo', 'name py-foo portdir python/py-foo version 3.0 '
+                       'depends_lib port:py312-other'),
+            ('py-baz', 'name py-baz portdir python/py-baz version 1.0'),
+        ]))
+        other.flush()
+        with mock.patch.dict('os.environ', {}, clear=True):
+            backend = MacPortsBackend()
+        with mock.patch('upt_macports.upt_macports.source_portindexes',
+                        return_value=[self.portindex.name, '/does/not/exist',
+                                      other.name]) as m_sources:
+            graph = backend.dependency_graph
+        m_sources.assert_called_once_with('/prefix')
+        self.assertEqual(set(graph), {'py-foo', 'py-bar', 'py-baz'})
+        # The first source takes precedence.
+        self.assertEqual(graph.dependents('py-bar'), {'py-foo'})
+        self.assertEqual(graph.dependents('py-other'), set())
+
+    @mock.patch('upt.Backend.needs_requirement')
+    def test_needs_requirement(self, mock_need_req):
+        self.assertTrue(self.macports_backend.needs_requirement(
+            upt.PackageRequirement('unknown'), 'run'))
+        self.assertFalse(self.macports_backend.needs_requirement(
+            upt.PackageRequirement('foo'), 'run'))
+        mock_need_req.assert_not_called()
+
+        req = upt.PackageRequirement('foo', '>=2.0')
+        self.macports_backend.needs_requirement(req, 'run')
+        mock_need_req.assert_called_once_with(req, 'run')
+
+    @mock.patch('upt.Backend.needs_requirement')
+    def test_ports_tree_and_portindex(self, mock_need_req):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        os.makedirs(os.path.join(tmpdir, 'python', 'py-foo'))
+        with open(os.path.join(tmpdir, 'python/py-foo/Portfile'), 'w') as f:
+            f.write('version 1.5\n')
+        env = {
+            'UPT_MACPORTS_PORTS_TREE': tmpdir,
+            'UPT_MACPORTS_PORTINDEX': self.portindex.name,
+            'XDG_CACHE_HOME': tmpdir,
+        }
+        with mock.patch.dict('os.environ', env):
+            backend = MacPortsBackend()
+            backend.frontend = 'pypi'
+            self.assertFalse(backend.needs_requirement(
+                upt.PackageRequirement('bar'), 'run'))
+            self.assertTrue(backend.needs_requirement(
+                upt.PackageRequirement('unknown'), 'run'))
+        mock_need_req.assert_not_called()
+        # The ports of the ports tree take precedence.
+        self.assertEqual(backend.dependency_graph.dependencies('py-foo'),
+                         set())
+        self.assertEqual(backend.dependency_graph.dependents('py-bar'), set())
+
+    def test_graph_is_built_once(self):
+        graph = self.macports_backend.dependency_graph
+        self.assertIs(self.macports_backend.dependency_graph, graph)
+        self.assertEqual(graph.dependents('py-bar'), {'py-foo'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from upt_macports.files import write_file
+
+
+class TestWriteFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'Portfile')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self):
+        with open(self.path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_create(self):
+        self.assertTrue(write_file(self.path, 'café\n'))
+        self.assertEqual(self._read(), 'café\n')
+        self.assertEqual(os.listdir(self.tmpdir), ['Portfile'])
+
+    def test_create_umask(self):
+        # The umask in effect when writing is used.
+        for umask, mode in [(0o022, 0o644), (0o077, 0o600)]:
+            old_umask = os.umask(umask)
+            try:
+                write_file(self.path, f'{umask}\n')
+            finally:
+                os.umask(old_umask)
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, mode)
+            os.unlink(self.path)
+
+    def test_unchanged(self):
+        write_file(self.path, 'content\n')
+        with mock.patch('os.replace') as m_replace:
+            self.assertFalse(write_file(self.path, 'content\n'))
+            self.assertFalse(write_file(self.path, 'content\n',
+                                        overwrite=False))
+        m_replace.assert_not_called()
+
+    def test_overwrite(self):
+        write_file(self.path, 'old\n')
+        os.chmod(self.path, 0o600)
+        self.assertTrue(write_file(self.path, 'new\n'))
+        self.assertEqual(self._read(), 'new\n')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_no_overwrite(self):
+        write_file(self.path, 'old\n')
+        with self.assertRaises(FileExistsError):
+            write_file(self.path, 'new\n', overwrite=False)
+        self.assertEqual(self._read(), 'old\n')
+        self.assertEqual(os.listdir(self.tmpdir), ['Portfile'])
+
+    def test_no_overwrite_without_hard_links(self):
+        error = OSError(errno.EPERM, 'Operation not permitted')
+        with mock.patch('os.link', side_effect=error):
+            self.assertTrue(write_file(self.path, 'new\n', overwrite=False))
+            self.assertEqual(self._read(), 'new\n')
+            self.assertEqual(os.listdir(self.tmpdir), ['Portfile'])
+            with self.assertRaises(FileExistsError):
+                write_file(self.path, 'newer\n', overwrite=False)
+        self.assertEqual(self._read(), 'new\n')
+        self.assertEqual(os.listdir(self.tmpdir), ['Portfile'])
+
+    def test_failure(self):
+        write_file(self.path, 'old\n')
+        with mock.patch('os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                write_file(self.path, 'new\n')
+        self.assertEqual(self._read(), 'old\n')
+        self.assertEqual(os.listdir(self.tmpdir), ['Portfile'])
+
+
+if __name__ == '__main__':
+    unittest.main()
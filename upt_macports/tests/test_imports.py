@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+import unittest
+
+
+# How long importing the backend may take, relative to how long importing
+# upt itself takes in the same process: being relative, the budget does not
+# depend on how fast the machine is. On a laptop, the backend takes about 0.3
+# times as long as upt, and it took about 1.5 times as long when all its
+# dependencies were imported eagerly.
+IMPORT_TIME_BUDGET = 0.75
+
+# Modules that are slow to import, and that are only needed to render
+# Portfiles or to reach the network.
+LAZY_MODULES = ['jinja2', 'pkg_resources', 'requests']
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import upt
+upt_elapsed = time.perf_counter() - start
+before = set(sys.modules)
+start = time.perf_counter()
+import upt_macports.upt_macports
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'elapsed': elapsed,
+    'upt_elapsed': upt_elapsed,
+    'imported': sorted(set(sys.modules) - before),
+}))
+'''
+
+
+def _import_backend():
+    output = subprocess.check_output([sys.executable, '-c', _SCRIPT],
+                                     text=True)
+    return json.loads(output)
+
+
+class TestImportTime(unittest.TestCase):
+    def test_lazy_modules(self):
+        imported = _import_backend()['imported']
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported)
+
+    def test_import_time_budget(self):
+        # The best of a few runs, to make up for noisy machines.
+        ratio = min(result['elapsed'] / result['upt_elapsed']
+                    for result in (_import_backend() for _ in range(3)))
+        self.assertLess(ratio, IMPORT_TIME_BUDGET,
+                        f'Importing upt_macports took {ratio:.2f} times as '
+                        'long as importing upt')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import upt
+
+from upt_macports.instrumentation import Stats, stats
+from upt_macports.upt_macports import MacPortsBackend, MacPortsPythonPackage
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
+
+
+class TestStats(unittest.TestCase):
+    def test_disabled(self):
+        s = Stats()
+        with s.timer('stage'):
+            pass
+        s.count('event')
+        self.assertEqual(s.to_dict(), {'timers': {}, 'counters': {}})
+
+    def test_enabled(self):
+        s = Stats(enabled=True)
+        for _ in range(2):
+            with s.timer('stage'):
+                pass
+        with self.assertRaises(ValueError):
+            with s.timer('failing'):
+                raise ValueError
+        s.count('event')
+        s.count('event', 3)
+        data = s.to_dict()
+        self.assertEqual(data['counters'], {'event': 4})
+        self.assertEqual(sorted(data['timers']), ['failing', 'stage'])
+        self.assertEqual(data['timers']['stage']['calls'], 2)
+        self.assertGreaterEqual(data['timers']['stage']['total'],
+                                data['timers']['stage']['max'])
+        s.reset()
+        self.assertEqual(s.to_dict(), {'timers': {}, 'counters': {}})
+
+    @mock.patch('time.perf_counter')
+    def test_nested(self, m_perf_counter):
+        # render: 0 -> 10, licenses: 2 -> 5, cpan.probe: 6 -> 7
+        m_perf_counter.side_effect = [0, 2, 5, 6, 7, 10]
+        s = Stats(enabled=True)
+        with s.timer('render'):
+            with s.timer('licenses'):
+                pass
+            with s.timer('cpan.probe'):
+                pass
+        timers = s.to_dict()['timers']
+        self.assertEqual(timers['render']['total'], 6)
+        self.assertEqual(timers['licenses']['total'], 3)
+        self.assertEqual(timers['cpan.probe']['total'], 1)
+
+    def test_dump(self):
+        s = Stats(enabled=True)
+        s.count('event')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'stats.json')
+            s.dump(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), s.to_dict())
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        patcher = mock.patch.object(stats, 'enabled', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(stats.reset)
+
+    def test_render(self):
+        pkg = MacPortsPythonPackage()
+        pkg.upt_pkg = upt.Package('foo', '1.0')
+        pkg.upt_pkg.licenses = [upt.licenses.BSDThreeClauseLicense()]
+        pkg._render_makefile_template()
+        self.assertEqual(
+            sorted(stats.to_dict()['timers']), ['licenses', 'render'])
+
+    @mock.patch('subprocess.getoutput',
+                return_value='name: py-foo\nversion: 1.0')
+    def test_port_info(self, m_getoutput):
+        backend = MacPortsBackend()
+        backend.frontend = 'pypi'
+        backend.package_versions_many(['foo', 'bar'])
+        data = stats.to_dict()
+        self.assertEqual(data['counters'], {'port_info.ports': 2})
+        self.assertEqual(data['timers']['port_info']['calls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
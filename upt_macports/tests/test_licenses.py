@@ -0,0 +1,67 @@
+import types
+import unittest
+from unittest import mock
+
+from upt_macports import licenses
+
+
+class TestLicenses(unittest.TestCase):
+    def test_table_loaded_once(self):
+        table = licenses._license_table()
+        self.assertIsInstance(table, types.MappingProxyType)
+        self.assertIs(licenses._license_table(), table)
+
+    def test_spdx2macports(self):
+        test_cases = {
+            'BSD-3-Clause': 'BSD',
+            'bsd-3-clause': 'BSD',
+            'GPL-2.0-or-later': 'GPL-2+',
+            'LGPL-2.1': 'LGPL-2.1',
+            'Zlib': 'zlib',
+        }
+        for spdx_identifier, port_license in test_cases.items():
+            self.assertEqual(licenses.spdx2macports(spdx_identifier),
+                             port_license)
+
+    def test_spdx2macports_unknown(self):
+        with self.assertRaises(KeyError):
+            licenses.spdx2macports('fake')
+
+    def test_deprecated_identifiers(self):
+        with mock.patch.object(
+                licenses, '_license_table',
+                return_value={'foo-1.0-only': 'Foo-1',
+                              'foo-1.0-or-later': 'Foo-1+'}):
+            self.assertEqual(licenses.spdx2macports('Foo-1.0'), 'Foo-1')
+            self.assertEqual(licenses.spdx2macports('Foo-1.0+'), 'Foo-1+')
+            self.assertEqual(
+                licenses.spdx2macports('Foo-1.0-with-bar-exception'),
+                'Foo-1')
+
+    def test_spdx_aliases(self):
+        test_cases = {
+            'GPL-2.0': ['gpl-2.0', 'gpl-2.0-only'],
+            'GPL-2.0+': ['gpl-2.0+', 'gpl-2.0-or-later'],
+            'GPL-2.0-only': ['gpl-2.0-only'],
+            'GPL-2.0-or-later': ['gpl-2.0-or-later'],
+            'GPL-2.0-with-GCC-exception': ['gpl-2.0-with-gcc-exception',
+                                           'gpl-2.0', 'gpl-2.0-only'],
+            'GPL-2.0-or-later-with-GCC-exception': [
+                'gpl-2.0-or-later-with-gcc-exception', 'gpl-2.0-or-later'],
+        }
+        for spdx_identifier, aliases in test_cases.items():
+            self.assertEqual(list(licenses._spdx_aliases(spdx_identifier)),
+                             aliases)
+
+    def test_map_licenses(self):
+        expected = {
+            'MIT': 'MIT',
+            'fake': None,
+            'GPL-3.0+': 'GPL-3+',
+        }
+        out = licenses.map_licenses(['MIT', 'fake', 'GPL-3.0+', 'MIT'])
+        self.assertEqual(out, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
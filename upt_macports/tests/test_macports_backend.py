@@ -2,6 +2,15 @@ import unittest
 from unittest import mock
 import upt
 from upt_macports.upt_macports import MacPortsBackend
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
 
 
 class TestMacPortsBackend(unittest.TestCase):
@@ -63,6 +72,79 @@ class TestMacPortsPackageExist(unittest.TestCase):
         with self.assertRaises(SystemExit):
             self.macports_backend.package_versions('foo')
 
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions_many(self, mock_sub):
+        mock_sub.return_value = '''\
+name: py-foo
+version: 1.2
+--
+Error: Port py-bar not found
+name: py-BAZ
+version: 3.4'''
+        expected = {
+            'foo': ['1.2'],
+            'bar': [],
+            'Baz': ['3.4'],
+        }
+        out = self.macports_backend.package_versions_many(['foo', 'bar',
+                                                           'Baz'])
+        self.assertEqual(out, expected)
+        mock_sub.assert_called_once_with(
+            'port -p info --name --version py-bar py-baz py-foo')
+
+        # Results are cached
+        self.assertEqual(self.macports_backend.package_versions('bar'), [])
+        mock_sub.assert_called_once()
+
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions_many_chunks(self, mock_sub):
+        mock_sub.side_effect = lambda cmd: '\n'.join(
+            f'name: {port_name}\nversion: 1.0\n--'
+            for port_name in cmd.split()[5:])
+        self.macports_backend.port_info_chunk_size = 2
+        out = self.macports_backend.package_versions_many(['a', 'b', 'c'])
+        self.assertEqual(out, {'a': ['1.0'], 'b': ['1.0'], 'c': ['1.0']})
+        self.assertEqual(mock_sub.call_args_list, [
+            mock.call('port -p info --name --version py-a py-b'),
+            mock.call('port -p info --name --version py-c'),
+        ])
+
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions_pending_requirements(self, mock_sub):
+        mock_sub.return_value = 'name: py-bar\nversion: 1.2'
+        upt_pkg = upt.Package('foo', '42')
+        upt_pkg.frontend = 'pypi'
+        upt_pkg.requirements = {
+            'run': [upt.PackageRequirement('bar')],
+            'test': [upt.PackageRequirement('baz')],
+        }
+        with mock.patch('upt_macports.upt_macports.MacPortsPackage.create_package'):  # noqa
+            self.macports_backend.create_package(upt_pkg)
+        self.assertEqual(self.macports_backend.package_versions('bar'),
+                         ['1.2'])
+        self.assertEqual(self.macports_backend.package_versions('baz'), [])
+        mock_sub.assert_called_once_with(
+            'port -p info --name --version py-bar py-baz')
+
+    @mock.patch('subprocess.getoutput', return_value='')
+    def test_package_versions_pending_requirements_frontends(self, mock_sub):
+        for frontend in ('pypi', 'rubygems'):
+            upt_pkg = upt.Package('foo', '42')
+            upt_pkg.frontend = frontend
+            upt_pkg.requirements = {
+                'run': [upt.PackageRequirement(f'{frontend}-dep')],
+            }
+            with mock.patch('upt_macports.upt_macports.MacPortsPackage.create_package'):  # noqa
+                self.macports_backend.create_package(upt_pkg)
+        self.macports_backend.frontend = 'pypi'
+        with self.assertRaises(SystemExit):
+            self.macports_backend.package_versions('bar')
+        # Only the requirements of the Python package are looked up
+        mock_sub.assert_called_once_with(
+            'port -p info --name --version py-bar py-pypi-dep')
+        self.assertEqual(self.macports_backend._pending_lookups,
+                         {'rubygems': {'rubygems-dep'}})
+
 
 class TestMacPortsCpanVersion(unittest.TestCase):
     def setUp(self):
@@ -80,8 +162,28 @@ class TestMacPortsCpanVersion(unittest.TestCase):
                     self.macports_backend.standardize_CPAN_version(mp_ver),
                     cpan_ver)
 
+    def test_version_conversion_long_fractional_part(self):
+        self.assertEqual(
+            self.macports_backend.standardize_CPAN_version('0.1234567'),
+            '0.123.456.700')
+        self.assertEqual(
+            self.macports_backend.standardize_CPAN_version('2.001002003'),
+            '2.1.2.3')
+
+    def test_versions_conversion(self):
+        upstream = ['1', 'v1.2.3', '1.2', '1.02', '1.2', '0.1234567']
+        converted = ['1', '1.2.3', '1.200.0', '1.20.0', '1.200.0',
+                     '0.123.456.700']
+        self.assertEqual(
+            self.macports_backend.standardize_CPAN_versions(upstream),
+            converted)
+        self.assertEqual(
+            self.macports_backend.standardize_CPAN_versions([]), [])
+
+    @mock.patch('upt_macports.upt_macports.source_portindexes',
+                return_value=[])
     @mock.patch('upt.Backend.needs_requirement')
-    def test_needs_requirement(self, mock_need_req):
+    def test_needs_requirement(self, mock_need_req, m_sources):
         specifiers = {
             '>=42': '>=42',
             '<=42': '<=42',
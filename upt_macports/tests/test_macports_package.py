@@ -1,8 +1,21 @@
+import os
+import shutil
+import tempfile
 import unittest
 import upt
+from upt_macports import upt_macports
 from upt_macports.upt_macports import MacPortsPackage, logging
 from unittest import mock
 from io import StringIO
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
 
 
 class FakeLicense(upt.licenses.License):
@@ -116,22 +129,31 @@ class TestDirectoryCreation(unittest.TestCase):
 class TestFileCreation(unittest.TestCase):
     def setUp(self):
         self.package = MacPortsPackage()
-        self.package.output_dir = '/outdir'
+        self.package.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.package.output_dir)
         self.package.upt_pkg = upt.Package('foo', '42')
+        self.portfile_path = os.path.join(self.package.output_dir, 'Portfile')
 
-    @mock.patch('builtins.open', new_callable=mock.mock_open)
-    def test_portfile_creation(self, m_open):
-        fn = 'upt_macports.upt_macports.MacPortsPackage._render_makefile_template' # noqa
-        with mock.patch(fn, return_value='Portfile content'):
-            self.package._create_portfile('Portfile content')
-            m_open.assert_called_once_with('/outdir/Portfile', 'x',
-                                           encoding='utf-8')
-            m_open().write.assert_called_once_with('Portfile content')
+    def test_portfile_creation(self):
+        self.assertTrue(self.package._create_portfile('Portfile content'))
+        with open(self.portfile_path) as f:
+            self.assertEqual(f.read(), 'Portfile content')
+        self.assertEqual(os.listdir(self.package.output_dir), ['Portfile'])
 
-    @mock.patch('builtins.open', side_effect=FileExistsError)
-    def test_portfile_file_exists(self, m_open):
+    def test_portfile_file_exists(self):
+        with open(self.portfile_path, 'w') as f:
+            f.write('Old content')
         with self.assertRaises(SystemExit):
             self.package._create_portfile('Portfile content')
+        with open(self.portfile_path) as f:
+            self.assertEqual(f.read(), 'Old content')
+
+    def test_portfile_up_to_date(self):
+        with open(self.portfile_path, 'w') as f:
+            f.write('Portfile content')
+        mtime = os.stat(self.portfile_path).st_mtime_ns
+        self.assertFalse(self.package._create_portfile('Portfile content'))
+        self.assertEqual(os.stat(self.portfile_path).st_mtime_ns, mtime)
 
 
 class TestMacPortsPackageArchiveType(unittest.TestCase):
@@ -161,5 +183,82 @@ class TestMacPortsPackageArchiveType(unittest.TestCase):
         self.assertEqual(self.package.archive_type, expected)
 
 
+class TestTemplateCache(unittest.TestCase):
+    def test_template_compiled_once(self):
+        template = upt_macports._get_template('python.Portfile')
+        self.assertIs(upt_macports._get_template('python.Portfile'), template)
+        self.assertIsNot(upt_macports._get_template('perl.Portfile'),
+                         template)
+
+    @mock.patch('os.makedirs', side_effect=PermissionError)
+    def test_no_bytecode_cache(self, m_mkdir):
+        self.assertIsNone(upt_macports._jinja2_bytecode_cache())
+
+    def test_bytecode_cache(self):
+        with mock.patch.dict('os.environ', {'XDG_CACHE_HOME': '/cache'}), \
+                mock.patch('os.makedirs') as m_mkdir:
+            cache = upt_macports._jinja2_bytecode_cache()
+        m_mkdir.assert_called_once_with('/cache/upt-macports/jinja2',
+                                        exist_ok=True)
+        self.assertEqual(cache.directory, '/cache/upt-macports/jinja2')
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        env = {'XDG_CACHE_HOME': self.tmpdir,
+               'UPT_MACPORTS_RENDER_CACHE': '1'}
+        patcher = mock.patch.dict('os.environ', env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.upt_pkg = upt.Package('foo', '1.0')
+        self.upt_pkg.frontend = 'pypi'
+        self.upt_pkg.licenses = [upt.licenses.MITLicense()]
+        self.upt_pkg.requirements = {
+            'run': [upt.PackageRequirement('bar', '>=1.0')],
+        }
+        self.upt_pkg.archives = [
+            upt.Archive('https://example.com/foo-1.0.tar.gz', size=123,
+                        rmd160='0' * 40, sha256='1' * 64),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _render(self):
+        package = upt_macports.MacPortsPythonPackage()
+        package.upt_pkg = self.upt_pkg
+        with mock.patch.object(package, '_render',
+                               wraps=package._render) as m_render:
+            portfile = package._render_makefile_template()
+        return portfile, m_render.called
+
+    def test_hit(self):
+        portfile, rendered = self._render()
+        self.assertTrue(rendered)
+        self.assertIn('depends_lib-append', portfile)
+        self.assertEqual(self._render(), (portfile, False))
+
+    def test_package_changed(self):
+        self._render()
+        self.upt_pkg.requirements['run'].append(upt.PackageRequirement('baz'))
+        portfile, rendered = self._render()
+        self.assertTrue(rendered)
+        self.assertIn('py${python.version}-baz', portfile)
+
+    def test_templates_changed(self):
+        self._render()
+        with mock.patch('upt_macports.upt_macports.templates_digest',
+                        return_value='new templates'):
+            self.assertTrue(self._render()[1])
+
+    def test_disabled(self):
+        with mock.patch.dict('os.environ', {'UPT_MACPORTS_RENDER_CACHE': ''}):
+            self.assertTrue(self._render()[1])
+            self.assertTrue(self._render()[1])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir,
+                                                     'upt-macports')))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import upt
+
+from upt_macports import names
+from upt_macports.instrumentation import stats
+from upt_macports.upt_macports import (MacPortsPerlPackage,
+                                       MacPortsPythonPackage,
+                                       MacPortsRubyPackage)
+
+
+class TestNameTranslations(unittest.TestCase):
+    def setUp(self):
+        names.clear_caches()
+        self.addCleanup(names.clear_caches)
+
+    def test_cache_stats(self):
+        package = MacPortsPythonPackage()
+        for _ in range(3):
+            self.assertEqual(
+                package.jinja2_reqformat(upt.PackageRequirement('Foo')),
+                'py${python.version}-foo')
+        self.assertEqual(MacPortsPythonPackage._normalized_macports_folder(
+            'Foo'), 'py-foo')
+
+        cache_stats = names.cache_stats()
+        self.assertEqual(
+            cache_stats['MacPortsPythonPackage._dependency_spec'],
+            {'hits': 2, 'misses': 1, 'size': 1, 'hit_rate': 2 / 3})
+        self.assertEqual(
+            cache_stats['MacPortsPythonPackage._normalized_macports_folder'],
+            {'hits': 0, 'misses': 1, 'size': 1, 'hit_rate': 0.0})
+        self.assertEqual(
+            cache_stats['MacPortsRubyPackage._dependency_spec']['hit_rate'],
+            None)
+        self.assertEqual(stats.to_dict()['name_translations'], cache_stats)
+
+    def test_caches_are_per_frontend(self):
+        req = upt.PackageRequirement('Foo::Bar')
+        self.assertEqual(MacPortsPythonPackage().jinja2_reqformat(req),
+                         'py${python.version}-foo::bar')
+        self.assertEqual(MacPortsPerlPackage().jinja2_reqformat(req),
+                         'p${perl5.major}-foo-bar')
+        self.assertEqual(MacPortsRubyPackage().jinja2_reqformat(req),
+                         'rb${ruby.suffix}-foo::bar')
+        cache_stats = names.cache_stats()
+        for frontend in ('Python', 'Perl', 'Ruby'):
+            self.assertEqual(
+                cache_stats[f'MacPorts{frontend}Package._dependency_spec']
+                ['misses'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,24 @@
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
+import requests as requests_lib
 import requests_mock
 
 import upt
 
+from upt_macports import cpan
 from upt_macports.upt_macports import MacPortsPerlPackage
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
 
 
 class TestMacPortsPerlPackage(unittest.TestCase):
@@ -14,6 +28,7 @@ class TestMacPortsPerlPackage(unittest.TestCase):
         self.package.upt_pkg.archives = [
             upt.Archive("https://democpan.org/authors/id/F/FO/FOOBAR/Foo-Bar-13.37.tar.gz")] # noqa
         self.check_url = "https://cpan.metacpan.org/modules/by-module/Foo/Foo-Bar-13.37.tar.gz" # noqa
+        cpan.clear_cache()
 
     def test_pkgname(self):
         expected = ['Foo-bar', 'foo-bar', 'Foo-bar', 'foo-bar']
@@ -41,17 +56,50 @@ class TestMacPortsPerlPackage(unittest.TestCase):
         requests.head(self.check_url, status_code=200)
         self.assertEqual(self.package._cpandir(), expected)
 
+    @requests_mock.mock()
+    def test_distfile_unreachable(self, requests):
+        expected = ' ../../authors/id/F/FO/FOOBAR/'
+        requests.head(self.check_url, exc=requests_lib.ConnectTimeout)
+        self.assertEqual(self.package._cpandir(), expected)
+
+    @requests_mock.mock()
+    def test_distfile_memoized(self, requests):
+        requests.head(self.check_url, status_code=200)
+        self.package._cpandir()
+        self.assertEqual(self.package._cpandir(), '')
+        self.assertEqual(requests.call_count, 1)
+
     @requests_mock.mock()
     def test_missing_distfile(self, requests):
         expected = ' # could not locate dist file'
         self.package.upt_pkg.archives = []
         self.assertEqual(self.package._cpandir(), expected)
 
+    @requests_mock.mock()
+    def test_render_cache_inputs(self, requests):
+        self.package.upt_pkg.frontend = 'cpan'
+        inputs = self.package._render_cache_inputs()
+        self.assertEqual(inputs['cpan_dist'], ['Foo', 'Foo-Bar-13.37.tar.gz'])
+        self.assertEqual(requests.call_count, 0)
+
     def test_jinja2_reqformat(self):
         req = upt.PackageRequirement('Require')
         self.assertEqual(self.package.jinja2_reqformat(req),
                          'p${perl5.major}-require')
 
+    def test_dependency_lists(self):
+        self.package.upt_pkg.requirements = {
+            'build': [upt.PackageRequirement('Foo::Build')],
+            'config': [upt.PackageRequirement('Foo::Config'),
+                       upt.PackageRequirement('Foo::Build')],
+        }
+        self.assertEqual(self.package._dependency_lists(), {
+            'build': ['p${perl5.major}-foo-build',
+                      'p${perl5.major}-foo-config'],
+            'lib': [],
+            'test': [],
+        })
+
     def test_homepage(self):
         upt_homepages = [
             '',
@@ -73,5 +121,48 @@ class TestMacPortsPerlPackage(unittest.TestCase):
             self.assertEqual(self.package.homepage, expected_homepage)
 
 
+class TestPerlRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        env = {'XDG_CACHE_HOME': self.tmpdir,
+               'UPT_MACPORTS_RENDER_CACHE': '1'}
+        patcher = mock.patch.dict('os.environ', env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.upt_pkg = upt.Package('Foo-Bar', '13.37')
+        self.upt_pkg.frontend = 'cpan'
+        self.upt_pkg.licenses = [upt.licenses.MITLicense()]
+        self.upt_pkg.archives = [
+            upt.Archive('https://democpan.org/authors/id/F/FO/FOOBAR/Foo-Bar-13.37.tar.gz',  # noqa
+                        size=123, rmd160='0' * 40, sha256='1' * 64),
+        ]
+        self.check_url = 'https://cpan.metacpan.org/modules/by-module/Foo/Foo-Bar-13.37.tar.gz'  # noqa
+        cpan.clear_cache()
+
+    def _render(self):
+        cpan.clear_cache()
+        package = MacPortsPerlPackage()
+        package.upt_pkg = self.upt_pkg
+        return package._render_makefile_template()
+
+    @requests_mock.mock()
+    def test_hit_without_network(self, requests):
+        requests.head(self.check_url, status_code=200)
+        portfile = self._render()
+        self.assertEqual(requests.call_count, 1)
+        self.assertTrue(MacPortsPerlPackage.in_render_cache(self.upt_pkg))
+        self.assertEqual(self._render(), portfile)
+        self.assertEqual(requests.call_count, 1)
+
+    @requests_mock.mock()
+    def test_unreachable_mirror(self, requests):
+        requests.head(self.check_url, exc=requests_lib.ConnectTimeout)
+        self.assertIn('authors/id/F/FO/FOOBAR', self._render())
+        self.assertFalse(MacPortsPerlPackage.in_render_cache(self.upt_pkg))
+        requests.head(self.check_url, status_code=200)
+        self.assertNotIn('authors/id/F/FO/FOOBAR', self._render())
+
+
 if __name__ == '__main__':
     unittest.main()
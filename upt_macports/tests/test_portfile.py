@@ -0,0 +1,98 @@
+import unittest
+
+from upt_macports.portfile import parse_dependencies, splice, tokenize
+
+
+class TestTokenize(unittest.TestCase):
+    def test_tokenize(self):
+        content = '''\
+github.setup        foo bar 1.2.3
+revision            2
+
+checksums           rmd160  abc \\
+                    size    42
+
+if {${name} ne ${subport}} {
+    depends_lib-append  port:py${python.version}-six \\
+                        port:py${python.version}-xlrd
+    depends_test-append port:py${python.version}-pytest
+}
+python.versions     312
+'''
+        tokens = tokenize(content)
+        # Lines containing "${python.version}" are candidates too; this is
+        # where the old version is then looked for.
+        version_lines = [tokens.text(span) for span in tokens.version_lines]
+        self.assertEqual(len(version_lines), 5)
+        self.assertEqual(version_lines[0], 'github.setup        foo bar 1.2.3')
+        self.assertEqual(version_lines[-1], 'python.versions     312')
+        self.assertEqual(tokens.text(tokens.revision), '2')
+        self.assertEqual(tokens.first_block(tokens.checksums),
+                         'checksums           rmd160  abc \\\n'
+                         '                    size    42\n')
+        self.assertEqual(tokens.first_block(tokens.depends['lib']),
+                         '    depends_lib-append  port:py${python.version}-six \\\n'  # noqa
+                         '                        port:py${python.version}-xlrd\n')  # noqa
+        self.assertEqual(tokens.first_block(tokens.depends['test']),
+                         '    depends_test-append port:py${python.version}-pytest\n')  # noqa
+        self.assertEqual(tokens.depends['build'], [])
+        self.assertEqual(tokens.first_block(tokens.depends['build']), '')
+
+    def test_tokenize_repeated_blocks(self):
+        content = '''\
+depends_lib-append port:foo
+depends_lib-append \\
+    port:bar
+'''
+        tokens = tokenize(content)
+        self.assertEqual(tokens.depends['lib'], [(0, 28), (28, len(content))])
+        self.assertIsNone(tokens.revision)
+
+    def test_tokenize_revision(self):
+        content = '''\
+# Bump the revision when the patch changes
+subport py312-foo {
+    revision        3
+}
+'''
+        tokens = tokenize(content)
+        self.assertEqual(tokens.text(tokens.revision), '3')
+
+    def test_tokenize_unterminated_block(self):
+        tokens = tokenize('checksums rmd160 abc')
+        self.assertEqual(tokens.checksums, [])
+
+
+class TestParseDependencies(unittest.TestCase):
+    def test_parse_dependencies(self):
+        block = (
+            '    depends_lib-append  port:py${python.version}-six \\\n'
+            '                        port:py${python.version}-xlrd\n')
+        self.assertEqual(parse_dependencies(block, 'lib'),
+                         ['port:py${python.version}-six',
+                          'port:py${python.version}-xlrd'])
+        self.assertEqual(parse_dependencies('', 'lib'), [])
+
+
+class TestSplice(unittest.TestCase):
+    def test_splice(self):
+        content = 'version 1.2\nrevision 3\n'
+        edits = [
+            (len(content), len(content), 'foo\n'),
+            (21, 22, '0'),
+            (8, 11, '4.5.6'),
+            (len(content), len(content), 'bar\n'),
+        ]
+        self.assertEqual(splice(content, edits),
+                         'version 4.5.6\nrevision 0\nfoo\nbar\n')
+
+    def test_splice_overlapping_edits(self):
+        self.assertEqual(splice('abcdef', [(1, 4, 'X'), (2, 3, 'Y')]),
+                         'aXef')
+
+    def test_splice_no_edits(self):
+        self.assertEqual(splice('abc', []), 'abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
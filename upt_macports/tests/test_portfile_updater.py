@@ -2,11 +2,13 @@
 #
 # Licensed under the 3-clause BSD license. See the LICENSE file.
 import io
+import os
+import tempfile
 import unittest
 from unittest import mock
 
 import upt
-from upt_macports.portfile_updater import PortfileUpdater
+from upt_macports.portfile_updater import PortfileUpdater, unified_diff
 from upt_macports.upt_macports import MacPortsPythonPackage
 
 
@@ -31,6 +33,24 @@ class TestPortfileUpdater(unittest.TestCase):
             out = self.updater._update_version(before, '1.2.3', '4.5.6')
             self.assertEqual(out, after)
 
+    def test_update_version_escaped(self):
+        # Versions are not regular expressions
+        out = self.updater._update_version('version 1x2y3', '1.2.3', '4.5.6')
+        self.assertEqual(out, 'version 1x2y3')
+
+        test_cases = {
+            'version 1.2.3+dfsg': 'version 4.5.6',
+            'perl5.setup Foo-Bar 1.2.3+dfsg 1.2.3+dfsg':
+                'perl5.setup Foo-Bar 1.2.3+dfsg 4.5.6',
+        }
+        for before, after in test_cases.items():
+            out = self.updater._update_version(before, '1.2.3+dfsg', '4.5.6')
+            self.assertEqual(out, after)
+
+    def test_update_version_replacement_is_literal(self):
+        out = self.updater._update_version('version 1.0', '1.0', r'2.0\g<0>')
+        self.assertEqual(out, r'version 2.0\g<0>')
+
     def test_update_revision(self):
         test_cases = {
             'revision      1\n': 'revision      0\n',
@@ -423,6 +443,56 @@ depends_test-append port:py${python.version}-pytest \\
         updater.portfile_fp.seek(0)
         self.assertEqual(updater.portfile_fp.read(), new_portfile)
 
+    def test_update_unchanged(self):
+        portfile = mock.Mock(wraps=io.StringIO('line1\n'))
+        updater = PortfileUpdater(portfile, None, mock.Mock())
+        updater._update_portfile_content = lambda: 'line1\n'
+        self.assertFalse(updater.update())
+        portfile.write.assert_not_called()
+        portfile.truncate.assert_not_called()
+
+    def test_update_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'Portfile')
+            with open(path, 'w') as f:
+                f.write('line1\n')
+            os.chmod(path, 0o640)
+            with open(path) as f:
+                updater = PortfileUpdater(f, None, mock.Mock())
+                updater._update_portfile_content = lambda: 'line2\n'
+                self.assertTrue(updater.update())
+            with open(path) as f:
+                self.assertEqual(f.read(), 'line2\n')
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+            self.assertEqual(os.listdir(tmpdir), ['Portfile'])
+
+    def test_diff(self):
+        portfile = mock.Mock(wraps=io.StringIO('line1\nline2\n'))
+        updater = PortfileUpdater(portfile, None, mock.Mock())
+        updater._update_portfile_content = lambda: 'line1\nline3\n'
+        expected = ('--- a/python/py-foo/Portfile\n'
+                    '+++ b/python/py-foo/Portfile\n'
+                    '@@ -1,2 +1,2 @@\n'
+                    ' line1\n'
+                    '-line2\n'
+                    '+line3\n')
+        self.assertEqual(updater.diff('python/py-foo/Portfile'), expected)
+        portfile.write.assert_not_called()
+
+    def test_diff_unchanged(self):
+        updater = PortfileUpdater(io.StringIO('line1\n'), None, mock.Mock())
+        updater._update_portfile_content = lambda: 'line1\n'
+        self.assertEqual(updater.diff(), '')
+
+    def test_unified_diff_no_newline(self):
+        expected = ('--- a/Portfile\n'
+                    '+++ b/Portfile\n'
+                    '@@ -1 +1 @@\n'
+                    '-line1\n'
+                    '\\ No newline at end of file\n'
+                    '+line1\n')
+        self.assertEqual(unified_diff('line1', 'line1\n'), expected)
+
     def test_update_shorter_portfile(self):
         old_portfile = 'line1\nline2\n'
         new_portfile = 'line3\n'
@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import upt
+
+from upt_macports.portindex import (PortIndex, parse_tcl_list,
+                                    source_portindexes)
+from upt_macports.upt_macports import MacPortsBackend
+
+
+def make_portindex(records):
+    '''Return the content of a PortIndex made of RECORDS.'''
+    content = ''
+    for name, record in records:
+        # Like portindex.tcl, count the characters, not the bytes.
+        line = f'{record}\n'
+        content += f'{name} {len(line)}\n{line}'
+    return content.encode('utf-8')
+
+
+PORTINDEX = make_portindex([
+    ('py-foo', 'name py-foo portdir python/py-foo version 1.2.3 '
+               'description {Foo for Python} '
+               'depends_lib {port:python312 port:py312-six}'),
+    ('py-café', 'name py-café portdir python/py-café version 2.0 '
+                'description {Café — ☕ for Python}'),
+    ('p5-Foo-Bar', 'name p5-Foo-Bar version 0.42 '
+                   'long_description {A {nested} description}'),
+])
+
+
+class TestParseTclList(unittest.TestCase):
+    def test_parse_tcl_list(self):
+        test_cases = {
+            '': [],
+            'a b  c': ['a', 'b', 'c'],
+            'a {b c} d': ['a', 'b c', 'd'],
+            'a {b {c d}} e': ['a', 'b {c d}', 'e'],
+            'a "b c" d': ['a', 'b c', 'd'],
+            r'a b\ c': ['a', 'b c'],
+            'a {} b': ['a', '', 'b'],
+        }
+        for string, expected in test_cases.items():
+            self.assertEqual(parse_tcl_list(string), expected)
+
+
+class TestPortIndex(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PORTINDEX)
+        self.portindex = PortIndex(self.path)
+
+    def tearDown(self):
+        self.portindex.close()
+        os.unlink(self.path)
+
+    def test_index(self):
+        self.assertEqual(len(self.portindex), 3)
+        self.assertIn('py-foo', self.portindex)
+        self.assertIn('p5-foo-bar', self.portindex)
+        self.assertNotIn('py-bar', self.portindex)
+
+    def test_get(self):
+        record = self.portindex.get('py-foo')
+        self.assertEqual(record['version'], '1.2.3')
+        self.assertEqual(record['description'], 'Foo for Python')
+        self.assertEqual(record['depends_lib'],
+                         'port:python312 port:py312-six')
+        self.assertIsNone(self.portindex.get('py-bar'))
+
+    def test_get_keys(self):
+        keys = ('portdir', 'depends_lib', 'depends_test')
+        self.assertEqual(self.portindex.get('py-foo', keys), {
+            'portdir': 'python/py-foo',
+            'depends_lib': 'port:python312 port:py312-six',
+        })
+        self.assertEqual(self.portindex.get('p5-foo-bar', ('description',)),
+                         {})
+
+    def test_non_ascii(self):
+        record = self.portindex.get('py-café')
+        self.assertEqual(record['description'], 'Café — ☕ for Python')
+        self.assertEqual(self.portindex.version('P5-Foo-Bar'), '0.42')
+
+    def test_version(self):
+        self.assertEqual(self.portindex.version('P5-Foo-Bar'), '0.42')
+        self.assertIsNone(self.portindex.version('py-bar'))
+
+    def test_empty_portindex(self):
+        with open(self.path, 'wb'):
+            pass
+        self.assertEqual(len(PortIndex(self.path)), 0)
+
+    def test_invalid_portindex(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage\n')
+        with self.assertRaises(ValueError):
+            PortIndex(self.path)
+
+
+class TestSourcePortIndexes(unittest.TestCase):
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.prefix, 'etc', 'macports'))
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def _write_conf(self, name, content):
+        path = os.path.join(self.prefix, 'etc', 'macports', name)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_source_portindexes(self):
+        self._write_conf('sources.conf', '''
+# The default source
+rsync://rsync.macports.org/macports/release/tarballs/ports.tar [default]
+file:///Users/me/ports [nosync]
+https://example.com/ports/
+''')
+        sources = os.path.join(self.prefix, 'var', 'macports', 'sources')
+        self.assertEqual(source_portindexes(self.prefix), [
+            f'{sources}/rsync.macports.org/macports/release/tarballs/ports/'
+            'PortIndex',
+            '/Users/me/ports/PortIndex',
+            f'{sources}/example.com/ports/PortIndex',
+        ])
+
+    def test_portdbpath(self):
+        self._write_conf('macports.conf', 'portdbpath\t/db\n')
+        self._write_conf('sources.conf',
+                         'https://example.com/snapshots/ports.tar.gz\n')
+        self.assertEqual(source_portindexes(self.prefix), [
+            '/db/sources/example.com/snapshots/ports/PortIndex',
+        ])
+
+    def test_no_macports(self):
+        self.assertEqual(source_portindexes(self.prefix), [])
+
+
+class TestMacPortsBackendPortIndex(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PORTINDEX)
+        with mock.patch.dict('os.environ',
+                             {'UPT_MACPORTS_PORTINDEX': self.path}):
+            self.macports_backend = MacPortsBackend()
+        self.macports_backend.frontend = 'pypi'
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions(self, mock_sub):
+        self.assertEqual(self.macports_backend.package_versions('foo'),
+                         ['1.2.3'])
+        self.assertEqual(self.macports_backend.package_versions('bar'), [])
+        mock_sub.assert_not_called()
+
+    def test_missing_portindex(self):
+        self.macports_backend.portindex_path = '/does/not/exist'
+        with self.assertRaises(SystemExit):
+            self.macports_backend.package_versions('foo')
+
+    def test_unhandled_frontend(self):
+        self.macports_backend.frontend = 'invalid frontend'
+        with self.assertRaises(upt.UnhandledFrontendError):
+            self.macports_backend.package_versions('foo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from upt_macports.ports_tree import PortsTree, PortsTreeIndex, parse_portfile
+from upt_macports.upt_macports import MacPortsBackend
+
+
+PY_FOO = '''\
+PortSystem          1.0
+PortGroup           python 1.0
+
+name                py-foo
+version             1.2.3
+revision            2
+
+checksums           rmd160  abc \\
+                    sha256  def \\
+                    size    42
+
+python.versions     312
+
+if {${name} ne ${subport}} {
+    depends_build-append \\
+                    port:py${python.version}-setuptools
+    depends_lib-append  port:py${python.version}-six
+}
+'''
+
+P5_BAR = '''\
+PortSystem          1.0
+PortGroup           perl5 1.0
+
+perl5.setup         Bar 0.42
+'''
+
+
+class TestParsePortfile(unittest.TestCase):
+    def test_parse_portfile(self):
+        expected = {
+            'version': '1.2.3',
+            'revision': 2,
+            'checksums': {'rmd160': 'abc', 'sha256': 'def', 'size': '42'},
+            'depends': {
+                'build': ['port:py${python.version}-setuptools'],
+                'lib': ['port:py${python.version}-six'],
+                'test': [],
+            },
+        }
+        self.assertEqual(parse_portfile(PY_FOO), expected)
+
+    def test_parse_portfile_setup(self):
+        test_cases = {
+            'perl5.setup Foo-Bar 1.2 ../by-authors/\n': '1.2',
+            'ruby.setup foo 1.2 gem {} rubygems\n': '1.2',
+            'github.setup author project 1.2 v\n': '1.2',
+            'bitbucket.setup author project 1.2\n': '1.2',
+            'python.versions 312\n': None,
+        }
+        for content, version in test_cases.items():
+            metadata = parse_portfile(content)
+            self.assertEqual(metadata['version'], version)
+            self.assertEqual(metadata['revision'], 0)
+            self.assertEqual(metadata['checksums'], {})
+
+
+class PortsTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'ports')
+        self.index_path = os.path.join(self.tmpdir, 'index.json.gz')
+        self._write_portfile('python/py-foo', PY_FOO)
+        self._write_portfile('perl/p5-bar', P5_BAR)
+        os.makedirs(os.path.join(self.root, 'perl', 'p5-empty'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_portfile(self, folder, content):
+        os.makedirs(os.path.join(self.root, folder), exist_ok=True)
+        with open(os.path.join(self.root, folder, 'Portfile'), 'w') as f:
+            f.write(content)
+
+
+class TestPortsTree(PortsTreeTestCase):
+    def test_portfile_path(self):
+        tree = PortsTree(self.root)
+        self.assertEqual(tree.portfile_path('python', 'py-foo'),
+                         os.path.join(self.root, 'python/py-foo/Portfile'))
+        self.assertEqual(tree.portfile_path('python', 'p5-bar'),
+                         os.path.join(self.root, 'perl/p5-bar/Portfile'))
+        self.assertIsNone(tree.portfile_path('perl', 'p5-empty'))
+
+
+class TestPortsTreeIndex(PortsTreeTestCase):
+    def test_refresh(self):
+        index = PortsTreeIndex(self.root, self.index_path)
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(sorted(index), ['p5-bar', 'py-foo'])
+        self.assertEqual(index.version('py-foo'), '1.2.3')
+        self.assertEqual(index.version('p5-bar'), '0.42')
+        self.assertIsNone(index.version('p5-empty'))
+        self.assertEqual(index.get('py-foo')['depends']['lib'],
+                         ['port:py${python.version}-six'])
+        self.assertEqual(index.portfile_path('p5-bar'),
+                         os.path.join(self.root, 'perl/p5-bar/Portfile'))
+
+        # Nothing changed
+        self.assertEqual(index.refresh(), 0)
+
+        # Only modified and new Portfiles are parsed again
+        self._write_portfile('perl/p5-bar', P5_BAR.replace('0.42', '0.43'))
+        self._write_portfile('python/py-new', 'version 3.0\n')
+        shutil.rmtree(os.path.join(self.root, 'python', 'py-foo'))
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(sorted(index), ['p5-bar', 'py-new'])
+        self.assertEqual(index.version('p5-bar'), '0.43')
+
+    def test_save_and_load(self):
+        index = PortsTreeIndex(self.root, self.index_path)
+        index.refresh()
+        index.save()
+
+        index = PortsTreeIndex(self.root, self.index_path)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.refresh(), 0)
+
+        # An index of another tree is not reused
+        other_root = os.path.join(self.tmpdir, 'other')
+        os.makedirs(other_root)
+        index = PortsTreeIndex(other_root, self.index_path)
+        self.assertEqual(len(index), 0)
+
+    def test_save_temporary_file(self):
+        index = PortsTreeIndex(self.root, self.index_path)
+        index.refresh()
+        with mock.patch('json.dump', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                index.save()
+        index.save()
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ['index.json.gz', 'ports'])
+
+    def test_default_path(self):
+        with mock.patch.dict('os.environ', {'XDG_CACHE_HOME': '/cache'}):
+            index = PortsTreeIndex(self.root)
+        self.assertTrue(index.path.startswith('/cache/upt-macports/'))
+
+
+class TestMacPortsBackendPortsTree(PortsTreeTestCase):
+    def setUp(self):
+        super().setUp()
+        env = {
+            'UPT_MACPORTS_PORTS_TREE': self.root,
+            'XDG_CACHE_HOME': os.path.join(self.tmpdir, 'cache'),
+        }
+        patcher = mock.patch.dict('os.environ', env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.macports_backend = MacPortsBackend()
+        self.macports_backend.frontend = 'pypi'
+
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions(self, mock_sub):
+        self.assertEqual(self.macports_backend.package_versions('foo'),
+                         ['1.2.3'])
+        self.assertEqual(self.macports_backend.package_versions('bar'), [])
+        mock_sub.assert_not_called()
+        index_path = self.macports_backend.ports_tree_index.path
+        self.assertTrue(os.path.exists(index_path))
+
+    @mock.patch('subprocess.getoutput')
+    def test_package_versions_portindex_fallback(self, mock_sub):
+        record = b'name py-bar portdir python/py-bar version 2.0\n'
+        portindex = os.path.join(self.tmpdir, 'PortIndex')
+        with open(portindex, 'wb') as f:
+            f.write(b'py-bar %d\n' % len(record) + record)
+        self.macports_backend.portindex_path = portindex
+        self.assertEqual(self.macports_backend.package_versions('foo'),
+                         ['1.2.3'])
+        self.assertEqual(self.macports_backend.package_versions('bar'),
+                         ['2.0'])
+        self.assertEqual(self.macports_backend.package_versions('baz'), [])
+        mock_sub.assert_not_called()
+
+    def test_no_version_cache(self):
+        with mock.patch.dict('os.environ',
+                             {'UPT_MACPORTS_VERSION_CACHE': '1'}):
+            backend = MacPortsBackend()
+        self.assertIsNone(backend.version_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
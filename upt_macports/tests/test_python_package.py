@@ -37,6 +37,20 @@ class TestMacPortsPythonPackage(unittest.TestCase):
         self.assertEqual(self.package.jinja2_reqformat(req),
                          'py${python.version}-require')
 
+    def test_dependency_lists(self):
+        self.package.upt_pkg.requirements = {
+            'run': [upt.PackageRequirement('foo'),
+                    upt.PackageRequirement('Bar'),
+                    upt.PackageRequirement('bar'),
+                    upt.PackageRequirement('foo')],
+            'test': [upt.PackageRequirement('pytest')],
+        }
+        self.assertEqual(self.package._dependency_lists(), {
+            'build': [],
+            'lib': ['py${python.version}-bar', 'py${python.version}-foo'],
+            'test': ['py${python.version}-pytest'],
+        })
+
     def test_homepage(self):
         upt_homepages = [
             '',
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import jinja2
+import upt
+
+from upt_macports import templating
+from upt_macports import upt_macports
+from upt_macports.tests import isolate_user_cache, restore_user_cache
+
+
+def setUpModule():
+    isolate_user_cache()
+
+
+def tearDownModule():
+    restore_user_cache()
+
+
+class TestTemplatesDigest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_digest_changes(self):
+        path = os.path.join(self.tmpdir, 'foo.Portfile')
+        with open(path, 'w') as f:
+            f.write('foo')
+        before = templating.templates_digest.__wrapped__(self.tmpdir)
+        with open(path, 'w') as f:
+            f.write('bar')
+        self.assertNotEqual(
+            templating.templates_digest.__wrapped__(self.tmpdir), before)
+
+
+class TestCompiledTemplates(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        templating.compile_templates(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_compiled_templates(self):
+        loader = templating.precompiled_loader(self.tmpdir)
+        self.assertIsInstance(loader, jinja2.ModuleLoader)
+
+        upt_pkg = upt.Package('foo', '1.0')
+        upt_pkg.frontend = 'pypi'
+        upt_pkg.requirements = {'run': [upt.PackageRequirement('bar')]}
+        pkg = upt_macports.MacPortsPythonPackage()
+        pkg.upt_pkg = upt_pkg
+        compiled = jinja2.Environment(loader=loader,
+                                      **templating.ENVIRONMENT_OPTIONS)
+        self.assertEqual(
+            compiled.get_template(pkg.template).render(
+                pkg=pkg, dependencies=pkg._dependency_lists()),
+            pkg._render())
+
+    def test_no_compiled_templates(self):
+        missing = os.path.join(self.tmpdir, 'missing')
+        self.assertIsNone(templating.precompiled_loader(missing))
+
+    def test_stale_compiled_templates(self):
+        with mock.patch('upt_macports.templating.templates_digest',
+                        return_value='modified templates'):
+            self.assertIsNone(templating.precompiled_loader(self.tmpdir))
+
+    def test_other_jinja2_version(self):
+        with mock.patch('jinja2.__version__', '1.0'):
+            self.assertIsNone(templating.precompiled_loader(self.tmpdir))
+
+    def test_get_template(self):
+        loader = templating.precompiled_loader(self.tmpdir)
+        with mock.patch.object(upt_macports, '_jinja2_env', None), \
+                mock.patch.object(upt_macports, '_jinja2_templates', {}), \
+                mock.patch('upt_macports.upt_macports.precompiled_loader',
+                           return_value=loader):
+            template = upt_macports._get_template('perl.Portfile')
+        self.assertTrue(template.filename.startswith(self.tmpdir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,145 @@
 import upt
+import functools
 import logging
-import jinja2
-import pkg_resources
-import json
-import requests
 import os
+import re
+import shlex
+import shutil
+import sqlite3
 import subprocess
 import sys
-from packaging.specifiers import SpecifierSet
+import threading
 
+from upt_macports import batch
+from upt_macports import cpan
+from upt_macports.cache import (VersionCache, file_fingerprint, render_cache,
+                                user_cache_dir)
+from upt_macports.depgraph import DependencyGraph
+from upt_macports.files import write_file
+from upt_macports.instrumentation import stats
+from upt_macports.licenses import map_licenses, table_digest
+from upt_macports.names import cached_translation
 from upt_macports.portfile_updater import PortfileUpdater
+from upt_macports.portindex import PortIndex, source_portindexes
+from upt_macports.ports_tree import PortsTree, PortsTreeIndex
+from upt_macports.templating import (ENVIRONMENT_OPTIONS, precompiled_loader,
+                                     templates_digest)
+
+
+# Part of the key of the Portfiles stored in the render cache. It must be
+# bumped when a change to this module modifies the rendered Portfiles, so
+# that Portfiles rendered by previous versions are no longer used. Changes to
+# the templates and to spdx2macports.json are detected automatically.
+RENDER_CACHE_VERSION = 1
+
+# upt imports every backend, even to run commands that have nothing to do
+# with MacPorts, so dependencies that are slow to import are only imported
+# when they are first needed: jinja2 by the helpers below, requests by
+# MacPortsPerlPackage._cpandir() and packaging by
+# _standardize_CPAN_specifier().
+_jinja2_lock = threading.Lock()
+_jinja2_env = None
+_jinja2_templates = {}
+
+
+def _jinja2_bytecode_cache():
+    """Return an on-disk bytecode cache, or None if it cannot be created."""
+    import jinja2
+
+    directory = user_cache_dir('jinja2')
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    return jinja2.FileSystemBytecodeCache(directory)
+
+
+def _get_template(name):
+    """Return the compiled template NAME, shared by the whole process.
+
+    The Jinja2 environment is only created once, and each template is only
+    loaded once. Templates are loaded from the Python modules they were
+    compiled to when the package was built, if they are up to date. Otherwise
+    they are compiled from source, and the compiled templates are stored on
+    disk, so that new processes do not have to compile them again.
+    """
+    import jinja2
+
+    global _jinja2_env
+    with _jinja2_lock:
+        try:
+            return _jinja2_templates[name]
+        except KeyError:
+            pass
+        if _jinja2_env is None:
+            loader = jinja2.PackageLoader('upt_macports', 'templates')
+            compiled_loader = precompiled_loader()
+            if compiled_loader is not None:
+                loader = jinja2.ChoiceLoader([compiled_loader, loader])
+            _jinja2_env = jinja2.Environment(
+                loader=loader,
+                bytecode_cache=_jinja2_bytecode_cache(),
+                auto_reload=False,
+                **ENVIRONMENT_OPTIONS,
+            )
+        template = _jinja2_env.get_template(name)
+        _jinja2_templates[name] = template
+        return template
+
+
+# Groups of three digits of the fractional part of a CPAN version
+_CPAN_VERSION_GROUP_RE = re.compile('.{3}', re.DOTALL)
+
+
+@functools.lru_cache(maxsize=4096)
+def _standardize_CPAN_version(version):
+    version_strip = version.lstrip('v')
+    version_split = version_strip.split('.')
+
+    # no or more than 1 'dots': no conversion required
+    if len(version_split) != 2:
+        return version_strip
+
+    # conversion required: the fractional part is padded with zeros to a
+    # multiple of three digits (and at least six), and each group of three
+    # digits becomes a component of the version.
+    integer, fractional = version_split
+    width = max(6, -(-len(fractional) // 3) * 3)
+    groups = _CPAN_VERSION_GROUP_RE.findall(fractional.ljust(width, '0'))
+    return '.'.join([integer, *map(str, map(int, groups))])
+
+
+@functools.lru_cache(maxsize=4096)
+def _standardize_CPAN_specifier(specifier):
+    from packaging.specifiers import SpecifierSet
+
+    return ', '.join([dep.operator + _standardize_CPAN_version(dep.version)
+                      for dep in SpecifierSet(specifier)])
 
 
 class MacPortsPackage(object):
+    # The upt phases whose requirements go in each depends_<kind> statement
+    # of the Portfile
+    dependency_kinds = {
+        'build': ('build',),
+        'lib': ('run',),
+        'test': ('test',),
+    }
+
     def __init__(self):
         self.logger = logging.getLogger('upt')
+        # Whether the rendered Portfile may be stored in the render cache
+        self._render_cacheable = True
+
+    @classmethod
+    def in_render_cache(cls, upt_pkg):
+        """Return whether the Portfile of UPT_PKG is in the render cache."""
+        cache = render_cache()
+        if cache is None:
+            return False
+        pkg = cls()
+        pkg.upt_pkg = upt_pkg
+        return cache.key(pkg._render_cache_inputs()) in cache
 
     def create_package(self, upt_pkg, output):
         self.upt_pkg = upt_pkg
@@ -41,51 +166,112 @@ class MacPortsPackage(object):
     def _create_portfile(self, portfile_content):
         self.logger.info('Creating the Portfile')
         try:
-            with open(os.path.join(self.output_dir, 'Portfile'), 'x',
-                      encoding='utf-8') as f:
-                f.write(portfile_content)
+            written = write_file(os.path.join(self.output_dir, 'Portfile'),
+                                 portfile_content, overwrite=False)
         except FileExistsError:
             sys.exit(f'Cannot create {self.output_dir}/Portfile: already exists.') # noqa
+        if not written:
+            self.logger.info('The Portfile is already up to date')
+        return written
 
     def _render_makefile_template(self):
-        env = jinja2.Environment(
-            loader=jinja2.PackageLoader('upt_macports', 'templates'),
-            trim_blocks=True,
-            lstrip_blocks=True,
-            keep_trailing_newline=True,
-        )
-        env.filters['reqformat'] = self.jinja2_reqformat
-        template = env.get_template(self.template)
-        return template.render(pkg=self)
+        cache = render_cache()
+        if cache is None:
+            return self._render()
+        key = cache.key(self._render_cache_inputs())
+        portfile = cache.get(key)
+        if portfile is not None:
+            self.logger.info('Using the Portfile from the render cache')
+            return portfile
+        portfile = self._render()
+        if not self._render_cacheable:
+            return portfile
+        try:
+            cache.set(key, portfile)
+        except OSError as e:
+            self.logger.warning(f'Could not store the Portfile in the render '
+                                f'cache: {e}')
+        return portfile
+
+    def _render(self):
+        with stats.timer('render'):
+            template = _get_template(self.template)
+            return template.render(pkg=self,
+                                   dependencies=self._dependency_lists())
+
+    def _render_cache_inputs(self):
+        """Return everything the Portfile of the package depends on.
+
+        This is what the key of the Portfile in the render cache is computed
+        from, and it must be serializable as JSON. The archives are identified
+        by their URL, since the contents of released archives do not change.
+        """
+        upt_pkg = self.upt_pkg
+        return {
+            'version': RENDER_CACHE_VERSION,
+            'templates': templates_digest(),
+            'licenses': table_digest(),
+            'class': type(self).__name__,
+            'package': {
+                'name': upt_pkg.name,
+                'version': upt_pkg.version,
+                'frontend': upt_pkg.frontend,
+                'homepage': upt_pkg.homepage,
+                'summary': upt_pkg.summary,
+                'description': upt_pkg.description,
+                'licenses': [license.spdx_identifier
+                             for license in upt_pkg.licenses],
+                'requirements': {
+                    phase: [[req.name, req.specifier] for req in reqs]
+                    for phase, reqs in upt_pkg.requirements.items()
+                },
+                'archives': [[archive.url, archive.archive_type.name]
+                             for archive in upt_pkg.archives],
+            },
+        }
 
     @property
     def licenses(self):
-        relpath = 'spdx2macports.json'
-        filepath = pkg_resources.resource_filename(__name__, relpath)
-        with open(filepath) as f:
-            spdx2macports = json.loads(f.read())
-
         if not self.upt_pkg.licenses:
             self.logger.warning('No license found')
             return 'unknown  # no upstream license found'
+        with stats.timer('licenses'):
+            spdx2macports = map_licenses(
+                license.spdx_identifier for license in self.upt_pkg.licenses)
         licenses = []
         for license in self.upt_pkg.licenses:
-            try:
-                if license.spdx_identifier == 'unknown':
-                    warn = 'upt failed to detect license'
-                    port_license = f'unknown  # {warn}'
-                    self.logger.warning(warn)
-                else:
-                    port_license = spdx2macports[license.spdx_identifier]
-                    self.logger.info(f'Found license {port_license}')
-                licenses.append(port_license)
-            except KeyError:
+            if license.spdx_identifier == 'unknown':
+                warn = 'upt failed to detect license'
+                port_license = f'unknown  # {warn}'
+                self.logger.warning(warn)
+            elif spdx2macports[license.spdx_identifier] is not None:
+                port_license = spdx2macports[license.spdx_identifier]
+                self.logger.info(f'Found license {port_license}')
+            else:
                 err = f'MacPorts license unknown for {license.spdx_identifier}'
-                licenses.append(f'unknown  # {err}')
+                port_license = f'unknown  # {err}'
                 self.logger.error(err)
                 self.logger.info('Please report the error at https://github.com/macports/upt-macports') # noqa
+            licenses.append(port_license)
         return ' '.join(licenses)
 
+    def _dependency_lists(self):
+        """Return the dependencies of each depends_<kind> of the Portfile.
+
+        The result maps each kind of dependency_kinds to a list of
+        dependencies formatted using jinja2_reqformat(), without duplicates
+        (names are compared case-insensitively) and sorted by name.
+        """
+        dependencies = {}
+        for kind, phases in self.dependency_kinds.items():
+            requirements = {}
+            for phase in phases:
+                for req in self._depends(phase):
+                    requirements.setdefault(req.name.lower(), req)
+            dependencies[kind] = [self.jinja2_reqformat(requirements[name])
+                                  for name in sorted(requirements)]
+        return dependencies
+
     def _depends(self, phase):
         return self.upt_pkg.requirements.get(phase, [])
 
@@ -136,6 +322,7 @@ class MacPortsPythonPackage(MacPortsPackage):
     category = 'python'
 
     @staticmethod
+    @cached_translation
     def _normalized_macports_name(name):
         name = name.lower()
         return f'py-{name}'
@@ -146,12 +333,18 @@ class MacPortsPythonPackage(MacPortsPackage):
             return self.upt_pkg.name
 
     @staticmethod
+    @cached_translation
     def _normalized_macports_folder(name):
         name = name.lower()
         return f'py-{name}'
 
+    @staticmethod
+    @cached_translation
+    def _dependency_spec(name):
+        return f'py${{python.version}}-{name.lower()}'
+
     def jinja2_reqformat(self, req):
-        return f'py${{python.version}}-{req.name.lower()}'
+        return self._dependency_spec(req.name)
 
     @property
     def homepage(self):
@@ -166,18 +359,52 @@ class MacPortsPerlPackage(MacPortsPackage):
     template = 'perl.Portfile'
     archive_format = upt.ArchiveType.SOURCE_TARGZ
     category = 'perl'
+    dependency_kinds = {
+        'build': ('build', 'config'),
+        'lib': ('run',),
+        'test': ('test',),
+    }
 
     @staticmethod
+    @cached_translation
     def _normalized_macports_name(name):
         return name.replace('::', '-')
 
     @staticmethod
+    @cached_translation
     def _normalized_macports_folder(name):
         name = name.lower().replace('::', '-')
         return f'p5-{name}'
 
+    @staticmethod
+    @cached_translation
+    def _dependency_spec(name):
+        return f'p${{perl5.major}}-{MacPortsPerlPackage._normalized_macports_name(name).lower()}' # noqa
+
     def jinja2_reqformat(self, req):
-        return f'p${{perl5.major}}-{self._normalized_macports_name(req.name).lower()}' # noqa
+        return self._dependency_spec(req.name)
+
+    @staticmethod
+    def _cpan_dist(upt_pkg):
+        """Return the (module prefix, archive name) of UPT_PKG's dist file."""
+        archive_name = upt_pkg.archives[0].url.split('/')[-1]
+        part_name = upt_pkg.name.replace('::', '-').split('-')[0]
+        return part_name, archive_name
+
+    @classmethod
+    def probe_cpandirs(cls, upt_pkgs):
+        """Look for the dist files of UPT_PKGS concurrently.
+
+        This warms up the cache used by _cpandir(), so that packages can then
+        be rendered without waiting for the network.
+        """
+        try:
+            if cpan.packages_index() is not None:
+                return {}  # _cpandir() will not need the network
+        except OSError:
+            return {}  # _cpandir() will report the error for each package
+        return cpan.probe_dists(cls._cpan_dist(upt_pkg)
+                                for upt_pkg in upt_pkgs if upt_pkg.archives)
 
     def _cpandir(self):
         pkg = self.upt_pkg
@@ -186,23 +413,52 @@ class MacPortsPerlPackage(MacPortsPackage):
             self.logger.warning('No dist file was found')
             return ' # could not locate dist file'
 
-        # We start by checking at usual location
-        archive_name = pkg.archives[0].url.split('/')[-1]
-        part_name = pkg.name.replace('::', '-').split('-')[0]
-        check_url = f'https://cpan.metacpan.org/modules/by-module/{part_name}/{archive_name}' # noqa
-        r = requests.head(check_url)
-        if r.status_code == 200:
+        # We start by checking at usual location, using the local index of
+        # CPAN packages if there is one.
+        part_name, archive_name = self._cpan_dist(pkg)
+        try:
+            index = cpan.packages_index()
+        except OSError as e:
+            sys.exit(f'Could not read the index of CPAN packages: {e}')
+        if index is not None:
+            found = index.at_usual_location(part_name, archive_name)
+        else:
+            import requests
+            try:
+                with stats.timer('cpan.probe'):
+                    found = cpan.dist_at_usual_location(part_name,
+                                                        archive_name)
+            except requests.RequestException as e:
+                self.logger.warning(
+                    f'Could not reach {cpan.CPAN_MIRROR}: {e}')
+                found = False
+                # Do not remember the fallback location for good.
+                self._render_cacheable = False
+        if found:
             self.logger.info('Dist file found at usual location')
             return ''
         else:
             # Sometimes if it is not available,
             # then we fallback to alternate location
             # to be verified by the maintainer
-            fallback_dist = '/'.join(pkg.archives[0].url.split('id/')[1].split('/')[:-1]) # noqa
+            if index is not None and archive_name in index:
+                fallback_dist = index.author_path(archive_name)
+            else:
+                fallback_dist = '/'.join(pkg.archives[0].url.split('id/')[1].split('/')[:-1]) # noqa
             self.logger.info('Dist file was not found at usual location')
             self.logger.info('Using fallback location for dist file')
             return f' ../../authors/id/{fallback_dist}/'
 
+    def _render_cache_inputs(self):
+        # Where the dist file is depends on CPAN rather than on the package,
+        # but the dist files of released versions do not move: the key only
+        # depends on what _cpandir() looks for, so that the CPAN mirror is
+        # only asked when the Portfile is not in the cache.
+        inputs = super()._render_cache_inputs()
+        if self.upt_pkg.archives:
+            inputs['cpan_dist'] = list(self._cpan_dist(self.upt_pkg))
+        return inputs
+
     @property
     def homepage(self):
         homepage = self.upt_pkg.homepage
@@ -223,12 +479,18 @@ class MacPortsRubyPackage(MacPortsPackage):
         return name
 
     @staticmethod
+    @cached_translation
     def _normalized_macports_folder(name):
         name = name.lower()
         return f'rb-{name}'
 
+    @staticmethod
+    @cached_translation
+    def _dependency_spec(name):
+        return f'rb${{ruby.suffix}}-{name.lower()}'
+
     def jinja2_reqformat(self, req):
-        return f'rb${{ruby.suffix}}-{req.name.lower()}'
+        return self._dependency_spec(req.name)
 
     @property
     def homepage(self):
@@ -242,14 +504,49 @@ class MacPortsRubyPackage(MacPortsPackage):
 class MacPortsBackend(upt.Backend):
     def __init__(self):
         self.logger = logging.getLogger('upt')
+        self._port_versions = {}
+        # Requirements whose versions will likely be looked up soon, for
+        # each frontend.
+        self._pending_lookups = {}
+        # When set, port versions are read from this PortIndex file rather
+        # than by running "port info".
+        self.portindex_path = os.environ.get('UPT_MACPORTS_PORTINDEX')
+        self._portindex = None
+        # When set, port versions and Portfiles are looked for in this ports
+        # tree, using an index of its metadata.
+        self.ports_tree_path = os.environ.get('UPT_MACPORTS_PORTS_TREE')
+        self._ports_tree_index = None
+        self._dependency_graph = None
+        # The persistent version cache is opt-in.
+        self.use_version_cache = bool(
+            os.environ.get('UPT_MACPORTS_VERSION_CACHE'))
+        self.version_cache_ttl = self._version_cache_ttl()
+        self._version_cache = None
 
     name = 'macports'
+    default_prefix = '/opt/local'
+    # The maximum number of ports looked up by a single "port info" command
+    port_info_chunk_size = 500
     pkg_classes = {
         'pypi': MacPortsPythonPackage,
         'cpan': MacPortsPerlPackage,
         'rubygems': MacPortsRubyPackage,
     }
 
+    def _version_cache_ttl(self):
+        # upt instantiates every backend, so a malformed value must not make
+        # every command fail.
+        ttl = os.environ.get('UPT_MACPORTS_VERSION_CACHE_TTL')
+        if ttl is None:
+            return VersionCache.DEFAULT_TTL
+        try:
+            return float(ttl)
+        except ValueError:
+            self.logger.warning(
+                f'Invalid UPT_MACPORTS_VERSION_CACHE_TTL: {ttl!r}, using '
+                f'{VersionCache.DEFAULT_TTL} seconds instead')
+            return VersionCache.DEFAULT_TTL
+
     def create_package(self, upt_pkg, output=None):
         try:
             self.frontend = upt_pkg.frontend
@@ -258,38 +555,331 @@ class MacPortsBackend(upt.Backend):
             raise upt.UnhandledFrontendError(self.name, upt_pkg.frontend)
         packager = pkg_cls()
         packager.create_package(upt_pkg, output)
+        self._add_pending_lookups(upt_pkg)
 
-    def package_versions(self, name):
+    def _add_pending_lookups(self, upt_pkg):
+        self._pending_lookups.setdefault(upt_pkg.frontend, set()).update(
+            req.name
+            for requirements in upt_pkg.requirements.values()
+            for req in requirements)
+
+    def create_packages(self, upt_pkgs, output, max_workers=None,
+                        use_processes=True):
+        """Create the Portfiles of UPT_PKGS in OUTPUT, in parallel.
+
+        Rendering happens in a pool of MAX_WORKERS processes (or threads, if
+        USE_PROCESSES is False). If OUTPUT is None, the Portfiles are printed.
+        Return a BatchResult, whose keys are (frontend, name) tuples: a
+        failure only affects the package it happened for.
+        """
+        result = batch.BatchResult()
+        packages = []
+        for upt_pkg in upt_pkgs:
+            try:
+                pkg_cls = self.pkg_classes[upt_pkg.frontend]
+            except KeyError:
+                error = upt.UnhandledFrontendError(self.name, upt_pkg.frontend)
+                result.failed[(upt_pkg.frontend, upt_pkg.name)] = str(error)
+                continue
+            packages.append((pkg_cls, upt_pkg))
+            self.frontend = upt_pkg.frontend
+            self._add_pending_lookups(upt_pkg)
+
+        # Look for the dist files of all the Perl packages concurrently before
+        # rendering, unless their Portfile is in the render cache. Workers get
+        # the results for their package, since worker processes do not share
+        # the cache of the CPAN module.
+        dists = MacPortsPerlPackage.probe_cpandirs(
+            upt_pkg for pkg_cls, upt_pkg in packages
+            if issubclass(pkg_cls, MacPortsPerlPackage) and
+            not pkg_cls.in_render_cache(upt_pkg))
+        jobs = []
+        for pkg_cls, upt_pkg in packages:
+            known_dists = {}
+            if issubclass(pkg_cls, MacPortsPerlPackage) and upt_pkg.archives:
+                dist = pkg_cls._cpan_dist(upt_pkg)
+                if dist in dists:
+                    known_dists[dist] = dists[dist]
+            jobs.append((pkg_cls, upt_pkg, known_dists))
+
+        jobs_result = batch.create_packages(jobs, output, max_workers,
+                                            use_processes)
+        result.succeeded.update(jobs_result.succeeded)
+        result.failed.update(jobs_result.failed)
+        self.logger.info(f'Created packages: {result.summary()}')
+        return result
+
+    def _port_name(self, name):
         try:
-            port_name = self.pkg_classes[
-                self.frontend]._normalized_macports_folder(name)
+            pkg_class = self.pkg_classes[self.frontend]
         except KeyError:
-            raise upt.UnhandledFrontendError(self.name, self.upt_pkg.frontend)
-
-        self.logger.info(f'Checking MacPorts tree for port {port_name}')
-        cmd = f'port info --version {port_name}'
-        port = subprocess.getoutput(cmd)
-        if port.startswith('Error'):
-            self.logger.info(f'{port_name} not found in MacPorts tree')
-            return []
-        elif port.startswith('version'):
-            curr_ver = port.split()[1]
-            self.logger.info(
-                f'Current MacPorts Version for {port_name} is {curr_ver}')
-            return [curr_ver]
-        elif port.startswith('Warning'):
-            self.logger.warning(
-                'port definitions are more than two weeks old, '
-                'consider updating them by running \'port selfupdate\'.')
-            curr_ver = port.split('version: ')[1]
-            self.logger.info(
-                f'Current MacPorts Version for {port_name} is {curr_ver}')
-            return [curr_ver]
+            raise upt.UnhandledFrontendError(self.name, self.frontend)
+        return pkg_class._normalized_macports_folder(name)
+
+    def package_versions(self, name):
+        # The requirements of the packages we created are likely to be looked
+        # up next, so let's ask MacPorts about all of them at once.
+        pending = self._pending_lookups.pop(self.frontend, ())
+        names = [name] + [other for other in pending if other != name]
+        return self.package_versions_many(names)[name]
+
+    def package_versions_many(self, names):
+        """Return a dict mapping each of NAMES to its versions in MacPorts.
+
+        All the ports that have not been looked up yet are queried using a
+        single "port info" command.
+        """
+        port_names = {name: self._port_name(name) for name in names}
+        missing = sorted(set(port_names.values()) - set(self._port_versions))
+        if missing and self.version_cache is not None:
+            cached = self.version_cache.get_many(missing)
+            self._port_versions.update(cached)
+            missing = [port_name for port_name in missing
+                       if port_name not in cached]
+            stats = self.version_cache.stats()
+            self.logger.info(f'Version cache: {stats["hits"]} hit(s), '
+                             f'{stats["misses"]} miss(es)')
+        if missing:
+            if self.ports_tree_path:
+                versions = self._ports_tree_versions(missing)
+            elif self.portindex_path:
+                versions = self._portindex_versions(missing)
+            else:
+                versions = self._port_info_versions(missing)
+            self._port_versions.update(versions)
+            if self.version_cache is not None:
+                self.version_cache.set_many(versions)
+        return {name: self._port_versions[port_name]
+                for name, port_name in port_names.items()}
+
+    @property
+    def portindex(self):
+        if self._portindex is None:
+            self.logger.info(f'Reading PortIndex {self.portindex_path}')
+            try:
+                with stats.timer('portindex'):
+                    self._portindex = PortIndex(self.portindex_path)
+            except (OSError, ValueError) as e:
+                sys.exit(f'Could not read PortIndex: {e}')
+        return self._portindex
+
+    @property
+    def ports_tree_index(self):
+        if self._ports_tree_index is None:
+            index = PortsTreeIndex(self.ports_tree_path)
+            try:
+                with stats.timer('ports_tree_index'):
+                    parsed = index.refresh()
+            except OSError as e:
+                sys.exit(f'Could not index the ports tree: {e}')
+            self.logger.info(f'Indexed {self.ports_tree_path}: parsed '
+                             f'{parsed} out of {len(index)} Portfiles')
+            if parsed:
+                try:
+                    index.save()
+                except OSError as e:
+                    self.logger.warning(f'Could not save the index: {e}')
+            self._ports_tree_index = index
+        return self._ports_tree_index
+
+    def _ports_tree_versions(self, port_names):
+        """Return a dict mapping each of PORT_NAMES to its versions.
+
+        Ports that are not in the ports tree are looked up in the PortIndex,
+        if there is one. "port info" is never run, since ports trees are
+        mostly used on hosts without MacPorts.
+        """
+        versions = {}
+        missing = []
+        for port_name in port_names:
+            version = self.ports_tree_index.version(port_name)
+            if version is None:
+                self.logger.info(f'{port_name} not found in ports tree')
+                missing.append(port_name)
+            else:
+                self.logger.info(
+                    f'Current MacPorts Version for {port_name} is {version}')
+                versions[port_name] = [version]
+        if missing and self.portindex_path:
+            versions.update(self._portindex_versions(missing))
         else:
+            versions.update((port_name, []) for port_name in missing)
+        return versions
+
+    @property
+    def dependency_graph(self):
+        """The DependencyGraph of the ports, or None.
+
+        The graph is built once per run, from the ports tree or the PortIndex
+        ports are read from. When both are used, the PortIndex provides the
+        ports that are not in the ports tree, just like it does in
+        _ports_tree_versions(). Otherwise, the graph is built from the
+        PortIndex files of the port sources of MacPorts, which are what "port
+        info" reads. There is no graph if none of these files can be read.
+        """
+        if self._dependency_graph is None:
+            if self.ports_tree_path:
+                self._dependency_graph = DependencyGraph.from_ports_tree_index(
+                    self.ports_tree_index)
+                if self.portindex_path:
+                    self._dependency_graph.add_portindex(self.portindex)
+            elif self.portindex_path:
+                self._dependency_graph = DependencyGraph.from_portindex(
+                    self.portindex)
+            else:
+                self._dependency_graph = self._source_dependency_graph()
+            if self._dependency_graph is not None:
+                self.logger.info('Built the dependency graph of '
+                                 f'{len(self._dependency_graph)} ports')
+        return self._dependency_graph
+
+    def _source_dependency_graph(self):
+        """Return the DependencyGraph of the port sources of MacPorts, or None.
+
+        Sources come in the order of sources.conf, so the first source that
+        has a port provides it, just like in MacPorts.
+        """
+        graph = None
+        for path in source_portindexes(self._macports_prefix()):
+            if not os.path.exists(path):
+                continue
+            try:
+                with stats.timer('portindex'):
+                    portindex = PortIndex(path)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f'Could not read PortIndex: {e}')
+                continue
+            if graph is None:
+                graph = DependencyGraph()
+            graph.add_portindex(portindex)
+            portindex.close()
+        return graph
+
+    @property
+    def version_cache(self):
+        # The index of a ports tree is already persistent, and kept up to
+        # date with the tree: versions read from it are not cached.
+        if (self._version_cache is None and self.use_version_cache and
+                not self.ports_tree_path):
+            # Cached versions are no longer valid once the PortIndex has been
+            # updated, be it by "port sync" or by hand, and versions read
+            # from different PortIndex files are kept apart.
+            fingerprint = self._portindex_fingerprint()
+            if fingerprint is None:
+                self.logger.warning('Cannot use the version cache: no '
+                                    'PortIndex found to detect updates of the '
+                                    'ports')
+                self.use_version_cache = False
+                return None
+            path = user_cache_dir('versions.sqlite')
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._version_cache = VersionCache(
+                    path, fingerprint, self.version_cache_ttl)
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning(f'Cannot use the version cache: {e}')
+                self.use_version_cache = False
+        return self._version_cache
+
+    def _macports_prefix(self):
+        """Return the prefix of the MacPorts installation "port" is from."""
+        port = shutil.which('port')
+        if port is None:
+            return self.default_prefix
+        return os.path.dirname(os.path.dirname(os.path.realpath(port)))
+
+    def _portindex_fingerprint(self):
+        """Return the fingerprint of the PortIndex files versions come from.
+
+        Return None if there is no such file.
+        """
+        if self.portindex_path:
+            portindexes = [self.portindex_path]
+        else:
+            portindexes = source_portindexes(self._macports_prefix())
+        fingerprints = []
+        for portindex in portindexes:
+            fingerprint = file_fingerprint(portindex)
+            if fingerprint is not None:
+                fingerprints.append(
+                    f'{os.path.abspath(portindex)}:{fingerprint}')
+        return ' '.join(fingerprints) or None
+
+    def _portindex_versions(self, port_names):
+        versions = {}
+        for port_name in port_names:
+            version = self.portindex.version(port_name)
+            if version is None:
+                self.logger.info(f'{port_name} not found in PortIndex')
+                versions[port_name] = []
+            else:
+                self.logger.info(
+                    f'Current MacPorts Version for {port_name} is {version}')
+                versions[port_name] = [version]
+        return versions
+
+    def _port_info_versions(self, port_names):
+        """Return a dict mapping each of PORT_NAMES to its versions.
+
+        Ports are looked up using as few "port info" commands as possible,
+        each of them looking up at most port_info_chunk_size ports, so that
+        command lines do not get too long.
+        """
+        versions = {}
+        size = self.port_info_chunk_size
+        for i in range(0, len(port_names), size):
+            versions.update(self._port_info_chunk(port_names[i:i+size]))
+        return versions
+
+    def _port_info_chunk(self, port_names):
+        """Return a dict mapping each of PORT_NAMES to its versions.
+
+        The output of "port info" looks like this:
+
+            name: py-foo
+            version: 1.2.3
+            --
+            Error: Port py-bar not found
+        """
+        self.logger.info('Checking MacPorts tree for port(s) '
+                         f'{", ".join(port_names)}')
+        cmd = 'port -p info --name --version ' + ' '.join(
+            shlex.quote(port_name) for port_name in port_names)
+        stats.count('port_info.ports', len(port_names))
+        with stats.timer('port_info'):
+            output = subprocess.getoutput(cmd)
+
+        versions = {port_name: [] for port_name in port_names}
+        current_port = port_names[0] if len(port_names) == 1 else None
+        recognized = False
+        for line in output.splitlines():
+            if line.startswith('Error'):
+                recognized = True
+            elif line.startswith('Warning'):
+                recognized = True
+                self.logger.warning(
+                    'port definitions are more than two weeks old, '
+                    'consider updating them by running \'port selfupdate\'.')
+            elif line.startswith('name: '):
+                current_port = line.split(': ', 1)[1].strip().lower()
+            elif line.startswith('version: '):
+                recognized = True
+                if current_port in versions:
+                    versions[current_port] = [line.split()[1]]
+
+        if not recognized:
             sys.exit(f'The command "{cmd}" failed. '
                      'Please make sure you have MacPorts installed '
                      'and/or your PATH is set-up correctly.')
 
+        for port_name, port_versions in versions.items():
+            if port_versions:
+                self.logger.info(f'Current MacPorts Version for {port_name} '
+                                 f'is {port_versions[0]}')
+            else:
+                self.logger.info(f'{port_name} not found in MacPorts tree')
+        return versions
+
     @staticmethod
     def standardize_CPAN_version(version):
         """Parse CPAN version and return a normalized, dotted-decimal form.
@@ -300,34 +890,41 @@ class MacPortsBackend(upt.Backend):
           perl -Mversion -e 'print version->parse("<VERSION>")->normal'
         with the exception of version numbers that do not contain a "dot".
 
+        Results are memoized, since the same requirements show up again and
+        again during a recursive run.
         """
-        version_strip = version.lstrip('v')
-        version_split = version_strip.split('.')
-
-        # no or more than 1 'dots': no conversion required
-        if len(version_split) != 2:
-            return version_strip
+        return _standardize_CPAN_version(version)
 
-        # conversion required
-        std_version = version_split[0]
-        fractional = version_split[1]
-
-        index = 0
-        while index < len(fractional) or index < 6:
-            sub = fractional[index:index+3]
-            if len(sub) < 3:
-                sub += '0'*(3-len(sub))
-            std_version += '.' + str(int(sub))
-            index += 3
+    @staticmethod
+    def standardize_CPAN_versions(versions):
+        """Return the list of the normalized forms of VERSIONS.
 
-        return std_version
+        See standardize_CPAN_version(). Each distinct version is only
+        converted once.
+        """
+        converted = {version: _standardize_CPAN_version(version)
+                     for version in set(versions)}
+        return [converted[version] for version in versions]
 
     def needs_requirement(self, req, phase):
         if self.frontend == 'cpan' and req.specifier:
-            s = SpecifierSet(req.specifier)
-            req.specifier = ', '.join(
-                [dep.operator +
-                 self.standardize_CPAN_version(dep.version) for dep in s])
+            req.specifier = _standardize_CPAN_specifier(req.specifier)
+
+        # The dependency graph tells us whether the port exists without
+        # looking up its versions: if it does not, the whole subtree of
+        # requirements has to be packaged, and if it does and any version
+        # will do, the whole subtree can be skipped.
+        graph = self.dependency_graph
+        if graph is not None:
+            if self._port_name(req.name) not in graph:
+                self.logger.info(f'Dependency {req}: currently not packaged. '
+                                 'Packaging it.')
+                return True
+            if not req.specifier:
+                self.logger.info(f'Dependency {req}: currently packaged, no '
+                                 'specific version is required. Not '
+                                 'packaging it.')
+                return False
 
         return super().needs_requirement(req, phase)
 
@@ -344,7 +941,13 @@ the port name
             self.logger.error(f'Could not get current version for {pkgname}')
             return super().current_version(frontend, pkgname, output=output)
 
-    def update_package(self, pdiff, output=None):
+    def update_package(self, pdiff, output=None, dry_run=False):
+        """Update the Portfile of PDIFF.new.
+
+        Return whether the Portfile was modified. If DRY_RUN is True, the
+        Portfile is left untouched, and a unified diff of the changes is
+        returned instead (an empty string if there are none).
+        """
         pkg_class = self.pkg_classes[self.frontend]
         macports_pkg = pkg_class()
 
@@ -356,8 +959,102 @@ the port name
             folder_name = macports_pkg._normalized_macports_folder(pkgname)
             output_dir = os.path.join(macports_pkg.category, folder_name)
             portfile_path = f'{output_dir}/Portfile'
+            if self.ports_tree_path:
+                portfile_path = (
+                    self.ports_tree_index.portfile_path(folder_name) or
+                    os.path.join(self.ports_tree_path, portfile_path))
         else:
             portfile_path = output
 
-        with open(portfile_path, 'r+') as f:
-            PortfileUpdater(f, pdiff, pkg_class).update()
+        with open(portfile_path, encoding='utf-8') as f:
+            updater = PortfileUpdater(f, pdiff, pkg_class)
+            if dry_run:
+                if output is None and self.ports_tree_path:
+                    portfile_path = os.path.relpath(portfile_path,
+                                                    self.ports_tree_path)
+                return updater.diff(portfile_path)
+            updated = updater.update()
+        if not updated:
+            self.logger.info(f'{portfile_path} is already up to date')
+        return updated
+
+    def update_packages(self, pdiffs, ports_tree='.', max_workers=None,
+                        ordered=False, dry_run=False):
+        """Update the Portfiles of many packages in PORTS_TREE.
+
+        PDIFFS is an iterable of upt.PackageDiff objects. The Portfile of each
+        package is looked for in its usual category first, then in the whole
+        tree. At most MAX_WORKERS Portfiles are updated at the same time.
+        If ORDERED is True, the Portfile of a package is only updated after
+        those of its build and lib dependencies, and not at all if one of them
+        could not be updated. If DRY_RUN is True, no Portfile is modified,
+        and the DIFFS attribute of the report maps the packages whose Portfile
+        would change to a unified diff of the changes. Return an UpdateReport,
+        in which packages are identified by (frontend, name) tuples.
+        """
+        report = batch.UpdateReport()
+        tree = PortsTree(ports_tree)
+        jobs = []
+        for pdiff in pdiffs:
+            name = pdiff.new.name
+            key = (pdiff.new.frontend, name)
+            try:
+                pkg_class = self.pkg_classes[pdiff.new.frontend]
+            except KeyError:
+                error = upt.UnhandledFrontendError(self.name,
+                                                   pdiff.new.frontend)
+                report.failed[key] = str(error)
+                continue
+            folder_name = pkg_class._normalized_macports_folder(name)
+            portfile_path = tree.portfile_path(pkg_class.category,
+                                               folder_name)
+            if portfile_path is None:
+                report.failed[key] = f'No Portfile found for {folder_name}'
+                continue
+            jobs.append((pkg_class, pdiff, portfile_path))
+
+        if dry_run:
+            # Nothing is written, so the order does not matter.
+            batch.update_portfiles(jobs, max_workers, report, dry_run=True,
+                                   root=ports_tree)
+        elif ordered:
+            batch.update_portfiles_in_order(
+                jobs, self._batch_dependencies(jobs), max_workers, report)
+        else:
+            batch.update_portfiles(jobs, max_workers, report)
+        self.logger.info(f'Updated packages: {report.summary()}')
+        return report
+
+    def _batch_dependencies(self, jobs):
+        """Return the build and lib dependencies between the packages of JOBS.
+
+        Dependencies are read from the new requirements of the packages, for
+        the phases that end up in the depends_build and depends_lib statements
+        of their Portfiles, and from the dependency graph of the ports, if
+        there is one. Packages are identified by (frontend, name) tuples.
+        """
+        # Ports are identified by their folder, which includes the prefix of
+        # the frontend (py-, rb-, p5-...), so packages of different frontends
+        # do not clash.
+        folders = {}
+        for pkg_class, pdiff, _ in jobs:
+            folder = pkg_class._normalized_macports_folder(pdiff.new.name)
+            folders[folder.lower()] = (pdiff.new.frontend, pdiff.new.name)
+
+        graph = self.dependency_graph
+        dependencies = {}
+        for pkg_class, pdiff, _ in jobs:
+            phases = (pkg_class.dependency_kinds['build'] +
+                      pkg_class.dependency_kinds['lib'])
+            deps = {
+                pkg_class._normalized_macports_folder(req.name).lower()
+                for phase in phases
+                for req in pdiff.new.requirements.get(phase, [])
+            }
+            if graph is not None:
+                folder = pkg_class._normalized_macports_folder(pdiff.new.name)
+                deps |= graph.dependencies(folder, ['build', 'lib'])
+            key = (pdiff.new.frontend, pdiff.new.name)
+            dependencies[key] = {folders[dep] for dep in deps
+                                 if dep in folders}
+        return dependencies